@@ -207,7 +207,7 @@ class BuildResource(ModelResource):
     class Meta:
         always_return_data = True
         include_absolute_url = True
-        allowed_methods = ['get', 'post', 'put']
+        allowed_methods = ['get', 'post', 'put', 'patch']
         queryset = Build.objects.api()
         authentication = PostAuthentication()
         authorization = DjangoAuthorization()
@@ -269,10 +269,9 @@ class FileResource(ModelResource, SearchMixin):
         self.throttle_check(request)
 
         query = request.GET.get('q', '')
-        redis_data = djangome.r.keys("*redirects:v4*%s*" % query)
-        #-2 because http:
-        urls = [''.join(data.split(':')[6:]) for data in redis_data
-                if 'http://' in data]
+        urls = []
+        if query:
+            urls = djangome.search_anchors(query)
         object_list = {'objects': urls}
 
         self.log_throttled_access(request)
@@ -4,15 +4,19 @@ import os.path
 from django.core.urlresolvers import reverse
 from django.conf import settings
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _, ugettext
 
 from guardian.shortcuts import assign
 from taggit.managers import TaggableManager
 
 from builds.constants import LATEST
+from core.resolver import invalidate_availability, invalidate_project
 from privacy.loader import VersionManager, RelatedProjectManager
 from projects.models import Project
 from projects import constants
+from projects.utils import get_downloads_manifest, version_sort_key
 from .constants import BUILD_STATE, BUILD_TYPES, VERSION_TYPES
 
 
@@ -42,10 +46,14 @@ class Version(models.Model):
     )
     tags = TaggableManager(blank=True)
     machine = models.BooleanField(_('Machine Created'), default=False)
+    # Sorts like the version, see projects.utils.version_sort_key
+    sort_key = models.CharField(_('Sort key'), max_length=255, blank=True,
+                                default='')
     objects = VersionManager()
 
     class Meta:
         unique_together = [('project', 'slug')]
+        index_together = [('project', 'sort_key')]
         ordering = ['-verbose_name']
         permissions = (
             # Translators: Permission around whether a user can view the
@@ -72,7 +80,10 @@ class Version(models.Model):
         """
         Add permissions to the Version for all owners on save.
         """
+        self.sort_key = version_sort_key(self.slug)
         obj = super(Version, self).save(*args, **kwargs)
+        invalidate_project(self.project.slug)
+        invalidate_availability(self.project)
         for owner in self.project.users.all():
             assign('view_version', owner, self)
         self.project.sync_supported_versions()
@@ -120,20 +131,21 @@ class Version(models.Model):
 
     def get_downloads(self, pretty=False):
         project = self.project
+        manifest = get_downloads_manifest(project, self.slug)
         data = {}
         if pretty:
-            if project.has_pdf(self.slug):
+            if 'pdf' in manifest:
                 data['PDF'] = project.get_production_media_url('pdf', self.slug)
-            if project.has_htmlzip(self.slug):
+            if 'htmlzip' in manifest:
                 data['HTML'] = project.get_production_media_url('htmlzip', self.slug)
-            if project.has_epub(self.slug):
+            if 'epub' in manifest:
                 data['Epub'] = project.get_production_media_url('epub', self.slug)
         else:
-            if project.has_pdf(self.slug):
+            if 'pdf' in manifest:
                 data['pdf'] = project.get_production_media_url('pdf', self.slug)
-            if project.has_htmlzip(self.slug):
+            if 'htmlzip' in manifest:
                 data['htmlzip'] = project.get_production_media_url('htmlzip', self.slug)
-            if project.has_epub(self.slug):
+            if 'epub' in manifest:
                 data['epub'] = project.get_production_media_url('epub', self.slug)
         return data
 
@@ -229,6 +241,17 @@ class Version(models.Model):
         )
 
 
+@receiver(post_delete, sender=Version)
+def invalidate_deleted_version(sender, instance, **kwargs):
+    try:
+        project = instance.project
+    except Project.DoesNotExist:
+        # Deleted along with its project, which invalidates itself
+        return
+    invalidate_project(project.slug)
+    invalidate_availability(project)
+
+
 class VersionAlias(models.Model):
     project = models.ForeignKey(Project, verbose_name=_('Project'),
                                 related_name='aliases')
@@ -270,6 +293,8 @@ class Build(models.Model):
 
     builder = models.CharField(_('Builder'), max_length=255, null=True, blank=True)
 
+    fingerprint = models.CharField(_('Fingerprint'), max_length=40, null=True, blank=True)
+
     # Manager
 
     objects = RelatedProjectManager()
@@ -0,0 +1,181 @@
+"""Build queue of each version.
+
+A version has at most one scheduled build running and one pending. The
+state is stored in the ``build_queue:v1:<version pk>`` hash in Redis:
+
+``running``
+    The build pk of the build that is running, 0 for unrecorded builds.
+
+``started``
+    When the running build was started, as a timestamp.
+
+``pending``
+    The ``update_docs`` arguments of the next build, as JSON.
+
+Triggering a version that has a pending build coalesces the trigger into
+the pending build, which checks out the newest commit once it runs. When a
+scheduled build finishes, it starts the pending build right away.
+
+A running build is considered lost ``BUILD_QUEUE_TIMEOUT`` seconds after it
+started, so a build server that dies mid build doesn't block the version for
+good: the next trigger starts the pending build. If Redis can't be reached,
+builds are started right away, like before.
+
+"""
+
+import json
+import logging
+import time
+
+from django.conf import settings
+import redis
+from redis.exceptions import WatchError
+
+from builds.models import Build
+from core.utils import redis_client
+
+log = logging.getLogger(__name__)
+
+BUILD_QUEUE_KEY = 'build_queue:v1:%s'
+BUILD_QUEUE_TIMEOUT = getattr(settings, 'BUILD_QUEUE_TIMEOUT', 2 * 60 * 60)
+
+
+def schedule_build(project, version, record=True, force=False, basic=False):
+    """
+    Start a build of ``version``, or queue it after the running build.
+
+    Returns the ``Build`` that will run, which is the pending build when the
+    trigger was coalesced, or ``None`` if the build isn't recorded.
+    """
+    # Avoid circular import
+    from projects.tasks import update_docs
+
+    try:
+        build, kwargs, start = _schedule(project, version, record, force, basic)
+    except redis.RedisError:
+        log.warning('Build queue unavailable, starting build of %s' % version,
+                    exc_info=True)
+        build = _create_build(project, version) if record else None
+        kwargs = _build_kwargs(project, version, build, record, force, basic)
+        start = True
+    else:
+        kwargs['queued'] = True
+    if start:
+        update_docs.delay(**kwargs)
+    return build
+
+
+def _schedule(project, version, record, force, basic):
+    key = BUILD_QUEUE_KEY % version.pk
+    build = None
+    with redis_client().pipeline() as pipe:
+        while True:
+            try:
+                pipe.watch(key)
+                running, started, pending = pipe.hmget(
+                    key, 'running', 'started', 'pending')
+                if running is not None and _is_stale(started):
+                    log.warning('Build %s of %s is stale, starting the next '
+                                'build' % (running, version))
+                    running = None
+                if pending is not None:
+                    kwargs = json.loads(pending)
+                    kwargs['force'] = kwargs['force'] or force
+                    kwargs['basic'] = kwargs['basic'] and basic
+                    pipe.multi()
+                    if running is None:
+                        _set_running(pipe, key, kwargs)
+                        pipe.hdel(key, 'pending')
+                    else:
+                        pipe.hset(key, 'pending', json.dumps(kwargs))
+                    pipe.execute()
+                    if build is not None:
+                        # Created before another trigger queued its build
+                        build.delete()
+                    log.info('Coalesced build of %s into pending build %s'
+                             % (version, kwargs['build_pk']))
+                    pending_builds = Build.objects.filter(pk=kwargs['build_pk'])
+                    return pending_builds.first(), kwargs, running is None
+                if build is None and record:
+                    build = _create_build(project, version)
+                kwargs = _build_kwargs(project, version, build, record,
+                                       force, basic)
+                pipe.multi()
+                if running is None:
+                    _set_running(pipe, key, kwargs)
+                else:
+                    pipe.hset(key, 'pending', json.dumps(kwargs))
+                pipe.execute()
+                return build, kwargs, running is None
+            except WatchError:
+                continue
+
+
+def release_build(version_pk, build_pk=None):
+    """
+    Mark the scheduled build ``build_pk`` of the version ``version_pk`` as
+    finished, and start its pending build.
+
+    Nothing is released if the build was replaced after it went stale.
+    """
+    # Avoid circular import
+    from projects.tasks import update_docs
+
+    key = BUILD_QUEUE_KEY % version_pk
+    try:
+        with redis_client().pipeline() as pipe:
+            while True:
+                try:
+                    pipe.watch(key)
+                    running, pending = pipe.hmget(key, 'running', 'pending')
+                    if running != str(build_pk or 0):
+                        pipe.reset()
+                        return
+                    pipe.multi()
+                    if pending is None:
+                        pipe.delete(key)
+                    else:
+                        kwargs = json.loads(pending)
+                        _set_running(pipe, key, kwargs)
+                        pipe.hdel(key, 'pending')
+                    pipe.execute()
+                    break
+                except WatchError:
+                    continue
+    except redis.RedisError:
+        log.error('Failed to release build queue of version %s' % version_pk,
+                  exc_info=True)
+        return
+    if pending is not None:
+        kwargs['queued'] = True
+        update_docs.delay(**kwargs)
+
+
+def _set_running(pipe, key, kwargs):
+    pipe.hset(key, 'running', kwargs['build_pk'] or 0)
+    pipe.hset(key, 'started', time.time())
+
+
+def _is_stale(started):
+    return started is None or float(started) < time.time() - BUILD_QUEUE_TIMEOUT
+
+
+def _create_build(project, version):
+    return Build.objects.create(
+        project=project,
+        version=version,
+        type='html',
+        state='triggered',
+        success=True,
+    )
+
+
+def _build_kwargs(project, version, build, record, force, basic):
+    return {
+        'pk': project.pk,
+        'version_pk': version.pk,
+        'build_pk': build.pk if build else None,
+        'record': record,
+        'force': force,
+        'basic': basic,
+    }
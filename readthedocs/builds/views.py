@@ -1,12 +1,12 @@
 from django.shortcuts import get_object_or_404
 from django.views.generic import ListView, DetailView
-from django.conf import settings
 
 from builds.models import Build, Version
 from builds.filters import BuildFilter
+from core.utils import redis_client
 from projects.models import Project
 
-from redis import Redis, ConnectionError
+from redis import ConnectionError
 
 
 class BuildList(ListView):
@@ -35,8 +35,7 @@ class BuildList(ListView):
         context['versions'] = Version.objects.public(user=self.request.user, project=self.project)
 
         try:
-            redis = Redis(**settings.REDIS)
-            context['queue_length'] = redis.llen('celery')
+            context['queue_length'] = redis_client().llen('celery')
         except ConnectionError:
             context['queue_length'] = None
 
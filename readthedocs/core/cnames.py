@@ -0,0 +1,185 @@
+"""Cached resolution of custom domains to project slugs.
+
+A custom domain is a CNAME to ``<slug>.readthedocs.org``. The slug of a
+host is resolved in DNS once, then cached in the shared Django cache and in
+a local LRU of each web process. Hosts without a CNAME are cached as well,
+for ``CNAME_MISSING_TIMEOUT``, so bad hosts don't hit DNS on every request.
+Lookups that fail for other reasons, like a DNS timeout, aren't cached.
+
+Resolved hosts are added to the ``rtd_slug:v1:<slug>`` set of their project
+in Redis. A background thread resolves the hosts of these sets again every
+``CNAME_REFRESH_INTERVAL`` seconds and refreshes the shared cache, so known
+domains are rarely resolved on the request path. Hosts that no longer have a
+CNAME are dropped from the sets, their cached slug expires on its own. Only
+one process of the cluster refreshes in each interval.
+
+"""
+
+import logging
+import socket
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+import redis
+
+from core.resolver import LocalCache, MISSING
+from core.utils import cname_to_slug, redis_client
+
+try:
+    from dns.resolver import NXDOMAIN, NoAnswer
+    # Errors that mean the host has no CNAME, others may be temporary
+    NO_CNAME_ERRORS = (NXDOMAIN, NoAnswer)
+except ImportError:
+    NO_CNAME_ERRORS = ()
+
+log = logging.getLogger(__name__)
+
+CNAME_CACHE_KEY = 'cname:v2:%s'
+CNAME_SLUG_KEY = 'rtd_slug:v1:%s'
+CNAME_REFRESH_LOCK_KEY = 'rtd_cname_refresh:v1'
+CNAME_CACHE_TIMEOUT = getattr(settings, 'CNAME_CACHE_TIMEOUT', 60 * 60)
+CNAME_MISSING_TIMEOUT = getattr(settings, 'CNAME_MISSING_TIMEOUT', 5 * 60)
+CNAME_LOCAL_CACHE_SIZE = getattr(settings, 'CNAME_LOCAL_CACHE_SIZE', 10000)
+CNAME_LOCAL_CACHE_SECONDS = getattr(settings, 'CNAME_LOCAL_CACHE_SECONDS', 60)
+# Set to 0 to disable the background refresher
+CNAME_REFRESH_INTERVAL = getattr(settings, 'CNAME_REFRESH_INTERVAL', 30 * 60)
+
+local_cache = LocalCache(CNAME_LOCAL_CACHE_SIZE, CNAME_LOCAL_CACHE_SECONDS)
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def get_cname_slug(host):
+    """
+    Return the slug of the project ``host`` is a CNAME to, or ``None``.
+    """
+    key = CNAME_CACHE_KEY % host.lower()
+    slug = local_cache.get(key)
+    if slug is None:
+        slug = cache.get(key)
+        if slug is None:
+            slug = resolve_cname(host)
+        if slug is not None:
+            local_cache.set(key, slug)
+    start_refresher()
+    if slug == MISSING:
+        return None
+    return slug
+
+
+def lookup_cname(host):
+    """
+    Resolve ``host`` in DNS, without caching.
+
+    Returns the slug, ``MISSING`` if the host has no CNAME, or ``None`` if the
+    lookup failed.
+    """
+    try:
+        slug = cname_to_slug(host)
+    except NO_CNAME_ERRORS:
+        return MISSING
+    except Exception:
+        log.warning('CNAME lookup failed for %s' % host, exc_info=True)
+        return None
+    return slug or MISSING
+
+
+def resolve_cname(host):
+    """
+    Resolve ``host`` in DNS and cache its slug.
+
+    Returns the slug, ``MISSING`` if the host has no CNAME, or ``None`` if the
+    lookup failed.
+    """
+    slug = lookup_cname(host)
+    if slug == MISSING:
+        cache.set(CNAME_CACHE_KEY % host.lower(), MISSING, CNAME_MISSING_TIMEOUT)
+    elif slug is not None:
+        cache_cname(host, slug)
+    return slug
+
+
+def cache_cname(host, slug):
+    """
+    Cache ``slug`` as the project of ``host``.
+    """
+    cache.set(CNAME_CACHE_KEY % host.lower(), slug, CNAME_CACHE_TIMEOUT)
+    try:
+        # Cache the slug -> host mapping permanently.
+        redis_client().sadd(CNAME_SLUG_KEY % slug, host)
+    except redis.RedisError:
+        log.warning('Failed to store CNAME %s->%s, Redis error.' % (slug, host),
+                    exc_info=True)
+
+
+def refresh_cnames():
+    """
+    Resolve the hosts of every ``rtd_slug:v1:*`` set again.
+
+    Hosts that now point to another project are moved to its set, hosts
+    without a CNAME are removed. Hosts whose lookup failed are kept, with
+    their cached slug, in case the failure is temporary.
+
+    Returns the number of hosts refreshed.
+    """
+    conn = redis_client()
+    pattern = CNAME_SLUG_KEY % '*'
+    prefix = CNAME_SLUG_KEY % ''
+    scan = getattr(conn, 'scan_iter', None)
+    keys = scan(match=pattern) if scan else conn.keys(pattern)
+    refreshed = 0
+    for key in keys:
+        old_slug = key[len(prefix):]
+        for host in conn.smembers(key):
+            slug = lookup_cname(host)
+            if slug is None:
+                continue
+            if slug == MISSING:
+                conn.srem(key, host)
+                continue
+            cache_cname(host, slug)
+            local_cache.delete(CNAME_CACHE_KEY % host.lower())
+            if slug != old_slug:
+                conn.srem(key, host)
+            refreshed += 1
+    return refreshed
+
+
+def start_refresher():
+    """
+    Start the background refresher of this process, if it isn't running.
+    """
+    global _refresher
+    if not CNAME_REFRESH_INTERVAL or _refresher is not None:
+        return
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = threading.Thread(target=_refresh_loop,
+                                          name='cname-refresher')
+            _refresher.daemon = True
+            _refresher.start()
+
+
+def _refresh_loop():
+    while True:
+        time.sleep(CNAME_REFRESH_INTERVAL)
+        try:
+            _refresh()
+        except Exception:
+            log.error('CNAME refresh failed', exc_info=True)
+
+
+def _refresh():
+    # SET NX EX in one command, so the lock can't be left without a timeout.
+    # Our redis-py doesn't take the nx and ex arguments of ``set``.
+    locked = redis_client().execute_command(
+        'SET', CNAME_REFRESH_LOCK_KEY, socket.gethostname(),
+        'NX', 'EX', CNAME_REFRESH_INTERVAL)
+    if locked:
+        start = time.time()
+        refreshed = refresh_cnames()
+        log.info('Refreshed %s CNAMEs in %.1fs'
+                 % (refreshed, time.time() - start))
@@ -0,0 +1,33 @@
+import logging
+
+from django.core.management.base import BaseCommand
+
+from djangome import views as djangome
+
+log = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+
+    help = ('Add the redirect terms stored before the search index existed '
+            'to the index. This scans the whole Redis keyspace, run it once '
+            'when Redis is quiet.')
+
+    def handle(self, *args, **options):
+        pattern = 'redirects:v4:*'
+        scan = getattr(djangome.r, 'scan_iter', None)
+        keys = scan(match=pattern) if scan else djangome.r.keys(pattern)
+        terms = set()
+        for key in keys:
+            # Sets of URLs are redirects:v4:<lang>:<version>:<project>:<term>,
+            # and terms may contain colons
+            parts = key.split(':', 5)
+            if len(parts) != 6 or parts[2] in ('terms', 'anchors'):
+                continue
+            # The scores of the URLs are strings under the same prefix
+            if djangome.r.type(key) != 'set':
+                continue
+            terms.add(tuple(parts[2:]))
+        for lang, version, project, term in terms:
+            djangome.index_term(lang, project, version, term)
+        log.info('Indexed %s redirect terms' % len(terms))
@@ -1,12 +1,15 @@
 import logging
+from multiprocessing.pool import ThreadPool
 from optparse import make_option
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
+from django.db import connection
 
-from builds.constants import LATEST
 from builds.models import Version
 from search import parse_json
+from search.indexes import Index, PageIndex, ProjectIndex, SectionIndex
+from search.utils import delete_search_manifest, process_mkdocs_json
 from restapi.utils import index_search_request
 
 log = logging.getLogger(__name__)
@@ -14,11 +17,27 @@ log = logging.getLogger(__name__)
 
 class Command(BaseCommand):
 
+    help = (
+        'Reindex all versions into a new index and swap the index alias to '
+        'it once the document counts match. With -p, reindex a single '
+        'project in place.'
+    )
+
     option_list = BaseCommand.option_list + (
         make_option('-p',
                     dest='project',
                     default='',
                     help='Project to index'),
+        make_option('-j', '--jobs',
+                    dest='jobs',
+                    type='int',
+                    default=1,
+                    help='Number of versions to index in parallel'),
+        make_option('--keep-old',
+                    dest='keep_old',
+                    action='store_true',
+                    default=False,
+                    help="Don't delete the previous index after the swap"),
     )
 
     def handle(self, *args, **options):
@@ -30,19 +49,100 @@ class Command(BaseCommand):
         if project:
             queryset = Version.objects.public(project__slug=project)
             log.info("Building all versions for %s" % project)
-        elif getattr(settings, 'INDEX_ONLY_LATEST', True):
-            queryset = Version.objects.public().filter(slug=LATEST)
-        else:
-            queryset = Version.objects.public()
-        for version in queryset:
-            log.info("Reindexing %s" % version)
-            try:
-                commit = version.project.vcs_repo(version.slug).commit
-            except:
-                # This will happen on prod
-                commit = None
+            for version in queryset:
+                index_version(version)
+            return
+
+        # The new index replaces the whole alias, so it needs every version,
+        # regardless of INDEX_ONLY_LATEST
+        self.shadow_reindex(Version.objects.public(), jobs=options['jobs'],
+                            delete=not options['keep_old'])
+
+    def shadow_reindex(self, queryset, jobs=1, delete=True):
+        """
+        Index ``queryset`` into a new timestamped index, then swap the alias.
+
+        The live index keeps serving searches until the new one is complete.
+        Pages indexed by builds while the reindex runs, and the pages of
+        versions not in ``queryset``, are only in the live index. So the
+        search manifests of all versions are removed after the swap, and their
+        next builds index all their pages again.
+        """
+        index_obj = Index()
+        alias = index_obj._index
+        if (index_obj.es.indices.exists(index=alias) and
+                not index_obj.es.indices.exists_alias(name=alias)):
+            raise CommandError(
+                "'%s' is an index, not an alias, it can't be swapped" % alias)
+
+        new_index = index_obj.timestamped_index()
+        log.info("Creating index %s" % new_index)
+        # Refreshing and replicating are only enabled once the index is full
+        index_obj.create_index(index=new_index, settings_override={
+            'refresh_interval': '-1',
+            'number_of_replicas': 0,
+        })
+        for type_obj in (ProjectIndex(), PageIndex(), SectionIndex()):
+            type_obj.put_mapping(index=new_index)
+
+        def index_in_thread(version):
             try:
-                page_list = parse_json.process_all_json_files(version, build_dir=False)
-                index_search_request(version=version, page_list=page_list, commit=commit, project_scale=0, page_scale=0, section=False, delete=False)
-            except Exception:
-                log.error('Build failed for %s' % version, exc_info=True)
+                return index_version(version, index=new_index)
+            finally:
+                # Each indexing thread opens its own database connection
+                connection.close()
+
+        versions = list(queryset)
+        pool = ThreadPool(processes=jobs)
+        try:
+            results = pool.map(index_in_thread, versions)
+        finally:
+            pool.close()
+            pool.join()
+
+        index_obj.es.indices.put_settings(index=new_index, body={
+            'index': {
+                'refresh_interval': index_obj.get_settings()['refresh_interval'],
+                'number_of_replicas': settings.ES_DEFAULT_NUM_REPLICAS,
+            }
+        })
+        index_obj.es.indices.refresh(index=new_index)
+
+        failed = [version for version, indexed in results if indexed is None]
+        expected = sum(indexed for version, indexed in results if indexed)
+        count = PageIndex().count(index=new_index)
+        if failed or count != expected:
+            index_obj.es.indices.delete(index=new_index)
+            raise CommandError(
+                'Reindex failed, keeping the current index. %s failed versions, '
+                '%s of %s pages indexed.' % (len(failed), count, expected))
+
+        log.info("Swapping %s to %s (%s pages)" % (alias, new_index, count))
+        index_obj.update_aliases(new_index, delete=delete)
+        for version in Version.objects.select_related('project'):
+            delete_search_manifest(version)
+
+
+def index_version(version, index=None):
+    """
+    Index the built JSON of ``version``.
+
+    Returns a tuple of the version and the number of pages indexed, which is
+    ``None`` if indexing failed.
+    """
+    log.info("Reindexing %s" % version)
+    try:
+        commit = version.project.vcs_repo(version.slug).commit
+    except:
+        # This will happen on prod
+        commit = None
+    try:
+        if 'mkdocs' in version.project.documentation_type:
+            page_list = process_mkdocs_json(version, build_dir=False)
+        else:
+            page_list = parse_json.process_all_json_files(version, build_dir=False)
+        indexed = index_search_request(version=version, page_list=page_list, commit=commit, project_scale=0, page_scale=0, section=True, delete=False, index=index)
+    except Exception:
+        log.error('Build failed for %s' % version, exc_info=True)
+        indexed = None
+    return version, indexed
@@ -3,13 +3,9 @@ import os
 
 from django.utils.translation import ugettext_lazy as _
 from django.conf import settings
-from django.core.cache import cache
-from django.core.exceptions import ObjectDoesNotExist, MultipleObjectsReturned
 from django.http import Http404
 
-from projects.models import Project
-
-import redis
+from core import cnames, resolver
 
 log = logging.getLogger(__name__)
 
@@ -51,25 +47,14 @@ class SubdomainMiddleware(object):
                 log.debug(LOG_TEMPLATE.format(msg='X-RTD-Slug header detetected: %s' % request.slug, **log_kwargs))
             except KeyError:
                 # Try header first, then DNS
-                try:
-                    slug = cache.get(host)
-                    if not slug:
-                        redis_conn = redis.Redis(**settings.REDIS)
-                        from dns import resolver
-                        answer = [ans for ans in resolver.query(host, 'CNAME')][0]
-                        domain = answer.target.to_unicode()
-                        slug = domain.split('.')[0]
-                        cache.set(host, slug, 60 * 60)
-                        # Cache the slug -> host mapping permanently.
-                        redis_conn.sadd("rtd_slug:v1:%s" % slug, host)
-                        log.debug(LOG_TEMPLATE.format(msg='CNAME cached: %s->%s' % (slug, host), **log_kwargs))
-                    request.slug = slug
-                    request.urlconf = 'core.subdomain_urls'
-                    log.debug(LOG_TEMPLATE.format(msg='CNAME detetected: %s' % request.slug, **log_kwargs))
-                except:
+                slug = cnames.get_cname_slug(host)
+                if not slug:
                     # Some crazy person is CNAMEing to us. 404.
                     log.debug(LOG_TEMPLATE.format(msg='CNAME 404', **log_kwargs))
                     raise Http404(_('Invalid hostname'))
+                request.slug = slug
+                request.urlconf = 'core.subdomain_urls'
+                log.debug(LOG_TEMPLATE.format(msg='CNAME detetected: %s' % request.slug, **log_kwargs))
         # Google was finding crazy www.blah.readthedocs.org domains.
         # Block these explicitly after trying CNAME logic.
         if len(domain_parts) > 3:
@@ -117,13 +102,12 @@ class SingleVersionMiddleware(object):
     def process_request(self, request):
         slug = self._get_slug(request)
         if slug:
-            try:
-                proj = Project.objects.get(slug=slug)
-            except (ObjectDoesNotExist, MultipleObjectsReturned):
+            data = resolver.get_project_data(slug)
+            if not data:
                 # Let 404 be handled further up stack.
                 return None
 
-            if getattr(proj, 'single_version', False):
+            if data['single_version']:
                 request.urlconf = 'core.single_version_urls'
                 # Logging
                 host = request.get_host()
@@ -0,0 +1,250 @@
+"""Cached lookups of the project and version data needed to serve docs.
+
+Serving a documentation page only needs a few fields of the project and the
+privacy and state of the requested version. These are stored per project in
+the shared Django cache, and for a few seconds in a local LRU of each web
+process, so most documentation requests don't hit the database.
+
+The shared entry is invalidated when the project or one of its versions is
+saved or deleted, and when a build finishes. Other processes can keep
+serving from their local LRU for ``SERVE_LOCAL_CACHE_SECONDS``.
+
+The 404 page suggests other languages and versions of a project. The
+versions available in each language of a project are precomputed in an
+availability matrix, stored the same way and recomputed when a build of the
+project or one of its translations finishes.
+
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+
+from projects import constants
+
+SERVE_CACHE_KEY = 'serve:v2:%s'
+AVAILABILITY_CACHE_KEY = 'availability:v2:%s'
+SERVE_CACHE_TIMEOUT = getattr(settings, 'SERVE_CACHE_TIMEOUT', 60 * 60)
+SERVE_LOCAL_CACHE_SIZE = getattr(settings, 'SERVE_LOCAL_CACHE_SIZE', 1000)
+SERVE_LOCAL_CACHE_SECONDS = getattr(settings, 'SERVE_LOCAL_CACHE_SECONDS', 10)
+
+# Cached in place of the data of projects that don't exist, and of hosts
+# without a CNAME. Not a valid slug, so it can't collide with a real one.
+MISSING = '<missing>'
+
+
+class LocalCache(object):
+
+    """A thread safe LRU cache whose entries expire after ``timeout``."""
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            try:
+                expires, value = self._data.pop(key)
+            except KeyError:
+                return None
+            if expires < time.time():
+                return None
+            # Re-insert to mark it as the most recently used
+            self._data[key] = (expires, value)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = (time.time() + self.timeout, value)
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LocalCache(SERVE_LOCAL_CACHE_SIZE, SERVE_LOCAL_CACHE_SECONDS)
+
+
+def get_project_data(slug):
+    """
+    Return the serving data of the project ``slug``, or ``None``.
+
+    The data is a dict of project fields, with a ``versions`` dict mapping
+    each version slug to its ``privacy_level`` and ``active`` state.
+    """
+    key = SERVE_CACHE_KEY % slug
+    data = local_cache.get(key)
+    if data is None:
+        data = cache.get(key)
+        if data is None:
+            data = _load_project_data(slug)
+            cache.set(key, data, SERVE_CACHE_TIMEOUT)
+        local_cache.set(key, data)
+    if data == MISSING:
+        return None
+    return data
+
+
+def _load_project_data(slug):
+    # Avoid circular import
+    from projects.models import Project
+    try:
+        project = Project.objects.get(slug=slug)
+    except (Project.DoesNotExist, Project.MultipleObjectsReturned):
+        return MISSING
+    data = _project_data(project)
+    # Changes each time the data is reloaded, to key caches derived from it
+    data['cache_token'] = uuid.uuid4().hex
+    return data
+
+
+def _project_data(project):
+    versions = {}
+    for version_slug, privacy_level, active in project.versions.values_list(
+            'slug', 'privacy_level', 'active'):
+        versions[version_slug] = {
+            'privacy_level': privacy_level,
+            'active': active,
+        }
+    return {
+        'pk': project.pk,
+        'slug': project.slug,
+        'name': project.name,
+        'language': project.language,
+        'documentation_type': project.documentation_type,
+        'privacy_level': project.privacy_level,
+        'single_version': project.single_version,
+        'default_version': project.default_version,
+        'versions': versions,
+    }
+
+
+def is_public(data, version_slug, only_active=True):
+    """
+    Whether the version ``version_slug`` of the project ``data`` can be
+    served to anonymous users.
+
+    This matches ``Version.objects.public`` for an anonymous user.
+    """
+    if not data or data['privacy_level'] != constants.PUBLIC:
+        return False
+    version = data['versions'].get(version_slug)
+    return bool(version and (version['active'] or not only_active) and
+                version['privacy_level'] == constants.PUBLIC)
+
+
+def project_from_data(data):
+    """
+    Return an unsaved ``Project`` for the serving ``data``.
+
+    It only has the fields needed to build paths to the served files.
+    """
+    # Avoid circular import
+    from projects.models import Project
+    return Project(
+        pk=data['pk'],
+        slug=data['slug'],
+        name=data['name'],
+        language=data['language'],
+        documentation_type=data['documentation_type'],
+        privacy_level=data['privacy_level'],
+        single_version=data['single_version'],
+        default_version=data['default_version'],
+    )
+
+
+def invalidate_project(slug):
+    """
+    Drop the cached serving data of the project ``slug``.
+    """
+    key = SERVE_CACHE_KEY % slug
+    local_cache.delete(key)
+    cache.delete(key)
+
+
+def get_availability(slug):
+    """
+    Return the availability matrix of the project ``slug``, or ``None``.
+
+    The matrix has the serving data of the project and of each of its
+    translations, with the version slugs an anonymous user can browse in
+    ``public_versions``, and the version the project's docs link to in
+    ``docs_version``.
+    """
+    key = AVAILABILITY_CACHE_KEY % slug
+    matrix = local_cache.get(key)
+    if matrix is None:
+        matrix = cache.get(key)
+        if matrix is None:
+            matrix = _load_availability(slug)
+            cache.set(key, matrix, SERVE_CACHE_TIMEOUT)
+        local_cache.set(key, matrix)
+    if matrix == MISSING:
+        return None
+    return matrix
+
+
+def _load_availability(slug):
+    # Avoid circular import
+    from projects.models import Project
+    try:
+        project = Project.objects.get(slug=slug)
+    except (Project.DoesNotExist, Project.MultipleObjectsReturned):
+        return MISSING
+    return {
+        'project': _availability_data(project),
+        'translations': [_availability_data(translation)
+                         for translation in project.translations.all()],
+        'docs_version': project.get_default_version(),
+    }
+
+
+def _availability_data(project):
+    data = _project_data(project)
+    if project.privacy_level == constants.PUBLIC:
+        data['public_versions'] = list(project.versions.filter(
+            privacy_level=constants.PUBLIC, active=True,
+        ).values_list('slug', flat=True))
+    else:
+        data['public_versions'] = []
+    return data
+
+
+def update_availability(project):
+    """
+    Recompute the availability matrix of ``project``, or of the project it
+    is a translation of.
+    """
+    if project.main_language_project_id:
+        project = project.main_language_project
+    key = AVAILABILITY_CACHE_KEY % project.slug
+    matrix = _load_availability(project.slug)
+    local_cache.set(key, matrix)
+    cache.set(key, matrix, SERVE_CACHE_TIMEOUT)
+
+
+def invalidate_availability(project):
+    """
+    Drop the cached availability matrix of ``project`` and of the project it
+    is a translation of.
+    """
+    slugs = [project.slug]
+    if project.main_language_project_id:
+        slugs.append(project.main_language_project.slug)
+    for slug in slugs:
+        key = AVAILABILITY_CACHE_KEY % slug
+        local_cache.delete(key)
+        cache.delete(key)
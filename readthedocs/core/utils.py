@@ -1,6 +1,7 @@
 import getpass
 import logging
 import os
+import threading
 
 from urlparse import urlparse
 
@@ -8,31 +9,28 @@ from django.conf import settings
 from django.core.mail import EmailMultiAlternatives
 from django.template.loader import get_template
 from django.template import Context
+import redis
 
 from builds.constants import LATEST
 from builds.constants import LATEST_VERBOSE_NAME
-from builds.models import Build
+from privacy.backends.syncers import queue_or_run
 
 log = logging.getLogger(__name__)
 
 SYNC_USER = getattr(settings, 'SYNC_USER', getpass.getuser())
 
+_redis_client = None
+_redis_lock = threading.Lock()
+
 
 def run_on_app_servers(command):
     """
-    A helper to copy a single file across app servers
+    A helper to run a command on all app servers
+
+    Inside a ``sync_batch``, the command is run with the rest of the batch.
     """
     log.info("Running %s on app servers" % command)
-    ret_val = 0
-    if getattr(settings, "MULTIPLE_APP_SERVERS", None):
-        for server in settings.MULTIPLE_APP_SERVERS:
-            ret = os.system("ssh %s@%s %s" % (SYNC_USER, server, command))
-            if ret != 0:
-                ret_val = ret
-        return ret_val
-    else:
-        ret = os.system(command)
-        return ret
+    return queue_or_run(command)
 
 
 def make_latest(project):
@@ -65,6 +63,22 @@ def clean_url(url):
     return netloc
 
 
+def redis_client():
+    """
+    Return a Redis client for ``settings.REDIS``.
+
+    The client is shared by the whole process, its connections come from one
+    pool instead of being opened for every call.
+    """
+    global _redis_client
+    if _redis_client is None:
+        with _redis_lock:
+            if _redis_client is None:
+                pool = redis.ConnectionPool(**settings.REDIS)
+                _redis_client = redis.Redis(connection_pool=pool)
+    return _redis_client
+
+
 def cname_to_slug(host):
     from dns import resolver
     answer = [ans for ans in resolver.query(host, 'CNAME')][0]
@@ -76,9 +90,12 @@ def cname_to_slug(host):
 def trigger_build(project, version=None, record=True, force=False, basic=False):
     """
     An API to wrap the triggering of a build.
+
+    Triggers of a version that already has a build queued are coalesced into
+    the queued build, see ``builds.scheduler``.
     """
     # Avoid circular import
-    from projects.tasks import update_docs
+    from builds.scheduler import schedule_build
 
     if project.skip:
         return None
@@ -86,20 +103,8 @@ def trigger_build(project, version=None, record=True, force=False, basic=False):
     if not version:
         version = project.versions.get(slug=LATEST)
 
-    if record:
-        build = Build.objects.create(
-            project=project,
-            version=version,
-            type='html',
-            state='triggered',
-            success=True,
-        )
-        update_docs.delay(pk=project.pk, version_pk=version.pk, record=record, force=force, basic=basic, build_pk=build.pk)
-    else:
-        build = None
-        update_docs.delay(pk=project.pk, version_pk=version.pk, record=record, force=force, basic=basic)
-
-    return build
+    return schedule_build(project, version, record=record, force=force,
+                          basic=basic)
 
 
 def send_email(recipient, subject, template, template_html, context=None,
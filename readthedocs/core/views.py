@@ -21,21 +21,21 @@ import stripe
 
 from builds.models import Build
 from builds.models import Version
+from core import resolver
 from core.forms import FacetedSearchForm
-from core.utils import trigger_build
+from core.utils import redis_client, trigger_build
 from donate.mixins import DonateProgressMixin
 from builds.constants import LATEST
 from projects import constants
 from projects.models import Project, ImportedFile, ProjectRelationship
 from projects.tasks import remove_dir, update_imported_docs
 from redirects.models import Redirect
-from redirects.utils import redirect_filename
+from redirects.utils import get_redirect_matcher, redirect_filename
 
 import json
 import mimetypes
 import os
 import logging
-import redis
 import re
 
 log = logging.getLogger(__name__)
@@ -74,8 +74,7 @@ def random_page(request, project=None):
 
 
 def queue_depth(request):
-    r = redis.Redis(**settings.REDIS)
-    return HttpResponse(r.llen('celery'))
+    return HttpResponse(redis_client().llen('celery'))
 
 
 def queue_info(request):
@@ -147,20 +146,27 @@ def wipe_version(request, project_slug, version_slug):
                                   context_instance=RequestContext(request))
 
 
-def _build_version(project, slug, already_built=()):
+def _build_version(project, slug, already_built=(), force=False):
+    """
+    Trigger builds of the version ``slug`` of ``project``.
+
+    Webhook builds aren't forced, so a build of an unchanged commit and
+    configuration reuses the output of the last one. ``force`` is for
+    rebuilds requested by a user.
+    """
     default = project.default_branch or (project.vcs_repo().fallback_branch)
     if slug == default and slug not in already_built:
         # short circuit versions that are default
         # these will build at "latest", and thus won't be
         # active
         latest_version = project.versions.get(slug=LATEST)
-        trigger_build(project=project, version=latest_version, force=True)
+        trigger_build(project=project, version=latest_version, force=force)
         pc_log.info(("(Version build) Building %s:%s"
                      % (project.slug, latest_version.slug)))
         if project.versions.exclude(active=False).filter(slug=slug).exists():
             # Handle the case where we want to build the custom branch too
             slug_version = project.versions.get(slug=slug)
-            trigger_build(project=project, version=slug_version, force=True)
+            trigger_build(project=project, version=slug_version, force=force)
             pc_log.info(("(Version build) Building %s:%s"
                          % (project.slug, slug_version.slug)))
         return LATEST
@@ -169,7 +175,7 @@ def _build_version(project, slug, already_built=()):
         return None
     elif slug not in already_built:
         version = project.versions.get(slug=slug)
-        trigger_build(project=project, version=version, force=True)
+        trigger_build(project=project, version=version, force=force)
         pc_log.info(("(Version build) Building %s:%s"
                      % (project.slug, version.slug)))
         return slug
@@ -288,14 +294,16 @@ def generic_build(request, pk=None):
             return HttpResponseNotFound('Repo not found: %s' % pk)
     if request.method == 'POST':
         slug = request.POST.get('version_slug', None)
+        # Set by the build forms of the site, webhooks don't force
+        force = request.POST.get('force') == 'true'
         if slug:
             pc_log.info(
                 "(Incoming Generic Build) %s [%s]" % (project.slug, slug))
-            _build_version(project, slug)
+            _build_version(project, slug, force=force)
         else:
             pc_log.info(
                 "(Incoming Generic Build) %s [%s]" % (project.slug, LATEST))
-            trigger_build(project=project, force=True)
+            trigger_build(project=project, force=force)
     else:
         return HttpResponse("You must POST to this resource.")
     return redirect('builds_project_list', project.slug)
@@ -420,6 +428,16 @@ def redirect_page_with_filename(request, filename, project_slug=None):
 def serve_docs(request, lang_slug, version_slug, filename, project_slug=None):
     if not project_slug:
         project_slug = request.slug
+    if not request.user.is_authenticated():
+        # Anonymous users are served from the cached project data
+        data = resolver.get_project_data(project_slug)
+        if not resolver.is_public(data, version_slug):
+            return server_helpful_404(request, project_slug, lang_slug,
+                                      version_slug, filename)
+        return _serve_docs(request, project=resolver.project_from_data(data),
+                           version=None, filename=filename,
+                           lang_slug=lang_slug, version_slug=version_slug,
+                           project_slug=project_slug)
     try:
         proj = Project.objects.protected(request.user).get(slug=project_slug)
         ver = Version.objects.public(request.user).get(project__slug=project_slug, slug=version_slug)
@@ -498,13 +516,13 @@ def _serve_docs(request, project, version, filename, lang_slug=None,
 def serve_single_version_docs(request, filename, project_slug=None):
     if not project_slug:
         project_slug = request.slug
-    proj = get_object_or_404(Project, slug=project_slug)
+    data = resolver.get_project_data(project_slug)
 
     # This function only handles single version projects
-    if not proj.single_version:
+    if not data or not data['single_version']:
         raise Http404
 
-    return serve_docs(request, proj.language, proj.default_version,
+    return serve_docs(request, data['language'], data['default_version'],
                       filename, project_slug)
 
 
@@ -519,7 +537,7 @@ def server_error(request, template_name='500.html'):
 
 
 def _try_redirect(request, full_path=None):
-    project = project_slug = None
+    project_slug = None
     if hasattr(request, 'slug'):
         project_slug = request.slug
     elif full_path.startswith('/docs/'):
@@ -529,46 +547,32 @@ def _try_redirect(request, full_path=None):
     else:
         return None
 
-    if project_slug:
-        try:
-            project = Project.objects.get(slug=project_slug)
-        except Project.DoesNotExist:
-            return None
+    if not project_slug:
+        return None
+    data = resolver.get_project_data(project_slug)
+    if not data:
+        return None
 
-    if project:
-        for redirect in project.redirects.all():
-            if redirect.redirect_type == 'prefix':
-                if full_path.startswith(redirect.from_url):
-                    log.debug('Redirecting %s' % redirect)
-                    cut_path = re.sub('^%s' % redirect.from_url, '', full_path)
-                    to = redirect_filename(project=project, filename=cut_path)
-                    return HttpResponseRedirect(to)
-            elif redirect.redirect_type == 'page':
-                if full_path == redirect.from_url:
-                    log.debug('Redirecting %s' % redirect)
-                    to = redirect_filename(project=project, filename=redirect.to_url.lstrip('/'))
-                    return HttpResponseRedirect(to)
-            elif redirect.redirect_type == 'exact':
-                if full_path == redirect.from_url:
-                    log.debug('Redirecting %s' % redirect)
-                    return HttpResponseRedirect(redirect.to_url)
-                # Handle full sub-level redirects
-                if '$rest' in redirect.from_url:
-                    match = redirect.from_url.split('$rest')[0]
-                    if full_path.startswith(match):
-                        cut_path = re.sub('^%s' % match, redirect.to_url, full_path)
-                        return HttpResponseRedirect(cut_path)
-            elif redirect.redirect_type == 'sphinx_html':
-                if full_path.endswith('/'):
-                    log.debug('Redirecting %s' % redirect)
-                    to = re.sub('/$', '.html', full_path)
-                    return HttpResponseRedirect(to)
-            elif redirect.redirect_type == 'sphinx_htmldir':
-                if full_path.endswith('.html'):
-                    log.debug('Redirecting %s' % redirect)
-                    to = re.sub('.html$', '/', full_path)
-                    return HttpResponseRedirect(to)
-    return None
+    match = get_redirect_matcher(data['pk']).match(full_path)
+    if match is None:
+        return None
+    redirect_type, from_url, to_url = match
+    log.debug('Redirecting %s with %s redirect %s' % (full_path, redirect_type, from_url))
+    if redirect_type == 'prefix':
+        cut_path = full_path[len(from_url):]
+        to = redirect_filename(project=resolver.project_from_data(data), filename=cut_path)
+    elif redirect_type == 'page':
+        to = redirect_filename(project=resolver.project_from_data(data), filename=to_url.lstrip('/'))
+    elif redirect_type == 'exact':
+        to = to_url
+    elif redirect_type == 'rest':
+        # Handle full sub-level redirects
+        to = to_url + full_path[len(from_url):]
+    elif redirect_type == 'sphinx_html':
+        to = re.sub('/$', '.html', full_path)
+    elif redirect_type == 'sphinx_htmldir':
+        to = re.sub('.html$', '/', full_path)
+    return HttpResponseRedirect(to)
 
 
 def server_error_404(request, template_name='404.html'):
@@ -613,96 +617,94 @@ def get_suggestion(project_slug, lang_slug, version_slug, pagename, user):
     """
 
     suggestion = {}
+    matrix = None
     if project_slug:
-        try:
-            proj = Project.objects.get(slug=project_slug)
-            if not lang_slug:
-                lang_slug = proj.language
-            try:
-                ver = Version.objects.get(
-                    project__slug=project_slug, slug=version_slug)
-            except Version.DoesNotExist:
-                ver = None
-
-            if ver:  # if requested version is available on main project
-                if lang_slug != proj.language:
-                    try:
-                        translations = proj.translations.filter(
-                            language=lang_slug)
-                        if translations:
-                            ver = Version.objects.get(
-                                project__slug=translations[0].slug, slug=version_slug)
-                        else:
-                            ver = None
-                    except Version.DoesNotExist:
-                        ver = None
-                # if requested version is available on translation project too
-                if ver:
-                    # Case #8: Show a link to top-level page of the version
-                    suggestion['type'] = 'top'
-                    suggestion['message'] = "What are you looking for?"
-                    suggestion['href'] = proj.get_docs_url(ver.slug, lang_slug)
-                # requested version is available but not in requested language
-                else:
-                    # Case #7: Show available translations of the version
-                    suggestion['type'] = 'list'
-                    suggestion[
-                        'message'] = "Requested page seems not to be translated in requested language. But it's available in these languages."
-                    suggestion['list'] = []
+        matrix = resolver.get_availability(project_slug)
+    if not matrix:
+        # Case #1-4: Show error mssage
+        suggestion['type'] = 'none'
+        suggestion[
+            'message'] = "We're sorry, we don't know what you're looking for"
+        return suggestion
+
+    main = matrix['project']
+    proj = resolver.project_from_data(main)
+    if not lang_slug:
+        lang_slug = main['language']
+    translations = [t for t in matrix['translations']
+                    if t['language'] == lang_slug]
+
+    def translation_from_data(data):
+        translation = resolver.project_from_data(data)
+        translation.main_language_project = proj
+        return translation
+
+    if version_slug in main['versions']:  # if requested version is available on main project
+        if lang_slug != main['language']:
+            available = bool(translations) and version_slug in translations[0]['versions']
+        else:
+            available = True
+        # if requested version is available on translation project too
+        if available:
+            # Case #8: Show a link to top-level page of the version
+            suggestion['type'] = 'top'
+            suggestion['message'] = "What are you looking for?"
+            suggestion['href'] = proj.get_docs_url(version_slug, lang_slug)
+        # requested version is available but not in requested language
+        else:
+            # Case #7: Show available translations of the version
+            suggestion['type'] = 'list'
+            suggestion[
+                'message'] = "Requested page seems not to be translated in requested language. But it's available in these languages."
+            suggestion['list'] = []
+            suggestion['list'].append({
+                'label': main['language'],
+                'project': proj,
+                'version_slug': version_slug,
+                'pagename': pagename
+            })
+            for t in matrix['translations']:
+                if version_slug in t['versions']:
                     suggestion['list'].append({
-                        'label': proj.language,
-                        'project': proj,
+                        'label': t['language'],
+                        'project': translation_from_data(t),
                         'version_slug': version_slug,
                         'pagename': pagename
                     })
-                    for t in proj.translations.all():
-                        try:
-                            Version.objects.get(
-                                project__slug=t.slug, slug=version_slug)
-                            suggestion['list'].append({
-                                'label': t.language,
-                                'project': t,
-                                'version_slug': version_slug,
-                                'pagename': pagename
-                            })
-                        except Version.DoesNotExist:
-                            pass
-            else:  # requested version does not exist on main project
-                if lang_slug == proj.language:
-                    trans = proj
-                else:
-                    translations = proj.translations.filter(language=lang_slug)
-                    trans = translations[0] if translations else None
-                if trans:  # requested language is available
-                    # Case #6: Show available versions of the translation
-                    suggestion['type'] = 'list'
-                    suggestion[
-                        'message'] = "Requested version seems not to have been built yet. But these versions are available."
-                    suggestion['list'] = []
-                    for v in Version.objects.public(user, trans, True):
-                        suggestion['list'].append({
-                            'label': v.slug,
-                            'project': trans,
-                            'version_slug': v.slug,
-                            'pagename': pagename
-                        })
-                # requested project exists but requested version and language
-                # are not available.
-                else:
-                    # Case #5: Show a link to top-level page of default version
-                    # of main project
-                    suggestion['type'] = 'top'
-                    suggestion['message'] = 'What are you looking for??'
-                    suggestion['href'] = proj.get_docs_url()
-        except Project.DoesNotExist:
-            # Case #1-4: Show error mssage
-            suggestion['type'] = 'none'
+    else:  # requested version does not exist on main project
+        if lang_slug == main['language']:
+            trans, trans_data = proj, main
+        elif translations:
+            trans, trans_data = translation_from_data(translations[0]), translations[0]
+        else:
+            trans = trans_data = None
+        if trans:  # requested language is available
+            # Case #6: Show available versions of the translation
+            suggestion['type'] = 'list'
             suggestion[
-                'message'] = "We're sorry, we don't know what you're looking for"
-    else:
-        suggestion['type'] = 'none'
-        suggestion[
-            'message'] = "We're sorry, we don't know what you're looking for"
+                'message'] = "Requested version seems not to have been built yet. But these versions are available."
+            suggestion['list'] = []
+            if user and user.is_authenticated():
+                # Users can see versions that aren't public
+                version_slugs = [v.slug for v in Version.objects.public(
+                    user, trans_data['pk'], True)]
+            else:
+                version_slugs = trans_data['public_versions']
+            for slug in version_slugs:
+                suggestion['list'].append({
+                    'label': slug,
+                    'project': trans,
+                    'version_slug': slug,
+                    'pagename': pagename
+                })
+        # requested project exists but requested version and language
+        # are not available.
+        else:
+            # Case #5: Show a link to top-level page of default version
+            # of main project
+            suggestion['type'] = 'top'
+            suggestion['message'] = 'What are you looking for??'
+            suggestion['href'] = proj.get_docs_url(matrix['docs_version'])
 
     return suggestion
 
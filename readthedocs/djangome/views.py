@@ -12,6 +12,17 @@ from django.utils.translation import ugettext_lazy as _
 
 r = redis.Redis(**settings.REDIS)
 
+# Hash of the best URL of each term of a version, by language and project
+TERMS_KEY = 'redirects:v4:terms:%s:%s:%s'
+# Set of all the URLs of a term
+ANCHORS_KEY = 'redirects:v4:anchors:%s'
+# Sorted set of all the terms, all with score 0, so they are sorted
+# lexicographically and can be looked up by prefix. ``r`` is a legacy
+# ``Redis`` client, so ``zadd`` takes the member before the score.
+ANCHOR_TERMS_KEY = 'redirects:v4:anchor_terms'
+# Most terms whose URLs an anchor search returns
+ANCHOR_SEARCH_TERMS = getattr(settings, 'ANCHOR_SEARCH_TERMS', 100)
+
 
 class RedirectForm(forms.Form):
     _domain = 'readthedocs.org'
@@ -49,6 +60,7 @@ def redirect_to_term(request, version, term):
                    url)
             r.incr('redirects:v4:%s:%s:%s:%s:%s' % (lang, version, project,
                                                     term, url))
+            index_term(lang, project, version, term)
             return redirect(request.GET.get('return_to', url))
 
     urls = get_urls(lang, project, version, term)
@@ -64,6 +76,12 @@ def redirect_to_term(request, version, term):
             url = winners[0]
             r.incr('redirects:v4:%s:%s:%s:%s:%s' % (lang, version, project,
                                                     term, url))
+            # Also indexes terms stored before the index existed
+            pipe = r.pipeline()
+            pipe.hset(TERMS_KEY % (lang, version, project), term, url)
+            pipe.sadd(ANCHORS_KEY % term, url)
+            pipe.zadd(ANCHOR_TERMS_KEY, term, 0)
+            pipe.execute()
             return redirect(url)
 
         # Otherwise we need to display a list of all choices. We'll present
@@ -113,6 +131,57 @@ def get_urls(lang, project, version, term):
     return zip(urls[::2], urls[1::2])
 
 
+def index_term(lang, project, version, term):
+    """
+    Store the URLs of <term> in the search indexes.
+
+    The best URL of the term is stored in the terms hash of the version, and
+    all its URLs in the anchors set of the term, so searches don't need to
+    scan the keyspace.
+    """
+    urls = get_urls(lang, project, version, term)
+    if not urls:
+        return
+    pipe = r.pipeline()
+    pipe.hset(TERMS_KEY % (lang, version, project), term, urls[0][1])
+    for score, url in urls:
+        pipe.sadd(ANCHORS_KEY % term, url)
+    pipe.zadd(ANCHOR_TERMS_KEY, term, 0)
+    pipe.execute()
+
+
+def search_anchors(query):
+    """
+    Return the URLs of the terms starting with <query>.
+
+    Only the first ``ANCHOR_SEARCH_TERMS`` matching terms are looked up.
+    """
+    if isinstance(query, unicode):
+        query = query.encode('utf-8')
+    # ZRANGEBYLEX isn't wrapped by our redis-py. Terms are compared as bytes,
+    # so '\xff' sorts after every term starting with <query>.
+    terms = r.execute_command('ZRANGEBYLEX', ANCHOR_TERMS_KEY,
+                              '[' + query, '[' + query + '\xff',
+                              'LIMIT', 0, ANCHOR_SEARCH_TERMS)
+    pipe = r.pipeline()
+    for term in terms:
+        pipe.smembers(ANCHORS_KEY % term)
+    urls = set()
+    for term_urls in pipe.execute():
+        urls.update(term_urls)
+    return sorted(urls)
+
+
+def search_terms(lang, project, version, query):
+    """
+    Return a dict of the terms of <version> matching <query>, and their best
+    URL.
+    """
+    terms = r.hgetall(TERMS_KEY % (lang, version, project))
+    return dict((term, url) for term, url in terms.items()
+                if query in term or query in url)
+
+
 def group_urls(urls):
     """
     Given a list of (score, url) tuples, group them into buckets by score.
@@ -6,7 +6,7 @@ import yaml
 from django.conf import settings
 from django.template import Context, loader as template_loader
 
-from doc_builder.base import BaseBuilder, restoring_chdir
+from doc_builder.base import BaseBuilder
 from projects.utils import run
 
 log = logging.getLogger(__name__)
@@ -124,18 +124,16 @@ class BaseMkdocs(BaseBuilder):
         include_file.write(include_string)
         include_file.close()
 
-    @restoring_chdir
     def build(self, **kwargs):
         checkout_path = self.version.project.checkout_path(self.version.slug)
         #site_path = os.path.join(checkout_path, 'site')
-        os.chdir(checkout_path)
         # Actual build
         build_command = "{command} {builder} --clean --site-dir={build_dir} --theme=readthedocs".format(
             command=self.version.project.venv_bin(version=self.version.slug, bin='mkdocs'),
             builder=self.builder,
             build_dir=self.build_dir,
         )
-        results = run(build_command, shell=True)
+        results = run(build_command, shell=True, cwd=checkout_path)
         return results
 
 
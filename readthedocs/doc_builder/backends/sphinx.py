@@ -1,7 +1,10 @@
 import re
 import os
+import shutil
 import sys
 import codecs
+import hashlib
+import json
 from glob import glob
 import logging
 import zipfile
@@ -21,6 +24,8 @@ log = logging.getLogger(__name__)
 TEMPLATE_DIR = '%s/readthedocs/templates/sphinx' % settings.SITE_ROOT
 STATIC_DIR = '%s/_static' % TEMPLATE_DIR
 PDF_RE = re.compile('Output written on (.*?)')
+# Holds the key of the build environment the doctrees were written with
+DOCTREES_MARKER = '.rtd-doctrees'
 
 
 class BaseSphinx(BaseBuilder):
@@ -32,10 +37,85 @@ class BaseSphinx(BaseBuilder):
     def __init__(self, *args, **kwargs):
         super(BaseSphinx, self).__init__(*args, **kwargs)
         try:
-            self.old_artifact_path = os.path.join(self.version.project.conf_dir(self.version.slug), self.sphinx_build_dir)
+            base_dir = self.version.project.conf_dir(self.version.slug)
         except ProjectImportError:
-            docs_dir = self.docs_dir()
-            self.old_artifact_path = os.path.join(docs_dir, self.sphinx_build_dir)
+            base_dir = self.docs_dir()
+        self.old_artifact_path = os.path.join(base_dir, self.sphinx_build_dir)
+        self.build_root = os.path.join(base_dir, '_build')
+        self.doctrees = self.version.project.doctree_path(self.version.slug)
+        self._doctrees_copy = False
+        # Computed before ``append_conf`` adds the per build settings
+        self._doctrees_key = self.doctrees_key()
+
+    def sphinx_version(self):
+        """
+        Return the version of Sphinx installed in the virtualenv, or ``None``.
+        """
+        project = self.version.project
+        paths = glob(os.path.join(project.venv_path(version=self.version.slug),
+                                  'lib', 'python*', 'site-packages', 'Sphinx-*-info'))
+        if not paths:
+            return None
+        return os.path.basename(paths[0]).split('-')[1]
+
+    def doctrees_key(self):
+        """
+        Return a digest of the Sphinx version and ``conf.py`` of the version.
+        """
+        conf = None
+        try:
+            with open(self.version.project.conf_file(self.version.slug), 'rb') as f:
+                conf = hashlib.sha1(f.read()).hexdigest()
+        except (ProjectImportError, IOError):
+            pass
+        return hashlib.sha1(json.dumps([self.sphinx_version(), conf])).hexdigest()
+
+    def prepare_doctrees(self):
+        """
+        Keep the doctrees of the last build of the version, so Sphinx only
+        reads changed sources.
+
+        They are removed when a user forces the build, or when the Sphinx
+        version or ``conf.py`` changed since they were written. Webhook builds
+        aren't forced, so they only read the sources that changed.
+        """
+        if self._doctrees_copy:
+            return
+        marker = os.path.join(self.doctrees, DOCTREES_MARKER)
+        try:
+            with open(marker) as f:
+                key = f.read()
+        except IOError:
+            key = None
+        if self._force or key != self._doctrees_key:
+            if os.path.exists(self.doctrees):
+                log.info("Removing doctrees: %s" % self.doctrees)
+                shutil.rmtree(self.doctrees)
+            os.makedirs(self.doctrees)
+            with open(marker, 'w') as f:
+                f.write(self._doctrees_key)
+
+    def start_from(self, doctrees):
+        """
+        Build from a copy of the ``doctrees`` of another build.
+
+        Sources parsed by that build aren't parsed again, and the copy keeps
+        builders running at the same time from writing the same environment.
+        """
+        copy = os.path.join(self.build_root, 'doctrees-%s' % self.type)
+        if os.path.exists(copy):
+            shutil.rmtree(copy)
+        if os.path.exists(doctrees):
+            shutil.copytree(doctrees, copy)
+        self.doctrees = copy
+        self._doctrees_copy = True
+
+    def clean_doctrees(self):
+        """
+        Remove the doctrees copied by ``start_from``.
+        """
+        if self._doctrees_copy and os.path.exists(self.doctrees):
+            shutil.rmtree(self.doctrees)
 
     def _write_config(self):
         """
@@ -115,21 +195,22 @@ class BaseSphinx(BaseBuilder):
         rtd_string = template_loader.get_template('doc_builder/conf.py.tmpl').render(rtd_ctx)
         outfile.write(rtd_string)
 
-    @restoring_chdir
     def build(self, **kwargs):
         self.clean()
+        self.prepare_doctrees()
         project = self.version.project
-        os.chdir(project.conf_dir(self.version.slug))
         force_str = " -E " if self._force else ""
-        build_command = "%s -T %s -b %s -D language=%s . %s " % (
+        build_command = "%s -T %s -b %s -d %s -D language=%s . %s " % (
             project.venv_bin(version=self.version.slug,
                              bin='sphinx-build'),
             force_str,
             self.sphinx_builder,
+            self.doctrees,
             project.language,
             self.sphinx_build_dir,
         )
-        results = run(build_command, shell=True)
+        results = run(build_command, shell=True,
+                      cwd=project.conf_dir(self.version.slug))
         return results
 
 
@@ -216,20 +297,23 @@ class PdfBuilder(BaseSphinx):
     sphinx_build_dir = '_build/latex'
     pdf_file_name = None
 
-    @restoring_chdir
     def build(self, **kwargs):
         self.clean()
+        self.prepare_doctrees()
         project = self.version.project
-        os.chdir(project.conf_dir(self.version.slug))
+        conf_dir = project.conf_dir(self.version.slug)
+        latex_dir = os.path.join(conf_dir, '_build', 'latex')
         # Default to this so we can return it always.
         results = {}
-        latex_results = run('%s -b latex -D language=%s -d _build/doctrees . _build/latex'
+        latex_results = run('%s -b latex -D language=%s -d %s . _build/latex'
                             % (project.venv_bin(version=self.version.slug,
-                                                bin='sphinx-build'), project.language))
+                                                bin='sphinx-build'),
+                               project.language, self.doctrees),
+                            cwd=conf_dir)
 
         if latex_results[0] == 0:
-            os.chdir('_build/latex')
-            tex_files = glob('*.tex')
+            tex_files = [os.path.basename(tex_file) for tex_file
+                         in glob(os.path.join(latex_dir, '*.tex'))]
 
             if tex_files:
                 # Run LaTeX -> PDF conversions
@@ -237,9 +321,9 @@ class PdfBuilder(BaseSphinx):
                                   % tex_file) for tex_file in tex_files]
                 makeindex_cmds = [('makeindex -s python.ist %s.idx'
                                    % os.path.splitext(tex_file)[0]) for tex_file in tex_files]
-                pdf_results = run(*pdflatex_cmds)
-                ind_results = run(*makeindex_cmds)
-                pdf_results = run(*pdflatex_cmds)
+                pdf_results = run(*pdflatex_cmds, cwd=latex_dir)
+                ind_results = run(*makeindex_cmds, cwd=latex_dir)
+                pdf_results = run(*pdflatex_cmds, cwd=latex_dir)
             else:
                 pdf_results = (0, "No tex files found", "No tex files found")
                 ind_results = (0, "No tex files found", "No tex files found")
@@ -12,7 +12,7 @@ from django.utils.text import slugify
 from django.conf import settings
 from rest_framework.renderers import JSONRenderer
 
-from projects.utils import run
+from projects.utils import BUILD_OUTPUT_LIMIT, capture_output, run
 from restapi.serializers import VersionFullSerializer
 
 log = logging.getLogger(__name__)
@@ -107,6 +107,8 @@ class DockerEnvironment(EnvironmentBase):
              '--settings=settings.docker'],
             name=self.container_id(),
             environment=self.env_settings(),
+            # The results of the build are read as JSON from the output
+            output_limit=None,
             mounts=[(self.version.project.doc_path,
                      ('/home/docs/checkouts/readthedocs.org/'
                       'user_builds/{project}'
@@ -165,10 +167,13 @@ class BuildCommand(object):
     :param cwd: current working path
     :param shell: execute command in shell, default=True
     :param environment: environment variables to add to environment
+    :param output_limit: bytes of output and error kept, ``None`` for all
     '''
 
-    def __init__(self, command, cwd=None, shell=True, environment=None):
+    def __init__(self, command, cwd=None, shell=True, environment=None,
+                 output_limit=BUILD_OUTPUT_LIMIT):
         self.command = command
+        self.output_limit = output_limit
         self.shell = shell
         if cwd is None:
             cwd = os.getcwd()
@@ -224,7 +229,7 @@ class BuildCommand(object):
             stderr=stderr,
             env=self.environment,
         )
-        cmd_output = proc.communicate(cmd_input)
+        cmd_output = capture_output(proc, cmd_input, limit=self.output_limit)
         (self.output, self.error) = cmd_output
         self.status = proc.returncode
 
@@ -1,12 +1,154 @@
+"""
+Copy build artifacts to the app servers and run commands on them.
+
+Copies and commands can be grouped in a ``sync_batch``. The operations of a
+batch are run when it exits, on all app servers in parallel, with the
+commands that follow each other sent in a single ssh call. ssh connections
+to each server are shared between calls with ``SYNC_SSH_OPTIONS``.
+"""
+
 import getpass
 import logging
 import os
+import pipes
 import shutil
+import threading
+from contextlib import contextmanager
+from functools import partial
+from multiprocessing.pool import ThreadPool
 
 from django.conf import settings
 
 log = logging.getLogger(__name__)
 
+# Reuse one ssh connection per server, kept open between builds
+SYNC_SSH_OPTIONS = getattr(
+    settings, 'SYNC_SSH_OPTIONS',
+    '-o ControlMaster=auto -o ControlPath=/tmp/rtd-sync-%r@%h:%p '
+    '-o ControlPersist=600')
+# App servers synced in parallel
+SYNC_WORKERS = getattr(settings, 'SYNC_WORKERS', 8)
+
+_batches = threading.local()
+
+
+def ssh_command(server, command):
+    """
+    Return the shell command running ``command`` on ``server``.
+    """
+    sync_user = getattr(settings, 'SYNC_USER', getpass.getuser())
+    return 'ssh %s %s@%s %s' % (SYNC_SSH_OPTIONS, sync_user, server,
+                                pipes.quote(command))
+
+
+def run_command(server, command):
+    """
+    Run the shell ``command`` on ``server``, or locally if it's ``None``.
+    """
+    if server is None:
+        return os.system(command)
+    return os.system(ssh_command(server, command))
+
+
+def run_on_servers(operation):
+    """
+    Call ``operation`` with each app server in parallel, or once with
+    ``None`` without ``MULTIPLE_APP_SERVERS``.
+
+    Returns the exit status of the operation on each server.
+    """
+    servers = getattr(settings, 'MULTIPLE_APP_SERVERS', None) or [None]
+    if len(servers) == 1:
+        results = [operation(servers[0])]
+    else:
+        pool = ThreadPool(processes=min(SYNC_WORKERS, len(servers)))
+        try:
+            results = pool.map(operation, servers)
+        finally:
+            pool.close()
+            pool.join()
+    status = dict(zip(servers, results))
+    for server, ret in status.items():
+        if ret != 0:
+            log.info("Sync error on app server %s: %s" % (server, ret))
+    return status
+
+
+class SyncBatch(object):
+
+    """
+    Operations to run on every app server.
+
+    Operations are shell commands, or callables taking the server and
+    returning an exit status.
+    """
+
+    def __init__(self):
+        self.operations = []
+        self.status = {}
+
+    def add(self, operation):
+        self.operations.append(operation)
+
+    def run(self):
+        if self.operations:
+            self.status = run_on_servers(self.run_on_server)
+        return self.status
+
+    def run_on_server(self, server):
+        ret_val = 0
+        commands = []
+        for operation in self.operations + [None]:
+            if isinstance(operation, basestring):
+                commands.append(operation)
+                continue
+            if commands:
+                ret = run_command(server, _script(commands))
+                ret_val = ret_val or ret
+                commands = []
+            if operation is not None:
+                ret = operation(server)
+                ret_val = ret_val or ret
+        return ret_val
+
+
+def _script(commands):
+    # Run every command, exiting with the last failure
+    if len(commands) == 1:
+        return commands[0]
+    return 'status=0; %s exit $status' % ''.join(
+        '{ %s; } || status=$?;' % command for command in commands)
+
+
+@contextmanager
+def sync_batch():
+    """
+    Collect the copies and commands for the app servers, and run them on
+    exit. Yields the batch, whose ``status`` has the exit status on each
+    server once it has run.
+    """
+    stack = _batches.__dict__.setdefault('stack', [])
+    batch = SyncBatch()
+    stack.append(batch)
+    try:
+        yield batch
+    finally:
+        stack.pop()
+    batch.run()
+
+
+def queue_or_run(operation):
+    """
+    Add ``operation`` to the current batch, or run it on the app servers.
+    """
+    stack = getattr(_batches, 'stack', None)
+    if stack:
+        stack[-1].add(operation)
+        return 0
+    status = run_on_servers(
+        operation if callable(operation) else partial(run_command, command=operation))
+    return max(status.values())
+
 
 class LocalSyncer(object):
 
@@ -38,32 +180,37 @@ class RemoteSyncer(object):
 
         Respects the ``MULTIPLE_APP_SERVERS`` setting when copying.
         """
-        SYNC_USER = getattr(settings, 'SYNC_USER', getpass.getuser())
         MULTIPLE_APP_SERVERS = getattr(settings, 'MULTIPLE_APP_SERVERS', [])
         if MULTIPLE_APP_SERVERS:
             log.info("Remote Copy %s to %s" % (path, target))
-            for server in MULTIPLE_APP_SERVERS:
-                mkdir_cmd = ("ssh %s@%s mkdir -p %s" % (SYNC_USER, server, target))
-                ret = os.system(mkdir_cmd)
-                if ret != 0:
-                    log.info("COPY ERROR to app servers:")
-                    log.info(mkdir_cmd)
-                if file:
-                    slash = ""
-                else:
-                    slash = "/"
-                # Add a slash when copying directories
-                sync_cmd = "rsync -e 'ssh -T' -av --delete {path}{slash} {user}@{server}:{target}".format(
-                    path=path,
-                    slash=slash,
-                    user=SYNC_USER,
-                    server=server,
-                    target=target,
-                )
-                ret = os.system(sync_cmd)
-                if ret != 0:
-                    log.info("COPY ERROR to app servers.")
-                    log.info(sync_cmd)
+            queue_or_run(partial(cls.copy_to_server, path, target, file=file))
+
+    @classmethod
+    def copy_to_server(cls, path, target, server, file=False):
+        SYNC_USER = getattr(settings, 'SYNC_USER', getpass.getuser())
+        if file:
+            slash = ""
+            target_dir = os.path.dirname(target)
+        else:
+            # Add a slash when copying directories
+            slash = "/"
+            target_dir = target
+        # The target directory is created by the same ssh call
+        sync_cmd = ("rsync -e {ssh} --rsync-path={rsync_path} -av --delete "
+                    "{path}{slash} {user}@{server}:{target}").format(
+            ssh=pipes.quote('ssh -T %s' % SYNC_SSH_OPTIONS),
+            rsync_path=pipes.quote('mkdir -p %s && rsync' % target_dir),
+            path=path,
+            slash=slash,
+            user=SYNC_USER,
+            server=server,
+            target=target,
+        )
+        ret = os.system(sync_cmd)
+        if ret != 0:
+            log.info("COPY ERROR to app servers.")
+            log.info(sync_cmd)
+        return ret
 
 
 class DoubleRemotePuller(object):
@@ -75,32 +222,29 @@ class DoubleRemotePuller(object):
 
         Respects the ``MULTIPLE_APP_SERVERS`` setting when copying.
         """
-        SYNC_USER = getattr(settings, 'SYNC_USER', getpass.getuser())
-        MULTIPLE_APP_SERVERS = getattr(settings, 'MULTIPLE_APP_SERVERS', [])
         if not file:
             path += "/"
         log.info("Remote Copy %s to %s" % (path, target))
-        for server in MULTIPLE_APP_SERVERS:
-            if not file:
-                mkdir_cmd = "ssh {user}@{server} mkdir -p {target}".format(
-                    user=SYNC_USER, server=server, target=target
-                )
-                ret = os.system(mkdir_cmd)
-                if ret != 0:
-                    log.info("MKDIR ERROR to app servers:")
-                    log.info(mkdir_cmd)
-            # Add a slash when copying directories
-            sync_cmd = "ssh {user}@{server} 'rsync -av --delete {user}@{host}:{path} {target}'".format(
-                host=host,
-                path=path,
-                user=SYNC_USER,
-                server=server,
-                target=target,
-            )
-            ret = os.system(sync_cmd)
-            if ret != 0:
-                log.info("COPY ERROR to app servers.")
-                log.info(sync_cmd)
+        if getattr(settings, 'MULTIPLE_APP_SERVERS', []):
+            queue_or_run(partial(cls.pull_to_server, path, target, host,
+                                 file=file))
+
+    @classmethod
+    def pull_to_server(cls, path, target, host, server, file=False):
+        SYNC_USER = getattr(settings, 'SYNC_USER', getpass.getuser())
+        sync_cmd = "rsync -av --delete {user}@{host}:{path} {target}".format(
+            host=host,
+            path=path,
+            user=SYNC_USER,
+            target=target,
+        )
+        if not file:
+            sync_cmd = "mkdir -p %s && %s" % (target, sync_cmd)
+        ret = run_command(server, sync_cmd)
+        if ret != 0:
+            log.info("COPY ERROR to app servers.")
+            log.info(sync_cmd)
+        return ret
 
 
 class RemotePuller(object):
@@ -118,7 +262,8 @@ class RemotePuller(object):
         log.info("Local Copy %s to %s" % (path, target))
         os.makedirs(target)
         # Add a slash when copying directories
-        sync_cmd = "rsync -e 'ssh -T' -av --delete {user}@{host}:{path} {target}".format(
+        sync_cmd = "rsync -e {ssh} -av --delete {user}@{host}:{path} {target}".format(
+            ssh=pipes.quote('ssh -T %s' % SYNC_SSH_OPTIONS),
             host=host,
             path=path,
             user=SYNC_USER,
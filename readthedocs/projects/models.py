@@ -8,6 +8,8 @@ from django.conf import settings
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
 from django.template.defaultfilters import slugify
 from django.utils.translation import ugettext_lazy as _
 
@@ -16,19 +18,21 @@ from guardian.shortcuts import assign
 from betterversion.better import version_windows, VersionIdentifier
 from builds.constants import LATEST
 from builds.constants import LATEST_VERBOSE_NAME
+from core.resolver import invalidate_availability, invalidate_project
 from oauth import utils as oauth_utils
 from privacy.loader import RelatedProjectManager, ProjectManager
 from projects import constants
 from projects.exceptions import ProjectImportError
 from projects.templatetags.projects_tags import sort_version_aware
 from projects.utils import (highest_version as _highest, make_api_version,
-                            symlink, update_static_metadata)
+                            symlink, update_static_metadata,
+                            get_downloads_manifest)
 from taggit.managers import TaggableManager
 from tastyapi.slum import api
 
 from vcs_support.base import VCSProject
 from vcs_support.backends import backend_cls
-from vcs_support.utils import Lock, NonBlockingLock
+from vcs_support.loader import RepoLock, RepoNonBlockingLock
 
 
 log = logging.getLogger(__name__)
@@ -264,6 +268,11 @@ class Project(models.Model):
             if self.slug == '':
                 raise Exception(_("Model must have slug"))
         super(Project, self).save(*args, **kwargs)
+        invalidate_project(self.slug)
+        if self.main_language_project_id:
+            # The main project's footer lists its translations
+            invalidate_project(self.main_language_project.slug)
+        invalidate_availability(self)
         for owner in self.users.all():
             assign('view_project', owner, self)
         try:
@@ -447,6 +456,28 @@ class Project(models.Model):
     def venv_path(self, version=LATEST):
         return os.path.join(self.doc_path, 'envs', version)
 
+    def build_log_path(self, version=LATEST, build=None):
+        """
+        The path to the log of the full output of the build ``build`` of a
+        version. Builds that aren't recorded share one log.
+        """
+        return os.path.join(self.doc_path, 'build_logs', version,
+                            '%s.log' % (build or 'unrecorded'))
+
+    @property
+    def mirror_path(self):
+        """
+        The path to the bare mirror the version checkouts are cloned from,
+        when ``GIT_MIRROR_CHECKOUTS`` is set.
+        """
+        return os.path.join(self.doc_path, 'mirror.git')
+
+    def doctree_path(self, version=LATEST):
+        """
+        The path to the Sphinx doctrees kept between builds of a version.
+        """
+        return os.path.join(self.doc_path, 'doctrees', version)
+
     #
     # Paths for symlinks in project doc_path.
     #
@@ -562,6 +593,18 @@ class Project(models.Model):
         """
         return os.path.join(self.doc_path, 'metadata.json')
 
+    def search_manifest_path(self, version=LATEST):
+        """
+        The path to the manifest of the pages indexed for search
+        """
+        return os.path.join(self.doc_path, 'search_manifests', '%s.json' % version)
+
+    def downloads_manifest_path(self, version=LATEST):
+        """
+        The path to the manifest of the downloadable files of a version
+        """
+        return os.path.join(self.doc_path, 'downloads_manifests', '%s.json' % version)
+
     def conf_file(self, version=LATEST):
         if self.conf_py_file:
             conf_path = os.path.join(self.checkout_path(version), self.conf_py_file)
@@ -612,26 +655,33 @@ class Project(models.Model):
         return self.aliases.exists()
 
     def has_pdf(self, version_slug=LATEST):
-        return os.path.exists(self.get_production_media_path(type='pdf', version_slug=version_slug))
+        return 'pdf' in get_downloads_manifest(self, version_slug)
 
     def has_epub(self, version_slug=LATEST):
-        return os.path.exists(self.get_production_media_path(type='epub', version_slug=version_slug))
+        return 'epub' in get_downloads_manifest(self, version_slug)
 
     def has_htmlzip(self, version_slug=LATEST):
-        return os.path.exists(self.get_production_media_path(type='htmlzip', version_slug=version_slug))
+        return 'htmlzip' in get_downloads_manifest(self, version_slug)
 
     @property
     def sponsored(self):
         return False
 
     def vcs_repo(self, version=LATEST):
+        # The backend of each version is kept, as it memoizes repo metadata
+        if not hasattr(self, '_vcs_repos'):
+            self._vcs_repos = {}
+        key = (self.repo_type, self.repo, version)
+        if key in self._vcs_repos:
+            return self._vcs_repos[key]
         backend = backend_cls.get(self.repo_type)
         if not backend:
             repo = None
         else:
             proj = VCSProject(
                 self.name, self.default_branch, self.checkout_path(version), self.clean_repo)
-            repo = backend(proj, version)
+            repo = backend(proj, version, mirror_path=self.mirror_path)
+        self._vcs_repos[key] = repo
         return repo
 
     @property
@@ -646,10 +696,10 @@ class Project(models.Model):
         return cb
 
     def repo_nonblockinglock(self, version, max_lock_age=5):
-        return NonBlockingLock(project=self, version=version, max_lock_age=max_lock_age)
+        return RepoNonBlockingLock(project=self, version=version, max_lock_age=max_lock_age)
 
     def repo_lock(self, version, timeout=5, polling_interval=5):
-        return Lock(self, version, timeout, polling_interval)
+        return RepoLock(self, version, timeout, polling_interval)
 
     def find(self, file, version):
         """
@@ -700,7 +750,8 @@ class Project(models.Model):
     def ordered_active_versions(self):
         from builds.models import Version
         versions = Version.objects.public(project=self, only_active=True)
-        return sort_version_aware(versions)
+        # Like sort_version_aware, which keeps the default ordering on ties
+        return versions.order_by('-sort_key', '-verbose_name')
 
     def all_active_versions(self):
         """A temporary workaround for active_versions filtering out things
@@ -824,6 +875,18 @@ class Project(models.Model):
             node = self.nodes.create(version=version, page=page, hash=hash, commit=commit)
         return node.comments.create(user=user, text=text)
 
+
+@receiver(post_delete, sender=Project)
+def invalidate_deleted_project(sender, instance, **kwargs):
+    invalidate_project(instance.slug)
+    try:
+        invalidate_availability(instance)
+    except Project.DoesNotExist:
+        # Deleted along with its main project, which invalidates itself.
+        # Only drop the matrix of this translation.
+        invalidate_availability(Project(slug=instance.slug))
+
+
 class ImportedFile(models.Model):
     project = models.ForeignKey('Project', verbose_name=_('Project'),
                                 related_name='imported_files')
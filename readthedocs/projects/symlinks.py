@@ -4,7 +4,7 @@ import logging
 from django.conf import settings
 import redis
 
-from core.utils import run_on_app_servers
+from core.utils import redis_client, run_on_app_servers
 from projects.constants import LOG_TEMPLATE
 from tastyapi import apiv2
 
@@ -21,7 +21,7 @@ def symlink_cnames(version):
               HOME/user_builds/<project>/
     """
     try:
-        redis_conn = redis.Redis(**settings.REDIS)
+        redis_conn = redis_client()
         cnames = redis_conn.smembers('rtd_slug:v1:%s' % version.project.slug)
     except redis.ConnectionError:
         log.error(LOG_TEMPLATE.format(project=version.project.slug, version=version.slug, msg='Failed to symlink cnames, Redis error.'), exc_info=True)
@@ -2,6 +2,7 @@
 ``conf.py`` files, and rebuilding documentation.
 """
 import fnmatch
+import hashlib
 import os
 import shutil
 import json
@@ -9,6 +10,7 @@ import logging
 import socket
 import requests
 import datetime
+from multiprocessing.pool import ThreadPool
 
 from celery import task
 from django.conf import settings
@@ -18,21 +20,29 @@ from slumber.exceptions import HttpClientError
 
 from builds.constants import LATEST
 from builds.models import Build, Version
+from builds.scheduler import release_build
+from core.resolver import invalidate_project, update_availability
 from core.utils import send_email, run_on_app_servers
 from doc_builder.loader import get_builder_class
 from doc_builder.base import restoring_chdir
 from doc_builder.environments import DockerEnvironment
 from projects.exceptions import ProjectImportError
 from projects.models import ImportedFile, Project
-from projects.utils import run, make_api_version, make_api_project
+from projects.utils import (run, make_api_version, make_api_project,
+                            build_downloads_manifest, save_downloads_manifest,
+                            invalidate_downloads_manifest,
+                            environment_fingerprint, open_build_log,
+                            close_build_log, file_md5)
 from projects.constants import LOG_TEMPLATE
 from builds.constants import STABLE
 from projects import symlinks
+from privacy.backends.syncers import sync_batch
 from privacy.loader import Syncer
 from tastyapi import api, apiv2
-from search.parse_json import process_all_json_files
-from search.utils import process_mkdocs_json
-from restapi.utils import index_search_request
+from search.utils import (load_search_manifest, save_search_manifest,
+                          process_changed_json_files)
+from restapi.utils import (index_search_request, delete_search_pages,
+                           delete_search_sections)
 from vcs_support import utils as vcs_support_utils
 import tastyapi
 
@@ -44,14 +54,45 @@ except:
 
 log = logging.getLogger(__name__)
 
+DOC_BUILDER_REQUIREMENTS = [
+    'sphinx==1.3.1',
+    'Pygments==2.0.2',
+    'virtualenv==1.10.1',
+    'setuptools==1.1',
+    'docutils==0.11',
+    'mkdocs==0.13.3',
+    'mock==1.0.1',
+    'pillow==2.6.1',
+    'readthedocs-sphinx-ext==0.5.4',
+    'sphinx-rtd-theme==0.1.8',
+    'alabaster>=0.7,<0.8,!=0.7.5',
+    'recommonmark==0.1.1',
+    'wheel==0.24.0',
+]
+# Holds the fingerprint of the requirements installed in a virtualenv
+ENVIRONMENT_MARKER = '.rtd-environment'
+# Project settings the output of a build depends on
+BUILD_FINGERPRINT_FIELDS = (
+    'name', 'documentation_type', 'conf_py_file', 'requirements_file',
+    'python_interpreter', 'use_system_packages', 'use_virtualenv', 'theme',
+    'suffix', 'copyright', 'enable_pdf_build', 'enable_epub_build',
+    'single_version', 'language', 'analytics_code', 'canonical_url',
+    'allow_comments', 'default_branch', 'default_version',
+)
+
 HTML_ONLY = getattr(settings, 'HTML_ONLY_PROJECTS', ())
+# Holds the build fields as last sent to the API
+RECORDED_KEY = '_recorded'
+# Store a checksum of each ImportedFile's contents
+IMPORTED_FILE_MD5 = getattr(settings, 'IMPORTED_FILE_MD5', False)
+IMPORTED_FILE_BATCH_SIZE = 500
 
 
 @task(default_retry_delay=7 * 60, max_retries=5)
 @restoring_chdir
 def update_docs(pk, version_pk=None, build_pk=None, record=True, docker=False,
                 search=True, force=False, intersphinx=True, localmedia=True,
-                api=None, basic=False, **kwargs):
+                api=None, basic=False, queued=False, **kwargs):
     """
     The main entry point for updating documentation.
 
@@ -66,6 +107,14 @@ def update_docs(pk, version_pk=None, build_pk=None, record=True, docker=False,
         for preventing changes visible to the end-user when running commands
         from the shell, for example.
 
+    `force`
+        Whether a user asked for the build. Forced builds never reuse the
+        output of an earlier build, see ``reuse_build``. Webhooks don't force.
+
+    `queued`
+        Whether the build was started by the build queue of the version. The
+        next queued build is started when this one finishes.
+
     """
     # Dependency injection to allow for testing
     if api is None:
@@ -75,23 +124,30 @@ def update_docs(pk, version_pk=None, build_pk=None, record=True, docker=False,
         apiv2 = api
 
     start_time = datetime.datetime.utcnow()
-    try:
-        project_data = api.project(pk).get()
-    except HttpClientError:
-        log.exception(LOG_TEMPLATE.format(project=pk, version='', msg='Failed to get project data on build. Erroring.'))
-    project = make_api_project(project_data)
-    # Don't build skipped projects
-    if project.skip:
-        log.info(LOG_TEMPLATE.format(project=project.slug, version='', msg='Skipping'))
-        return
-    else:
-        log.info(LOG_TEMPLATE.format(project=project.slug, version='', msg='Building'))
-    version = ensure_version(api, project, version_pk)
-    build = create_build(build_pk)
+    version = None
+    build = {}
     results = {}
+    retrying = False
 
-    # Build Servery stuff
+    # Everything runs in the try, so queued builds are always released
     try:
+        build = create_build(build_pk)
+        try:
+            project_data = api.project(pk).get()
+        except HttpClientError:
+            log.exception(LOG_TEMPLATE.format(project=pk, version='', msg='Failed to get project data on build. Erroring.'))
+            raise
+        project = make_api_project(project_data)
+        # Don't build skipped projects
+        if project.skip:
+            log.info(LOG_TEMPLATE.format(project=project.slug, version='', msg='Skipping'))
+            return
+        else:
+            log.info(LOG_TEMPLATE.format(project=project.slug, version='', msg='Building'))
+        version = ensure_version(api, project, version_pk)
+        open_build_log(project.build_log_path(version.slug, build.get('id')))
+
+        # Build Servery stuff
         record_build(api=api, build=build, record=record, results=results, state='cloning')
         vcs_results = setup_vcs(version, build, api)
         if vcs_results:
@@ -100,19 +156,34 @@ def update_docs(pk, version_pk=None, build_pk=None, record=True, docker=False,
         if project.documentation_type == 'auto':
             update_documentation_type(version, apiv2)
 
-        if docker or settings.DOCKER_ENABLE:
-            record_build(api=api, build=build, record=record, results=results, state='building')
-            docker = DockerEnvironment(version)
-            build_results = docker.build()
-            results.update(build_results)
-        else:
-            record_build(api=api, build=build, record=record, results=results, state='installing')
-            setup_results = setup_environment(version)
-            results.update(setup_results)
+        fingerprint = build_fingerprint(version, build.get('commit'),
+                                        search=search, localmedia=localmedia)
+        reused_results = None
+        if fingerprint:
+            build['fingerprint'] = fingerprint
+            if not force:
+                reused_results = reuse_build(version, fingerprint)
 
-            record_build(api=api, build=build, record=record, results=results, state='building')
-            build_results = build_docs(version, force, search, localmedia)
-            results.update(build_results)
+        if reused_results:
+            results.update(reused_results)
+        else:
+            # The artifacts change from here on, whether the build works or not
+            clear_artifact_fingerprints(version)
+            if docker or settings.DOCKER_ENABLE:
+                record_build(api=api, build=build, record=record, results=results, state='building')
+                docker = DockerEnvironment(version)
+                build_results = docker.build()
+                results.update(build_results)
+            else:
+                record_build(api=api, build=build, record=record, results=results, state='installing')
+                setup_results = setup_environment(version)
+                results.update(setup_results)
+
+                record_build(api=api, build=build, record=record, results=results, state='building')
+                build_results = build_docs(version, force, search, localmedia)
+                results.update(build_results)
+            if fingerprint:
+                write_artifact_fingerprints(version, fingerprint, results)
 
     except vcs_support_utils.LockTimeout, e:
         results['checkout'] = (423, "", "Version locked, retrying in 5 minutes.")
@@ -121,22 +192,29 @@ def update_docs(pk, version_pk=None, build_pk=None, record=True, docker=False,
         # http://celery.readthedocs.org/en/3.0/userguide/tasks.html#retrying
         # Should completely retry the task for us until max_retries is exceeded
         update_docs.retry(exc=e, throw=False)
+        retrying = True
     except ProjectImportError, e:
         results['checkout'] = (404, "", 'Failed to import project; skipping build.\n\nError\n-----\n\n%s' % e.message)
         # Close out build in finally with error.
         pass
     except Exception, e:
-        log.error(LOG_TEMPLATE.format(project=version.project.slug,
-                                      version=version.slug, msg="Top-level Build Failure"), exc_info=True)
+        log.error(LOG_TEMPLATE.format(project=version.project.slug if version else pk,
+                                      version=version.slug if version else '',
+                                      msg="Top-level Build Failure"), exc_info=True)
         results['checkout'] = (404, "", 'Top-level Build Failure: %s' % e.message)
     finally:
-        record_build(api=api, build=build, record=record, results=results, state='finished', start_time=start_time)
-        record_pdf(api=api, record=record, results=results, state='finished', version=version)
-        log.info(LOG_TEMPLATE.format(project=version.project.slug, version='', msg='Build finished'))
+        if build:
+            record_build(api=api, build=build, record=record, results=results, state='finished', start_time=start_time)
+        if version is not None:
+            record_pdf(api=api, record=record, results=results, state='finished', version=version)
+        close_build_log()
+        if queued and not retrying:
+            release_build(version_pk, build_pk)
+        log.info(LOG_TEMPLATE.format(project=version.project.slug if version else pk, version='', msg='Build finished'))
 
     build_id = build.get('id')
     # Web Server Tasks
-    if build_id:
+    if build_id and version is not None:
         finish_build.delay(
             version_pk=version.pk,
             build_pk=build_id,
@@ -169,7 +247,7 @@ def update_documentation_type(version, api):
 
     checkout_path = version.project.checkout_path(version.slug)
     os.chdir(checkout_path)
-    files = run('find .')[1].split('\n')
+    files = run('find .', limit=None)[1].split('\n')
     markdown = sphinx = 0
     for filename in files:
         if fnmatch.fnmatch(filename, '*.md') or fnmatch.fnmatch(filename, '*.markdown'):
@@ -197,6 +275,125 @@ def docker_build(version, search=True, force=False, intersphinx=True,
     return results
 
 
+def build_fingerprint(version, commit, search=True, localmedia=True):
+    """
+    Return a digest of what the output of a build of ``version`` depends on.
+
+    This is the checked out commit, the Sphinx or MkDocs configuration, the
+    project settings used by builders, the builders that run and the doc
+    builder requirements. Without a commit there is no fingerprint.
+    """
+    if not commit:
+        return None
+    project = version.project
+    checkout_path = project.checkout_path(version.slug)
+
+    builders = [project.documentation_type]
+    if search:
+        builders.append('search')
+    if 'sphinx' in project.documentation_type:
+        if localmedia:
+            builders.append('localmedia')
+        if project.slug not in HTML_ONLY:
+            if project.enable_pdf_build:
+                builders.append('pdf')
+            if project.enable_epub_build:
+                builders.append('epub')
+
+    if 'mkdocs' in project.documentation_type:
+        config_path = os.path.join(checkout_path, 'mkdocs.yml')
+    else:
+        try:
+            config_path = project.conf_file(version.slug)
+        except ProjectImportError:
+            config_path = None
+    config = None
+    if config_path:
+        try:
+            with open(config_path, 'rb') as f:
+                config = hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            pass
+
+    fields = [getattr(project, field, None) for field in BUILD_FINGERPRINT_FIELDS]
+    return hashlib.sha1(json.dumps(
+        [commit, config, fields, builders, DOC_BUILDER_REQUIREMENTS],
+        default=unicode,
+    )).hexdigest()
+
+
+def reuse_build(version, fingerprint):
+    """
+    Return the results of a build reusing the artifacts of ``version`` on
+    disk, or ``None``.
+
+    Artifacts are only reused if the build that made them had the same
+    ``fingerprint``, see ``write_artifact_fingerprints``. Steps whose
+    artifacts can't be reused are reported as failed, like they were in
+    that build.
+    """
+    project = version.project
+    artifact_types = _artifact_types(project)
+    if _artifact_fingerprint(version, artifact_types['html']) != fingerprint:
+        return None
+
+    msg = 'Unchanged since the last build, reusing its output'
+    log.info(LOG_TEMPLATE.format(project=project.slug, version=version.slug, msg=msg))
+    results = {}
+    for step, artifact_type in artifact_types.items():
+        if _artifact_fingerprint(version, artifact_type) == fingerprint:
+            results[step] = (0, msg, '')
+    return results
+
+
+def write_artifact_fingerprints(version, fingerprint, results):
+    """
+    Record that the artifacts of the successful steps in ``results`` were
+    built with ``fingerprint``.
+
+    The fingerprint is stored next to each artifact directory, so it isn't
+    copied along with the artifacts.
+    """
+    for step, artifact_type in _artifact_types(version.project).items():
+        if results.get(step, [404])[0] != 0:
+            continue
+        artifact_path = version.project.artifact_path(version=version.slug,
+                                                      type=artifact_type)
+        if os.path.exists(artifact_path):
+            with open(artifact_path + '.fingerprint', 'w') as f:
+                f.write(fingerprint)
+
+
+def clear_artifact_fingerprints(version):
+    for artifact_type in _artifact_types(version.project).values():
+        path = version.project.artifact_path(version=version.slug,
+                                             type=artifact_type)
+        if os.path.exists(path + '.fingerprint'):
+            os.remove(path + '.fingerprint')
+
+
+def _artifact_fingerprint(version, artifact_type):
+    path = version.project.artifact_path(version=version.slug,
+                                         type=artifact_type)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path + '.fingerprint') as f:
+            return f.read()
+    except IOError:
+        return None
+
+
+def _artifact_types(project):
+    if 'mkdocs' in project.documentation_type:
+        return {'html': project.documentation_type, 'search': 'mkdocs_json'}
+    return {'html': project.documentation_type,
+            'search': 'sphinx_search',
+            'localmedia': 'sphinx_localmedia',
+            'pdf': 'sphinx_pdf',
+            'epub': 'sphinx_epub'}
+
+
 def setup_vcs(version, build, api):
     """
     Update the checkout of the repo to make sure it's the latest.
@@ -297,7 +494,10 @@ def setup_environment(version):
     """
     Build the virtualenv and install the project into it.
 
-    Always build projects with a virtualenv.
+    Always build projects with a virtualenv. The fingerprint of the
+    interpreter and requirements is stored in the virtualenv, and a
+    virtualenv with the same fingerprint is reused as is. Wheels built for
+    project requirements are kept in a shared wheel cache.
     """
     ret_dict = {}
     project = version.project
@@ -305,6 +505,73 @@ def setup_environment(version):
     if os.path.exists(build_dir):
         log.info(LOG_TEMPLATE.format(project=project.slug, version=version.slug, msg='Removing existing build dir'))
         shutil.rmtree(build_dir)
+
+    # Handle requirements
+
+    requirements_file_path = project.requirements_file
+    checkout_path = project.checkout_path(version.slug)
+    if not requirements_file_path:
+        builder_class = get_builder_class(project.documentation_type)
+        docs_dir = builder_class(version).docs_dir()
+        for path in [docs_dir, '']:
+            for req_file in ['pip_requirements.txt', 'requirements.txt']:
+                test_path = os.path.join(checkout_path, path, req_file)
+                print('Testing %s' % test_path)
+                if os.path.exists(test_path):
+                    requirements_file_path = test_path
+                    break
+
+    fingerprint = environment_fingerprint(
+        project, DOC_BUILDER_REQUIREMENTS,
+        os.path.join(checkout_path, requirements_file_path)
+        if requirements_file_path else None)
+    # Installing changes the working directory
+    marker_path = os.path.abspath(os.path.join(
+        project.venv_path(version=version.slug), ENVIRONMENT_MARKER))
+    try:
+        with open(marker_path) as f:
+            reuse = (getattr(settings, 'REUSE_BUILD_ENVIRONMENTS', True) and
+                     f.read() == fingerprint)
+    except IOError:
+        reuse = False
+
+    if reuse:
+        log.info(LOG_TEMPLATE.format(project=project.slug, version=version.slug,
+                                     msg='Reusing environment %s' % fingerprint))
+        ret_dict['venv'] = (0, 'Reusing environment %s' % fingerprint, '')
+    else:
+        if os.path.exists(marker_path):
+            os.remove(marker_path)
+        ret_dict.update(create_environment(version, requirements_file_path))
+        if all(ret_dict[step][0] == 0 for step in ret_dict):
+            with open(marker_path, 'w') as f:
+                f.write(fingerprint)
+
+    # Handle setup.py
+
+    os.chdir(project.checkout_path(version.slug))
+    if os.path.isfile("setup.py"):
+        if getattr(settings, 'USE_PIP_INSTALL', False):
+            ret_dict['install'] = run(
+                '{cmd} install --ignore-installed .'.format(
+                    cmd=project.venv_bin(version=version.slug, bin='pip')))
+        else:
+            ret_dict['install'] = run(
+                '{cmd} setup.py install --force'.format(
+                    cmd=project.venv_bin(version=version.slug,
+                                         bin='python')))
+    else:
+        ret_dict['install'] = (999, "", "No setup.py, skipping install")
+    return ret_dict
+
+
+def create_environment(version, requirements_file_path=None):
+    """
+    Create the virtualenv of ``version`` and install the doc builder and the
+    project's requirements into it.
+    """
+    ret_dict = {}
+    project = version.project
     if project.use_system_packages:
         site_packages = '--system-site-packages'
     else:
@@ -328,71 +595,44 @@ def setup_environment(version):
     else:
         ignore_option = ''
 
-    requirements = ' '.join([
-        'sphinx==1.3.1',
-        'Pygments==2.0.2',
-        'virtualenv==1.10.1',
-        'setuptools==1.1',
-        'docutils==0.11',
-        'mkdocs==0.13.3',
-        'mock==1.0.1',
-        'pillow==2.6.1',
-        'readthedocs-sphinx-ext==0.5.4',
-        'sphinx-rtd-theme==0.1.8',
-        'alabaster>=0.7,<0.8,!=0.7.5',
-        'recommonmark==0.1.1',
-    ])
-
     wheeldir = os.path.join(settings.SITE_ROOT, 'deploy', 'wheels')
+    wheel_cache = getattr(settings, 'WHEEL_CACHE_PATH',
+                          os.path.join(settings.SITE_ROOT, 'wheel_cache'))
+    if not os.path.exists(wheel_cache):
+        os.makedirs(wheel_cache)
     ret_dict['doc_builder'] = run(
         (
-            '{cmd} install --use-wheel --find-links={wheeldir} -U '
-            '{ignore_option} {requirements}'
+            '{cmd} install --use-wheel --find-links={wheeldir} '
+            '--find-links={wheel_cache} -U {ignore_option} {requirements}'
         ).format(
             cmd=project.venv_bin(version=version.slug, bin='pip'),
             ignore_option=ignore_option,
             wheeldir=wheeldir,
-            requirements=requirements,
+            wheel_cache=wheel_cache,
+            requirements=' '.join(DOC_BUILDER_REQUIREMENTS),
         )
     )
 
-    # Handle requirements
-
-    requirements_file_path = project.requirements_file
-    checkout_path = project.checkout_path(version.slug)
-    if not requirements_file_path:
-        builder_class = get_builder_class(project.documentation_type)
-        docs_dir = builder_class(version).docs_dir()
-        for path in [docs_dir, '']:
-            for req_file in ['pip_requirements.txt', 'requirements.txt']:
-                test_path = os.path.join(checkout_path, path, req_file)
-                print('Testing %s' % test_path)
-                if os.path.exists(test_path):
-                    requirements_file_path = test_path
-                    break
-
     if requirements_file_path:
-        os.chdir(checkout_path)
+        os.chdir(project.checkout_path(version.slug))
+        # Build wheels of the requirements missing from the cache, so later
+        # environments install them without downloading or compiling.
+        # Requirements that can't be built as wheels are installed below.
+        wheel_ret = run(
+            '{cmd} wheel --wheel-dir={wheel_cache} --find-links={wheel_cache} '
+            '-r {requirements}'.format(
+                cmd=project.venv_bin(version=version.slug, bin='pip'),
+                wheel_cache=wheel_cache,
+                requirements=requirements_file_path))
+        if wheel_ret[0] != 0:
+            log.info(LOG_TEMPLATE.format(project=project.slug, version=version.slug,
+                                         msg='Unable to cache requirement wheels'))
         ret_dict['requirements'] = run(
-            '{cmd} install --exists-action=w -r {requirements}'.format(
+            '{cmd} install --exists-action=w --use-wheel '
+            '--find-links={wheel_cache} -r {requirements}'.format(
                 cmd=project.venv_bin(version=version.slug, bin='pip'),
+                wheel_cache=wheel_cache,
                 requirements=requirements_file_path))
-
-    # Handle setup.py
-
-    os.chdir(project.checkout_path(version.slug))
-    if os.path.isfile("setup.py"):
-        if getattr(settings, 'USE_PIP_INSTALL', False):
-            ret_dict['install'] = run(
-                '{cmd} install --ignore-installed .'.format(
-                    cmd=project.venv_bin(version=version.slug, bin='pip')))
-        else:
-            ret_dict['install'] = run(
-                '{cmd} setup.py install --force'.format(
-                    cmd=project.venv_bin(version=version.slug,
-                                         bin='python')))
-    else:
-        ret_dict['install'] = (999, "", "No setup.py, skipping install")
     return ret_dict
 
 
@@ -408,13 +648,15 @@ def build_docs(version, force, search, localmedia):
     before_build.send(sender=version)
 
     with project.repo_nonblockinglock(version=version,
-                                      max_lock_age=getattr(settings, 'REPO_LOCK_SECONDS', 30)):
+                                      max_lock_age=getattr(settings, 'REPO_LOCK_SECONDS', 30)) as lock:
         html_builder = get_builder_class(project.documentation_type)(version)
         if force:
             html_builder.force()
         html_builder.append_conf()
         results['html'] = html_builder.build()
         if results['html'][0] == 0:
+            # Don't overwrite the output of a build that took over the lock
+            lock.check()
             html_builder.move()
 
         # Gracefully attempt to move files via task on web workers.
@@ -429,64 +671,92 @@ def build_docs(version, force, search, localmedia):
 
         fake_results = (999, "Project Skipped, Didn't build",
                         "Project Skipped, Didn't build")
+        # Builders that only depend on the sources, as tuples of the result
+        # key, builder type and whether to move the output even on failure
+        builders = []
         if 'mkdocs' in project.documentation_type:
             if search:
-                try:
-                    search_builder = get_builder_class('mkdocs_json')(version)
-                    results['search'] = search_builder.build()
-                    if results['search'][0] == 0:
-                        search_builder.move()
-                except:
-                    log.error(LOG_TEMPLATE.format(
-                        project=project.slug, version=version.slug, msg="JSON Build Error"), exc_info=True)
+                builders.append(('search', 'mkdocs_json', False))
 
         if 'sphinx' in project.documentation_type:
             # Search builder. Creates JSON from docs and sends it to the
             # server.
             if search:
-                try:
-                    search_builder = get_builder_class('sphinx_search')(version)
-                    results['search'] = search_builder.build()
-                    if results['search'][0] == 0:
-                        # Copy json for safe keeping
-                        search_builder.move()
-                except:
-                    log.error(LOG_TEMPLATE.format(
-                        project=project.slug, version=version.slug, msg="JSON Build Error"), exc_info=True)
+                builders.append(('search', 'sphinx_search', False))
             # Local media builder for singlepage HTML download archive
             if localmedia:
-                try:
-                    localmedia_builder = get_builder_class('sphinx_singlehtmllocalmedia')(version)
-                    results['localmedia'] = localmedia_builder.build()
-                    if results['localmedia'][0] == 0:
-                        localmedia_builder.move()
-                except:
-                    log.error(LOG_TEMPLATE.format(
-                        project=project.slug, version=version.slug, msg="Local Media HTML Build Error"), exc_info=True)
+                builders.append(('localmedia', 'sphinx_singlehtmllocalmedia', False))
 
             # Optional build steps
             if version.project.slug not in HTML_ONLY and not project.skip:
                 if project.enable_pdf_build:
-                    pdf_builder = get_builder_class('sphinx_pdf')(version)
-                    results['pdf'] = pdf_builder.build()
                     # Always move pdf results even when there's an error.
-                    # if pdf_results[0] == 0:
-                    pdf_builder.move()
+                    builders.append(('pdf', 'sphinx_pdf', True))
                 else:
                     results['pdf'] = fake_results
                 if project.enable_epub_build:
-                    epub_builder = get_builder_class('sphinx_epub')(version)
-                    results['epub'] = epub_builder.build()
-                    if results['epub'][0] == 0:
-                        epub_builder.move()
+                    builders.append(('epub', 'sphinx_epub', False))
                 else:
                     results['epub'] = fake_results
 
+        results.update(run_builders(
+            version, builders, doctrees=getattr(html_builder, 'doctrees', None)))
+
     after_build.send(sender=version)
 
     return results
 
 
+def run_builders(version, builders, doctrees=None):
+    """
+    Run ``builders`` of ``version`` at the same time and move their output.
+
+    At most ``BUILD_CPU_BUDGET`` builders run at once. Sphinx builders start
+    from a copy of the ``doctrees`` of the HTML build, so the sources are
+    only parsed once. Returns the results by key.
+    """
+    results = {}
+    if not builders:
+        return results
+
+    def build(args):
+        key, builder_type, always_move = args
+        try:
+            builder = get_builder_class(builder_type)(version)
+            if doctrees and hasattr(builder, 'start_from'):
+                builder.start_from(doctrees)
+            return key, builder, builder.build(), always_move
+        except:
+            log.error(LOG_TEMPLATE.format(
+                project=version.project.slug, version=version.slug,
+                msg="%s Build Error" % builder_type), exc_info=True)
+            return key, None, None, False
+
+    jobs = max(1, min(len(builders), getattr(settings, 'BUILD_CPU_BUDGET', 2)))
+    pool = ThreadPool(processes=jobs)
+    try:
+        outputs = pool.map(build, builders)
+    finally:
+        pool.close()
+        pool.join()
+
+    # Moving changes the working directory, so it isn't done in the pool
+    for key, builder, result, always_move in outputs:
+        if builder is None:
+            continue
+        results[key] = result
+        try:
+            if always_move or result[0] == 0:
+                builder.move()
+        except:
+            log.error(LOG_TEMPLATE.format(
+                project=version.project.slug, version=version.slug,
+                msg="Unable to move %s output" % key), exc_info=True)
+        if hasattr(builder, 'clean_doctrees'):
+            builder.clean_doctrees()
+    return results
+
+
 def create_build(build_pk):
     """
     Old placeholder for build creation. Now it just gets it from the database.
@@ -496,6 +766,7 @@ def create_build(build_pk):
         for key in ['project', 'version', 'resource_uri', 'absolute_uri']:
             if key in build:
                 del build[key]
+        build[RECORDED_KEY] = dict(build)
     else:
         build = {}
     return build
@@ -505,6 +776,9 @@ def record_build(api, record, build, results, state, start_time=None):
     """
     Record a build by hitting the API.
 
+    Only the fields that changed since the build was last recorded are
+    sent, so the output of the setup steps isn't sent again with each state.
+
     Returns nothing
     """
 
@@ -568,10 +842,18 @@ def record_build(api, record, build, results, state, start_time=None):
         if isinstance(val, basestring):
             build[key] = val.decode('utf-8', 'ignore')
 
+    recorded = build.get(RECORDED_KEY, {})
+    changes = dict((key, val) for key, val in build.items()
+                   if key != RECORDED_KEY and recorded.get(key, None) != val)
+    if not changes:
+        return
     try:
-        api.build(build['id']).put(build)
+        api.build(build['id']).patch(changes)
     except Exception:
         log.error("Unable to post a new build", exc_info=True)
+    else:
+        recorded.update(changes)
+        build[RECORDED_KEY] = recorded
 
 
 def record_pdf(api, record, results, state, version):
@@ -630,6 +912,8 @@ def finish_build(version_pk, build_pk, hostname=None, html=False,
         version.active = True
         version.built = True
         version.save()
+    invalidate_project(version.project.slug)
+    update_availability(version.project)
 
     move_files(
         version_pk=version_pk,
@@ -641,13 +925,15 @@ def finish_build(version_pk, build_pk, hostname=None, html=False,
         epub=epub,
     )
 
-    symlinks.symlink_cnames(version)
-    symlinks.symlink_translations(version)
-    symlinks.symlink_subprojects(version)
-    if version.project.single_version:
-        symlinks.symlink_single_version(version)
-    else:
-        symlinks.remove_symlink_single_version(version)
+    with sync_batch() as batch:
+        symlinks.symlink_cnames(version)
+        symlinks.symlink_translations(version)
+        symlinks.symlink_subprojects(version)
+        if version.project.single_version:
+            symlinks.symlink_single_version(version)
+        else:
+            symlinks.remove_symlink_single_version(version)
+    log_sync_status(version, 'Symlinks', batch)
 
     # Delayed tasks
     update_static_metadata.delay(version.project.pk)
@@ -657,66 +943,97 @@ def finish_build(version_pk, build_pk, hostname=None, html=False,
         send_notifications.delay(version.pk, build_pk=build.pk)
 
 
+def log_sync_status(version, what, batch):
+    for server, ret in sorted(batch.status.items()):
+        log.info(LOG_TEMPLATE.format(
+            project=version.project.slug, version=version.slug,
+            msg='%s synced to %s: %s' % (what, server or 'local', 'ok' if ret == 0 else 'failed (%s)' % ret)))
+
+
 @task(queue='web')
 def move_files(version_pk, hostname, html=False, localmedia=False, search=False, pdf=False, epub=False):
     version = Version.objects.get(pk=version_pk)
 
-    if html:
-        from_path = version.project.artifact_path(version=version.slug, type=version.project.documentation_type)
-        target = version.project.rtd_build_path(version.slug)
-        Syncer.copy(from_path, target, host=hostname)
+    # Copies to all app servers run in parallel when the batch exits
+    with sync_batch() as batch:
+        if html:
+            from_path = version.project.artifact_path(version=version.slug, type=version.project.documentation_type)
+            target = version.project.rtd_build_path(version.slug)
+            Syncer.copy(from_path, target, host=hostname)
 
-    if 'sphinx' in version.project.documentation_type:
-        if localmedia:
-            from_path = version.project.artifact_path(version=version.slug, type='sphinx_localmedia')
-            to_path = version.project.get_production_media_path(type='htmlzip', version_slug=version.slug, include_file=False)
-            Syncer.copy(from_path, to_path, host=hostname)
-        if search:
-            from_path = version.project.artifact_path(version=version.slug, type='sphinx_search')
-            to_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
-            Syncer.copy(from_path, to_path, host=hostname)
-        # Always move PDF's because the return code lies.
-        if pdf:
-            from_path = version.project.artifact_path(version=version.slug, type='sphinx_pdf')
-            to_path = version.project.get_production_media_path(type='pdf', version_slug=version.slug, include_file=False)
-            Syncer.copy(from_path, to_path, host=hostname)
-        if epub:
-            from_path = version.project.artifact_path(version=version.slug, type='sphinx_epub')
-            to_path = version.project.get_production_media_path(type='epub', version_slug=version.slug, include_file=False)
-            Syncer.copy(from_path, to_path, host=hostname)
-
-    if 'mkdocs' in version.project.documentation_type:
-        if search:
-            from_path = version.project.artifact_path(version=version.slug, type='mkdocs_json')
-            to_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
-            Syncer.copy(from_path, to_path, host=hostname)
+        if 'sphinx' in version.project.documentation_type:
+            if localmedia:
+                from_path = version.project.artifact_path(version=version.slug, type='sphinx_localmedia')
+                to_path = version.project.get_production_media_path(type='htmlzip', version_slug=version.slug, include_file=False)
+                Syncer.copy(from_path, to_path, host=hostname)
+            if search:
+                from_path = version.project.artifact_path(version=version.slug, type='sphinx_search')
+                to_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
+                Syncer.copy(from_path, to_path, host=hostname)
+            # Always move PDF's because the return code lies.
+            if pdf:
+                from_path = version.project.artifact_path(version=version.slug, type='sphinx_pdf')
+                to_path = version.project.get_production_media_path(type='pdf', version_slug=version.slug, include_file=False)
+                Syncer.copy(from_path, to_path, host=hostname)
+            if epub:
+                from_path = version.project.artifact_path(version=version.slug, type='sphinx_epub')
+                to_path = version.project.get_production_media_path(type='epub', version_slug=version.slug, include_file=False)
+                Syncer.copy(from_path, to_path, host=hostname)
+
+        if 'mkdocs' in version.project.documentation_type:
+            if search:
+                from_path = version.project.artifact_path(version=version.slug, type='mkdocs_json')
+                to_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
+                Syncer.copy(from_path, to_path, host=hostname)
+    log_sync_status(version, 'Artifacts', batch)
+
+    manifest = build_downloads_manifest(version.project, version.slug)
+    save_downloads_manifest(version.project, version.slug, manifest)
 
 
 @task(queue='web')
 def update_search(version_pk, commit):
+    """
+    Index the pages of a version that changed since it was last indexed.
 
+    A manifest of page digests is kept per version, so only changed pages are
+    parsed and sent to the index and removed pages are deleted by path.
+    """
     version = Version.objects.get(pk=version_pk)
 
-    if 'sphinx' in version.project.documentation_type:
-        page_list = process_all_json_files(version, build_dir=False)
-    elif 'mkdocs' in version.project.documentation_type:
-        page_list = process_mkdocs_json(version, build_dir=False)
-    else:
+    if not ('sphinx' in version.project.documentation_type or
+            'mkdocs' in version.project.documentation_type):
         log.error('Unknown documentation type: %s' % version.project.documentation_type)
         return
 
-    log_msg = ' '.join([page['path'] for page in page_list])
-    log.info("(Search Index) Sending Data: %s [%s]" % (version.project.slug, log_msg))
-    index_search_request(
-        version=version,
-        page_list=page_list,
-        commit=commit,
-        project_scale=0,
-        page_scale=0,
-        # Don't index sections to speed up indexing.
-        # They aren't currently exposed anywhere.
-        section=False,
-    )
+    manifest = load_search_manifest(version)
+    page_list, new_manifest, removed_paths = process_changed_json_files(
+        version, manifest, build_dir=False)
+
+    if not page_list and not removed_paths:
+        log.info("(Search Index) No changed pages: %s" % version.project.slug)
+        return
+
+    if page_list:
+        log_msg = ' '.join([page['path'] for page in page_list])
+        log.info("(Search Index) Sending Data: %s [%s]" % (version.project.slug, log_msg))
+        if manifest:
+            # Sections removed from a changed page aren't overwritten.
+            delete_search_sections(version, [page['path'] for page in page_list])
+        index_search_request(
+            version=version,
+            page_list=page_list,
+            commit=commit,
+            project_scale=0,
+            page_scale=0,
+            section=True,
+            # Without a manifest we can't know which pages were removed, so
+            # fall back to deleting every page that isn't from this commit.
+            delete=not manifest,
+        )
+    if manifest and removed_paths:
+        delete_search_pages(version, removed_paths)
+    save_search_manifest(version, new_manifest)
 
 
 @task(queue='web')
@@ -725,7 +1042,6 @@ def fileify(version_pk, commit):
     Create ImportedFile objects for all of a version's files.
 
     This is a prereq for indexing the docs for search.
-    It also causes celery-haystack to kick off an index of the file.
     """
     version = Version.objects.get(pk=version_pk)
     project = version.project
@@ -738,26 +1054,85 @@ def fileify(version_pk, commit):
     if path:
         log.info(LOG_TEMPLATE.format(
             project=project.slug, version=version.slug, msg='Creating ImportedFiles'))
+        files = {}
         for root, dirnames, filenames in os.walk(path):
             for filename in filenames:
                 if fnmatch.fnmatch(filename, '*.html'):
                     dirpath = os.path.join(root.replace(path, '').lstrip('/'),
                                            filename.lstrip('/'))
-                    obj, created = ImportedFile.objects.get_or_create(
-                        project=project,
-                        version=version,
-                        path=dirpath,
-                        name=filename,
-                        commit=commit,
-                    )
-                    if not created:
-                        obj.save()
-        # Delete ImportedFiles from previous versions
-        ImportedFile.objects.filter(project=project, version=version).exclude(commit=commit).delete()
+                    files[dirpath] = os.path.join(root, filename)
+        stats = sync_imported_files(version, commit, files)
+        log.info(LOG_TEMPLATE.format(
+            project=project.slug, version=version.slug,
+            msg='ImportedFiles synced: %(created)s created, %(updated)s updated, '
+                '%(deleted)s deleted' % stats))
     else:
         log.info(LOG_TEMPLATE.format(project=project.slug, version=version.slug, msg='No ImportedFile files'))
 
 
+def sync_imported_files(version, commit, files, md5=None):
+    """
+    Sync the ImportedFile objects of ``version`` with ``files``.
+
+    ``files`` maps the path of each built file to its location on disk. The
+    existing rows are read once, new files are created in bulk, and the
+    commit of the others is updated and the files that weren't built are
+    deleted with one query per batch. With ``md5``, which defaults to
+    ``IMPORTED_FILE_MD5``, a checksum of each file is stored, and files whose
+    contents changed are recreated.
+
+    Returns the number of ``created``, ``updated`` and ``deleted`` rows.
+    """
+    if md5 is None:
+        md5 = IMPORTED_FILE_MD5
+    project = version.project
+    queryset = ImportedFile.objects.filter(project=project, version=version)
+
+    existing = {}
+    for pk, path, old_commit, old_md5 in queryset.values_list(
+            'pk', 'path', 'commit', 'md5'):
+        existing.setdefault(path, []).append((pk, old_commit, old_md5))
+
+    new_files = []
+    updated = []
+    for path, filename in files.items():
+        checksum = file_md5(filename) if md5 else ''
+        rows = existing.get(path)
+        if rows and len(rows) == 1 and (not md5 or rows[0][2] == checksum):
+            pk, old_commit, old_md5 = rows[0]
+            if old_commit != commit:
+                updated.append(pk)
+            else:
+                # Already synced, keep it out of the stale files below
+                existing.pop(path)
+            continue
+        new_files.append(ImportedFile(
+            project=project,
+            version=version,
+            path=path,
+            name=os.path.basename(path),
+            commit=commit,
+            md5=checksum,
+        ))
+
+    # Everything that isn't current, including duplicated and changed files
+    stale = list(set(pk for path, rows in existing.items()
+                     for pk, old_commit, old_md5 in rows) - set(updated))
+    for index in range(0, len(stale), IMPORTED_FILE_BATCH_SIZE):
+        batch = stale[index:index + IMPORTED_FILE_BATCH_SIZE]
+        ImportedFile.objects.filter(pk__in=batch).delete()
+    for index in range(0, len(updated), IMPORTED_FILE_BATCH_SIZE):
+        batch = updated[index:index + IMPORTED_FILE_BATCH_SIZE]
+        ImportedFile.objects.filter(pk__in=batch).update(commit=commit)
+    ImportedFile.objects.bulk_create(new_files,
+                                     batch_size=IMPORTED_FILE_BATCH_SIZE)
+    return {
+        'created': len(new_files),
+        'updated': len(updated),
+        'deleted': len(stale),
+    }
+
+
 @task(queue='web')
 def send_notifications(version_pk, build_pk):
     version = Version.objects.get(pk=version_pk)
@@ -892,7 +1267,11 @@ def remove_dir(path):
 def clear_artifacts(version_pk):
     """ Remove artifacts from the web servers. """
     version = Version.objects.get(pk=version_pk)
-    run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='pdf', version_slug=version.slug))
-    run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='epub', version_slug=version.slug))
-    run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='htmlzip', version_slug=version.slug))
-    run_on_app_servers('rm -rf %s' % version.project.rtd_build_path(version=version.slug))
+    with sync_batch():
+        run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='pdf', version_slug=version.slug))
+        run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='epub', version_slug=version.slug))
+        run_on_app_servers('rm -rf %s' % version.project.get_production_media_path(type='htmlzip', version_slug=version.slug))
+        run_on_app_servers('rm -rf %s' % version.project.rtd_build_path(version=version.slug))
+        # Otherwise the deleted files are still listed as downloads
+        run_on_app_servers('rm -f %s' % version.project.downloads_manifest_path(version.slug))
+    invalidate_downloads_manifest(version.project, version.slug)
@@ -1,7 +1,7 @@
 from django import template
 
 from distutils2.version import NormalizedVersion
-from projects.utils import mkversion
+from projects.utils import mkversion, version_sort_key
 from builds.constants import LATEST
 from builds.constants import STABLE
 
@@ -24,9 +24,12 @@ def make_version(version):
 def sort_version_aware(versions):
     """
     Takes a list of versions objects and sort them caring about version schemes
+
+    The precomputed ``sort_key`` of the versions is used when they have one.
     """
     sorted_verisons = sorted(versions,
-                             key=make_version,
+                             key=lambda version: (getattr(version, 'sort_key', None) or
+                                                  version_sort_key(version.slug)),
                              reverse=True)
     return sorted_verisons
 
@@ -1,22 +1,36 @@
 """Utility functions used by projects.
 """
 import fnmatch
+import hashlib
+import json
 import os
 import re
 import subprocess
+import threading
 import traceback
 import logging
+from collections import deque
 from httplib2 import Http
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models.query import QuerySet
 from distutils2.version import NormalizedVersion, suggest_normalized_version
 import redis
 
-from builds.constants import LATEST
+from builds.constants import LATEST, STABLE
 
 
 log = logging.getLogger(__name__)
 
+DOWNLOAD_TYPES = ('pdf', 'htmlzip', 'epub')
+DOWNLOADS_CACHE_KEY = 'downloads:v1:%s:%s'
+DOWNLOADS_CACHE_TIMEOUT = getattr(settings, 'DOWNLOADS_CACHE_TIMEOUT', 60 * 60 * 24)
+# Bytes of each output stream of a command kept in memory and reported
+BUILD_OUTPUT_LIMIT = getattr(settings, 'BUILD_OUTPUT_LIMIT', 256 * 1024)
+# Logs of previous builds of a version kept next to the current one
+BUILD_LOG_BACKUPS = getattr(settings, 'BUILD_LOG_BACKUPS', 3)
+
 def version_from_slug(slug, version):
     from projects import tasks
     from builds.models import Version
@@ -61,7 +75,11 @@ def run(*commands, **kwargs):
     chaining them together with ``&&``; if all commands succeed, then
     ``(status, out, err)`` will represent the last successful command.
     If one command failed, then ``(status, out, err)`` will represent
-    the failed command.
+    the failed command. Commands run in the ``cwd`` keyword argument, or
+    in the current directory.
+
+    Only the last ``limit`` bytes of each output stream are returned, see
+    ``capture_output``. Callers that parse the output pass ``limit=None``.
     """
     environment = os.environ.copy()
     environment['READTHEDOCS'] = 'True'
@@ -69,10 +87,11 @@ def run(*commands, **kwargs):
         del environment['DJANGO_SETTINGS_MODULE']
     if 'PYTHONPATH' in environment:
         del environment['PYTHONPATH']
-    cwd = os.getcwd()
+    cwd = kwargs.get('cwd') or os.getcwd()
     if not commands:
         raise ValueError("run() requires one or more command-line strings")
     shell = kwargs.get('shell', False)
+    limit = kwargs.get('limit', BUILD_OUTPUT_LIMIT)
 
     for command in commands:
         if shell:
@@ -86,7 +105,8 @@ def run(*commands, **kwargs):
                                  stdout=subprocess.PIPE,
                                  stderr=subprocess.PIPE, env=environment)
 
-            out, err = p.communicate()
+            write_build_log('$ %s\n' % command)
+            out, err = capture_output(p, limit=limit)
             ret = p.returncode
         except:
             out = ''
@@ -97,6 +117,158 @@ def run(*commands, **kwargs):
     return (ret, out, err)
 
 
+class OutputTail(object):
+
+    """
+    The last ``limit`` bytes of a stream, or all of it if ``limit`` is
+    ``None``. The number of bytes dropped is noted before the output.
+    """
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.chunks = deque()
+        self.size = 0
+        self.truncated = 0
+
+    def write(self, data):
+        self.chunks.append(data)
+        self.size += len(data)
+        if self.limit is None:
+            return
+        # Drop whole chunks as long as the rest holds the limit
+        while self.size - len(self.chunks[0]) >= self.limit:
+            dropped = self.chunks.popleft()
+            self.size -= len(dropped)
+            self.truncated += len(dropped)
+
+    def getvalue(self):
+        data = ''.join(self.chunks)
+        truncated = self.truncated
+        if self.limit is not None and len(data) > self.limit:
+            truncated += len(data) - self.limit
+            data = data[-self.limit:] if self.limit else ''
+        if truncated:
+            data = '[%s bytes of output truncated]\n%s' % (truncated, data)
+        return data
+
+
+class BuildLog(object):
+
+    """
+    The file the full output of the commands of a build is written to.
+
+    Each build has its own log, so a build never touches the log of another
+    build running at the same time. Of the other ``.log`` files in the same
+    directory, only the ``backups`` most recent are kept.
+    """
+
+    def __init__(self, path, backups=BUILD_LOG_BACKUPS):
+        self.path = path
+        self._lock = threading.Lock()
+        dirname = os.path.dirname(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        self._file = open(path, 'wb')
+        self._remove_old_logs(dirname, backups)
+
+    def _remove_old_logs(self, dirname, backups):
+        logs = [os.path.join(dirname, name) for name in os.listdir(dirname)
+                if name.endswith('.log') and name != os.path.basename(self.path)]
+        logs.sort(key=_mtime, reverse=True)
+        for old_log in logs[backups:]:
+            try:
+                os.remove(old_log)
+            except OSError:
+                # Removed by another build
+                pass
+
+    def write(self, data):
+        with self._lock:
+            if not self._file.closed:
+                self._file.write(data)
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+def _mtime(path):
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+
+# The log of the build running in this process, written to by all threads
+_build_log = None
+
+
+def open_build_log(path):
+    """
+    Start writing the output of the commands run to the log at ``path``.
+    """
+    global _build_log
+    close_build_log()
+    _build_log = BuildLog(path)
+    return _build_log
+
+
+def close_build_log():
+    global _build_log
+    if _build_log is not None:
+        _build_log.close()
+        _build_log = None
+
+
+def write_build_log(data):
+    build_log = _build_log
+    if build_log is not None:
+        build_log.write(data)
+
+
+def _read_stream(stream, tail):
+    for chunk in iter(lambda: os.read(stream.fileno(), 64 * 1024), ''):
+        tail.write(chunk)
+        write_build_log(chunk)
+    stream.close()
+
+
+def capture_output(process, cmd_input=None, limit=BUILD_OUTPUT_LIMIT):
+    """
+    Wait for ``process`` and return the tails of its stdout and stderr.
+
+    Unlike ``communicate()``, output is streamed: only the last ``limit``
+    bytes of each stream are kept in memory, and the whole output is
+    written to the current build log. Streams that aren't pipes are
+    returned as ``None``.
+    """
+    tails = []
+    readers = []
+    for stream in (process.stdout, process.stderr):
+        if stream is None:
+            tails.append(None)
+            continue
+        tail = OutputTail(limit)
+        tails.append(tail)
+        reader = threading.Thread(target=_read_stream, args=(stream, tail))
+        reader.daemon = True
+        reader.start()
+        readers.append(reader)
+    if process.stdin is not None:
+        try:
+            if cmd_input:
+                process.stdin.write(cmd_input)
+            process.stdin.close()
+        except IOError:
+            # The process exited without reading its input
+            pass
+    for reader in readers:
+        reader.join()
+    process.wait()
+    return tuple(tail.getvalue() if tail is not None else None
+                 for tail in tails)
+
+
 def safe_write(filename, contents):
     """Write ``contents`` to the given ``filename``. If the filename's
     directory does not exist, it is created. Contents are written as UTF-8,
@@ -110,6 +282,87 @@ def safe_write(filename, contents):
         fh.close()
 
 
+def file_md5(path):
+    """
+    Return the hex md5 digest of the contents of the file ``path``.
+    """
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), ''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def build_downloads_manifest(project, version_slug, checksum=True):
+    """
+    Return the downloadable files of ``version_slug`` found in production
+    media, mapping each type to its ``size``, ``modified`` time and ``md5``.
+    """
+    manifest = {}
+    for type in DOWNLOAD_TYPES:
+        path = project.get_production_media_path(type=type, version_slug=version_slug)
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entry = {'size': stat.st_size, 'modified': int(stat.st_mtime)}
+        if checksum:
+            entry['md5'] = file_md5(path)
+        manifest[type] = entry
+    return manifest
+
+
+def save_downloads_manifest(project, version_slug, manifest):
+    safe_write(project.downloads_manifest_path(version_slug),
+               unicode(json.dumps(manifest)))
+    cache.set(DOWNLOADS_CACHE_KEY % (project.slug, version_slug), manifest,
+              DOWNLOADS_CACHE_TIMEOUT)
+
+
+def invalidate_downloads_manifest(project, version_slug):
+    cache.delete(DOWNLOADS_CACHE_KEY % (project.slug, version_slug))
+
+
+def get_downloads_manifest(project, version_slug):
+    """
+    Return the downloads manifest of ``version_slug``.
+
+    It is read from the cache, then from the manifest written when the files
+    were moved. Versions moved before manifests existed are probed on disk.
+    """
+    key = DOWNLOADS_CACHE_KEY % (project.slug, version_slug)
+    manifest = cache.get(key)
+    if manifest is None:
+        try:
+            with open(project.downloads_manifest_path(version_slug), 'r') as f:
+                manifest = json.load(f)
+        except (IOError, ValueError):
+            manifest = build_downloads_manifest(project, version_slug, checksum=False)
+        cache.set(key, manifest, DOWNLOADS_CACHE_TIMEOUT)
+    return manifest
+
+
+def environment_fingerprint(project, requirements, requirements_file_path=None):
+    """
+    Return a digest of what is installed in a build environment: the
+    interpreter, whether system packages are used, the doc builder
+    ``requirements`` and the content of the project's requirements file.
+    """
+    requirements_file = None
+    if requirements_file_path:
+        try:
+            with open(requirements_file_path, 'rb') as f:
+                requirements_file = hashlib.sha1(f.read()).hexdigest()
+        except IOError:
+            pass
+    return hashlib.sha1(json.dumps([
+        project.python_interpreter,
+        project.use_system_packages,
+        sorted(requirements),
+        requirements_file,
+    ])).hexdigest()
+
+
 CUSTOM_SLUG_RE = re.compile(r'[^-._\w]+$')
 
 
@@ -146,7 +399,48 @@ def mkversion(version_obj):
         return None
 
 
+def version_sort_key(slug):
+    """
+    Return a string that sorts like the version ``slug``.
+
+    Versions are ordered like their ``NormalizedVersion``. Slugs that aren't
+    versions sort like ``sort_version_aware`` orders them: latest first,
+    then stable, then other branches. The last character is ``1`` for slugs
+    that are versions and ``0`` for the others. Only digits and lower case
+    letters are used, so databases sort the keys the same way under any
+    collation.
+    """
+    ver = mkversion({'slug': slug})
+    is_version = ver is not None
+    if not is_version:
+        fallback = {LATEST: '99999.0', STABLE: '9999.0'}.get(slug, '999.0')
+        ver = NormalizedVersion(fallback, error_on_huge_major_num=False)
+    key = ''.join(_sort_key_part(part) for part in ver.parts)
+    return key[:254] + ('1' if is_version else '0')
+
+
+def _sort_key_part(part):
+    # Like tuple comparison: numbers sort before strings, and a tuple
+    # before the longer tuples it starts
+    key = ''
+    for item in part:
+        if isinstance(item, (int, long)):
+            key += 'b%010d' % min(item, 10 ** 10 - 1)
+        else:
+            key += 'c%s0' % item
+    return key + 'a'
+
+
 def highest_version(version_list):
+    """
+    Return the highest version of ``version_list`` and its
+    ``NormalizedVersion``, skipping versions that aren't versions.
+
+    A queryset of versions is ordered by the database on ``sort_key``.
+    """
+    if isinstance(version_list, QuerySet):
+        version_list = version_list.filter(
+            sort_key__endswith='1').order_by('-sort_key')[:1]
     highest = [None, None]
     for version in version_list:
         ver = mkversion(version)
@@ -2,6 +2,7 @@ from django.db import models
 from django.utils.translation import ugettext_lazy as _
 
 from projects.models import Project
+from redirects.utils import invalidate_redirects
 
 HTTP_STATUS_CHOICES = (
     (301, _('301 - Permanent Redirect')),
@@ -57,6 +58,14 @@ class Redirect(models.Model):
         verbose_name_plural = _('redirects')
         ordering = ('-update_dt',)
 
+    def save(self, *args, **kwargs):
+        super(Redirect, self).save(*args, **kwargs)
+        invalidate_redirects(self.project_id)
+
+    def delete(self, *args, **kwargs):
+        super(Redirect, self).delete(*args, **kwargs)
+        invalidate_redirects(self.project_id)
+
     def __unicode__(self):
         if self.redirect_type == 'prefix':
             return _('Prefix Redirect: %s ->' % self.from_url)
@@ -1,6 +1,12 @@
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
+from core.resolver import local_cache
+
+REDIRECT_CACHE_KEY = 'redirects:v1:%s'
+REDIRECT_CACHE_TIMEOUT = getattr(settings, 'REDIRECT_CACHE_TIMEOUT', 60 * 60)
+
 
 def redirect_filename(project, filename=None):
     """
@@ -42,3 +48,104 @@ def redirect_filename(project, filename=None):
                 'version_slug': version,
                 'filename': filename,
             })
+
+
+class RedirectMatcher(object):
+
+    """
+    The redirects of a project, compiled for lookups by path.
+
+    ``rules`` is a list of ``(redirect_type, from_url, to_url)`` in the order
+    the redirects are tried. ``page`` and ``exact`` redirects go in a hash of
+    their ``from_url``, ``prefix`` and ``$rest`` redirects in a trie of their
+    prefix, so matching a path doesn't depend on the number of redirects.
+    When several redirects match, the first one in ``rules`` wins.
+    """
+
+    def __init__(self, rules):
+        self.exact = {}
+        self.prefixes = {}
+        self.sphinx = {}
+        for position, (redirect_type, from_url, to_url) in enumerate(rules):
+            from_url = from_url or ''
+            to_url = to_url or ''
+            if redirect_type == 'prefix':
+                self._add_prefix(from_url, (position, 'prefix', from_url, to_url))
+            elif redirect_type in ('page', 'exact'):
+                entry = (position, redirect_type, from_url, to_url)
+                self.exact.setdefault(from_url, entry)
+                if redirect_type == 'exact' and '$rest' in from_url:
+                    match = from_url.split('$rest')[0]
+                    self._add_prefix(match, (position, 'rest', match, to_url))
+            elif redirect_type in ('sphinx_html', 'sphinx_htmldir'):
+                self.sphinx.setdefault(redirect_type, (position, redirect_type, '', ''))
+
+    def _add_prefix(self, prefix, entry):
+        node = self.prefixes
+        for char in prefix:
+            node = node.setdefault(char, {})
+        # Only the first redirect for a prefix can ever match
+        node.setdefault(None, entry)
+
+    def match(self, path):
+        """
+        Return the redirect for ``path`` as a tuple of its kind, ``from_url``
+        and ``to_url``, or ``None``.
+
+        The kind is the redirect type, or ``rest`` for the sub-level match of
+        an ``exact`` redirect.
+        """
+        candidates = []
+        if path in self.exact:
+            candidates.append(self.exact[path])
+        node = self.prefixes
+        if None in node:
+            candidates.append(node[None])
+        for char in path:
+            node = node.get(char)
+            if node is None:
+                break
+            if None in node:
+                candidates.append(node[None])
+        if path.endswith('/') and 'sphinx_html' in self.sphinx:
+            candidates.append(self.sphinx['sphinx_html'])
+        if path.endswith('.html') and 'sphinx_htmldir' in self.sphinx:
+            candidates.append(self.sphinx['sphinx_htmldir'])
+        if not candidates:
+            return None
+        return min(candidates)[1:]
+
+
+def get_redirect_matcher(project_pk):
+    """
+    Return the compiled ``RedirectMatcher`` of the project ``project_pk``.
+
+    The redirect rules are stored in the shared cache, and the compiled
+    matcher in the local LRU of the process.
+    """
+    key = REDIRECT_CACHE_KEY % project_pk
+    matcher = local_cache.get(key)
+    if matcher is None:
+        rules = cache.get(key)
+        if rules is None:
+            rules = _load_redirect_rules(project_pk)
+            cache.set(key, rules, REDIRECT_CACHE_TIMEOUT)
+        matcher = RedirectMatcher(rules)
+        local_cache.set(key, matcher)
+    return matcher
+
+
+def _load_redirect_rules(project_pk):
+    # Avoid circular import
+    from redirects.models import Redirect
+    return list(Redirect.objects.filter(project__pk=project_pk).values_list(
+        'redirect_type', 'from_url', 'to_url'))
+
+
+def invalidate_redirects(project_pk):
+    """
+    Drop the cached redirects of the project ``project_pk``.
+    """
+    key = REDIRECT_CACHE_KEY % project_pk
+    local_cache.delete(key)
+    cache.delete(key)
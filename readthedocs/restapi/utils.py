@@ -1,39 +1,59 @@
 import hashlib
 import logging
+import time
 
 import requests
+from django.contrib.auth.models import Permission
+from django.contrib.contenttypes.models import ContentType
+from guardian.models import UserObjectPermission
 
 from builds.constants import LATEST
 from builds.models import Version
-from projects.utils import slugify_uniquely
-from search.indexes import PageIndex, ProjectIndex, SectionIndex
+from projects.utils import slugify_uniquely, version_sort_key
+from search.indexes import BULK_CHUNK_SIZE, PageIndex, ProjectIndex, SectionIndex
 
 log = logging.getLogger(__name__)
 
+# Rows created, updated or deleted per query when syncing versions
+SYNC_BATCH_SIZE = 500
 
-def sync_versions(project, versions, type):
+
+def sync_versions(project, versions, type, stats=None):
     """
     Update the database with the current versions from the repository.
-    """
-    # Bookkeeping for keeping tag/branch identifies correct
-    verbose_names = [v['verbose_name'] for v in versions]
-    project.versions.filter(verbose_name__in=verbose_names).update(type=type)
 
-    old_versions = {}
-    old_version_values = project.versions.values('identifier', 'verbose_name')
-    for version in old_version_values:
-        old_versions[version['verbose_name']] = version['identifier']
+    The versions of the project are diffed with ``versions`` in memory. New
+    versions are then created with ``bulk_create`` and types are updated in
+    batches. The number of added, updated and retyped versions and the time
+    taken are set in ``stats[type]``, if ``stats`` is given.
+
+    The cached serving data of the project isn't invalidated, as this runs in
+    the transaction of the sync. See ``versions_changed``.
+
+    Returns the slugs of the versions added.
+    """
+    start = time.time()
+    existing = {}
+    slugs = set()
+    for pk, slug, verbose_name, identifier, version_type in project.versions.values_list(
+            'pk', 'slug', 'verbose_name', 'identifier', 'type'):
+        existing.setdefault(verbose_name, []).append((pk, identifier, version_type))
+        slugs.add(slug)
 
     added = set()
-    # Add new versions
+    updated = set()
+    retyped = []
+    new_versions = []
     for version in versions:
         version_id = version['identifier']
         version_name = version['verbose_name']
-        if version_name in old_versions.keys():
-            if version_id == old_versions[version_name]:
-                # Version is correct
-                continue
-            else:
+        if version_name in existing:
+            rows = existing[version_name]
+            if version_id == rows[-1][1]:
+                # Version is correct, but may have changed between tag and branch
+                retyped.extend(pk for pk, identifier, version_type in rows
+                               if version_type != type)
+            elif version_name not in updated:
                 # Update slug with new identifier
                 Version.objects.filter(
                     project=project, verbose_name=version_name
@@ -42,27 +62,91 @@ def sync_versions(project, versions, type):
                     type=type,
                     machine=False,
                 )
+                updated.add(version_name)
                 log.info("(Sync Versions) Updated Version: [%s=%s] " % (version['verbose_name'], version['identifier']))
         else:
             # New Version
             slug = slugify_uniquely(Version, version['verbose_name'], 'slug', 255, project=project)
-            Version.objects.create(
+            if slug in slugs:
+                log.warning("(Sync Versions) Skipped Version with a taken slug: [%s=%s]" % (version['verbose_name'], slug))
+                continue
+            slugs.add(slug)
+            existing[version_name] = [(None, version_id, type)]
+            new_versions.append(Version(
                 project=project,
                 slug=slug,
                 type=type,
                 identifier=version['identifier'],
                 verbose_name=version['verbose_name'],
-            )
+                sort_key=version_sort_key(slug),
+            ))
             added.add(slug)
+
+    for pks in _batches(retyped):
+        Version.objects.filter(pk__in=pks).update(type=type)
+    if new_versions:
+        Version.objects.bulk_create(new_versions, batch_size=SYNC_BATCH_SIZE)
+        _assign_view_permissions(project, added)
+        project.sync_supported_versions()
     if added:
         log.info("(Sync Versions) Added Versions: [%s] " % ' '.join(added))
+    if stats is not None:
+        stats[type] = {
+            'added': len(added),
+            'updated': len(updated),
+            'retyped': len(retyped),
+            'seconds': round(time.time() - start, 3),
+        }
     return added
 
 
-def delete_versions(project, version_data):
+def versions_changed(stats):
+    """
+    Whether the ``stats`` of ``sync_versions`` and ``delete_versions`` show
+    that any version was added, changed or deleted.
+    """
+    return any(count for step in stats.values()
+               for name, count in step.items() if name != 'seconds')
+
+
+def _batches(items, size=SYNC_BATCH_SIZE):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def _assign_view_permissions(project, slugs):
+    """
+    Give the owners of ``project`` view permission on its versions
+    ``slugs``, like ``Version.save`` does for a single version.
+    """
+    owners = list(project.users.all())
+    if not owners:
+        return
+    content_type = ContentType.objects.get_for_model(Version)
+    permission = Permission.objects.get(content_type=content_type,
+                                        codename='view_version')
+    permissions = []
+    for batch in _batches(list(slugs)):
+        for pk in project.versions.filter(slug__in=batch).values_list('pk', flat=True):
+            for owner in owners:
+                permissions.append(UserObjectPermission(
+                    permission=permission,
+                    content_type=content_type,
+                    object_pk=str(pk),
+                    user=owner,
+                ))
+    UserObjectPermission.objects.bulk_create(permissions,
+                                             batch_size=SYNC_BATCH_SIZE)
+
+
+def delete_versions(project, version_data, stats=None):
     """
     Delete all versions not in the current repo.
+
+    The number of deleted versions and the time taken are set in
+    ``stats['deleted']``, if ``stats`` is given.
     """
+    start = time.time()
     current_versions = []
     if 'tags' in version_data:
         for version in version_data['tags']:
@@ -70,25 +154,41 @@ def delete_versions(project, version_data):
     if 'branches' in version_data:
         for version in version_data['branches']:
             current_versions.append(version['identifier'])
-    to_delete_qs = project.versions.exclude(
-        identifier__in=current_versions).exclude(
-        uploaded=True).exclude(
-        active=True).exclude(
-        slug=LATEST)
-
-    if to_delete_qs.count():
-        ret_val = {obj.slug for obj in to_delete_qs}
+    current_versions = set(current_versions)
+    # Diff in memory rather than with a query listing every identifier
+    to_delete = [
+        (pk, slug) for pk, slug, identifier in project.versions.exclude(
+            uploaded=True).exclude(
+            active=True).exclude(
+            slug=LATEST).values_list('pk', 'slug', 'identifier')
+        if identifier not in current_versions
+    ]
+
+    ret_val = set(slug for pk, slug in to_delete)
+    if ret_val:
         log.info("(Sync Versions) Deleted Versions: [%s]" % ' '.join(ret_val))
-        to_delete_qs.delete()
-        return ret_val
-    else:
-        return set()
+        for batch in _batches(to_delete):
+            Version.objects.filter(pk__in=[pk for pk, slug in batch]).delete()
+    if stats is not None:
+        stats['deleted'] = {
+            'deleted': len(ret_val),
+            'seconds': round(time.time() - start, 3),
+        }
+    return ret_val
 
 
-def index_search_request(version, page_list, commit, project_scale, page_scale, section=True, delete=True):
-    log_msg = ' '.join([page['path'] for page in page_list])
+def index_search_request(version, page_list, commit, project_scale, page_scale, section=True, delete=True, index=None):
+    """
+    Index the pages of ``page_list`` for ``version``.
+
+    ``page_list`` may be any iterable of pages, like the generators from
+    ``search.parse_json``. It is consumed once, while sending the pages to the
+    index chunk by chunk. ``index`` overrides the default index alias.
+
+    Returns the number of pages indexed.
+    """
     log.info("(Server Search) Indexing Pages: %s [%s]" % (
-        version.project.slug, log_msg))
+        version.project.slug, version.slug))
     project = version.project
     page_obj = PageIndex()
     section_obj = SectionIndex()
@@ -96,7 +196,7 @@ def index_search_request(version, page_list, commit, project_scale, page_scale,
     #tags = [tag.name for tag in project.tags.all()]
 
     project_obj = ProjectIndex()
-    project_obj.index_document(data={
+    project_obj.index_document(index=index, data={
         'id': project.pk,
         'name': project.name,
         'slug': project.slug,
@@ -108,38 +208,54 @@ def index_search_request(version, page_list, commit, project_scale, page_scale,
         'weight': project_scale,
     })
 
-    index_list = []
     section_index_list = []
-    for page in page_list:
-        log.debug("(API Index) %s:%s" % (project.slug, page['path']))
-        page_id = hashlib.md5('%s-%s-%s' % (project.slug, version.slug, page['path'])).hexdigest()
-        index_list.append({
-            'id': page_id,
-            'project': project.slug,
-            'version': version.slug,
-            'path': page['path'],
-            'title': page['title'],
-            'headers': page['headers'],
-            'content': page['content'],
-            'taxonomy': None,
-            'commit': commit,
-            'weight': page_scale + project_scale,
-        })
-        if section:
-            for section in page['sections']:
-                section_index_list.append({
-                    'id': hashlib.md5('%s-%s-%s-%s' % (project.slug, version.slug, page['path'], section['id'])).hexdigest(),
-                    'project': project.slug,
-                    'version': version.slug,
-                    'path': page['path'],
-                    'page_id': section['id'],
-                    'title': section['title'],
-                    'content': section['content'],
-                    'weight': page_scale,
-                })
-            section_obj.bulk_index(section_index_list, parent=page_id, routing=project.slug)
-
-    page_obj.bulk_index(index_list, parent=project.slug)
+
+    def flush_sections():
+        # Sections are routed by project, like their parent pages.
+        section_obj.bulk_index(section_index_list[:], index=index, routing=project.slug)
+        del section_index_list[:]
+
+    def page_documents():
+        for page in page_list:
+            log.debug("(API Index) %s:%s" % (project.slug, page['path']))
+            page_id = hashlib.md5('%s-%s-%s' % (project.slug, version.slug, page['path'])).hexdigest()
+            yield {
+                'id': page_id,
+                'project': project.slug,
+                'version': version.slug,
+                'path': page['path'],
+                'title': page['title'],
+                'headers': page['headers'],
+                'content': page['content'],
+                'taxonomy': None,
+                'commit': commit,
+                'weight': page_scale + project_scale,
+            }
+            if section:
+                for section_data in page['sections']:
+                    section_index_list.append({
+                        'id': hashlib.md5('%s-%s-%s-%s' % (project.slug, version.slug, page['path'], section_data['id'])).hexdigest(),
+                        '_parent': page_id,
+                        'project': project.slug,
+                        'version': version.slug,
+                        'path': page['path'],
+                        'page_id': section_data['id'],
+                        'title': section_data['title'],
+                        'content': section_data['content'],
+                        'commit': commit,
+                        'weight': page_scale,
+                    })
+                if len(section_index_list) >= BULK_CHUNK_SIZE:
+                    flush_sections()
+
+    indexed = 0
+    for stats in page_obj.streaming_bulk_index(page_documents(), index=index, parent=project.slug):
+        indexed += stats['docs'] - stats['errors']
+        log.info("(Server Search) Indexed chunk: %s [%s] %s" % (
+            project.slug, version.slug,
+            ' '.join('%s=%s' % (key, stats[key]) for key in sorted(stats))))
+    if section_index_list:
+        flush_sections()
 
     if delete:
         log.info("(Server Search) Deleting files not in commit: %s" % commit)
@@ -159,4 +275,41 @@ def index_search_request(version, page_list, commit, project_scale, page_scale,
                 }
             }
         }
-        page_obj.delete_document(body=delete_query)
+        page_obj.delete_document(body=delete_query, index=index)
+        if section:
+            section_obj.delete_document(body=delete_query, index=index)
+    return indexed
+
+
+def _paths_query(version, paths):
+    return {
+        "query": {
+            "bool": {
+                "must": [
+                    {"term": {"project": version.project.slug, }},
+                    {"term": {"version": version.slug, }},
+                    {"terms": {"path": paths, }},
+                ],
+            }
+        }
+    }
+
+
+def delete_search_pages(version, paths):
+    """
+    Delete the pages at ``paths`` of ``version``, and their sections, from the
+    search index.
+    """
+    log.info("(Server Search) Deleting Pages: %s [%s]" % (
+        version.project.slug, ' '.join(paths)))
+    delete_query = _paths_query(version, paths)
+    PageIndex().delete_document(body=delete_query)
+    SectionIndex().delete_document(body=delete_query)
+
+
+def delete_search_sections(version, paths):
+    """
+    Delete the sections of the pages at ``paths`` of ``version`` from the
+    search index, so sections removed from a page don't linger.
+    """
+    SectionIndex().delete_document(body=_paths_query(version, paths))
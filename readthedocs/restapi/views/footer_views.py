@@ -1,21 +1,39 @@
+import hashlib
+
 from django.shortcuts import get_object_or_404
 from django.template import Context, loader as template_loader
 from django.conf import settings
+from django.core.cache import cache
 from django.core.context_processors import csrf
+from django.http import Http404
 
 from rest_framework import decorators, permissions
 from rest_framework.renderers import JSONPRenderer, JSONRenderer, BrowsableAPIRenderer
 from rest_framework.response import Response
 
-from bookmarks.models import Bookmark
 from builds.models import Version
+from core import resolver
 from projects.models import Project
 
+FOOTER_CACHE_KEY = 'footer:v1:%s:%s:%s'
+FOOTER_CACHE_TIMEOUT = getattr(settings, 'FOOTER_CACHE_TIMEOUT', 60 * 60)
+# Replaced by the user specific bookmark section of the cached footer
+BOOKMARKS_MARKER = '<!-- Footer bookmarks -->'
+
 
 @decorators.api_view(['GET'])
 @decorators.permission_classes((permissions.AllowAny,))
 @decorators.renderer_classes((JSONRenderer, JSONPRenderer, BrowsableAPIRenderer))
 def footer_html(request):
+    """
+    Render the footer of a documentation page.
+
+    The footer as seen by anonymous users is cached per project, version and
+    request arguments. The cache keys include the token of the project's
+    serving data, so they change when a build finishes, a version is saved
+    or the project is edited. The bookmarks and promo of logged in users are
+    added to the cached footer.
+    """
     project_slug = request.GET.get('project', None)
     version_slug = request.GET.get('version', None)
     page_slug = request.GET.get('page', None)
@@ -24,10 +42,60 @@ def footer_html(request):
     subproject = request.GET.get('subproject', False)
     source_suffix = request.GET.get('source_suffix', '.rst')
 
+    data = resolver.get_project_data(project_slug)
+    if not data:
+        raise Http404
+    project = version = None
+    if request.user.is_authenticated():
+        # Users can see versions that aren't public
+        project = get_object_or_404(Project, slug=project_slug)
+        version = get_object_or_404(Version.objects.public(request.user, project=project, only_active=False), slug=version_slug)
+    elif not resolver.is_public(data, version_slug, only_active=False):
+        raise Http404
+
+    arguments = hashlib.md5(repr((
+        version_slug, page_slug, theme, docroot, subproject, source_suffix,
+    ))).hexdigest()
+    key = FOOTER_CACHE_KEY % (project_slug, data['cache_token'], arguments)
+    footer = cache.get(key)
+    if footer is None:
+        if project is None:
+            project = get_object_or_404(Project, slug=project_slug)
+            version = get_object_or_404(project.versions, slug=version_slug)
+        footer = _render_footer(project, version, page_slug, theme, docroot,
+                                subproject, source_suffix)
+        cache.set(key, footer, FOOTER_CACHE_TIMEOUT)
+
+    host = request.get_host()
+    if settings.PRODUCTION_DOMAIN in host and request.user.is_authenticated():
+        context = Context({'settings': settings})
+        context.update(csrf(request))
+        bookmarks = template_loader.get_template(
+            'restapi/footer_bookmarks.html').render(context)
+    else:
+        bookmarks = ''
+
+    show_promo = footer['promo']
+    # User is a gold user, no promos for them!
+    if show_promo and request.user.is_authenticated():
+        if request.user.gold.count() or request.user.goldonce.count():
+            show_promo = False
+
+    return Response({
+        'html': footer['html'].replace(BOOKMARKS_MARKER, bookmarks, 1),
+        'version_active': footer['version_active'],
+        'version_supported': footer['version_supported'],
+        'promo': show_promo,
+    })
+
+
+def _render_footer(project, version, page_slug, theme, docroot, subproject,
+                   source_suffix):
+    """
+    Return the parts of the footer that are the same for all users.
+    """
     new_theme = (theme == "sphinx_rtd_theme")
     using_theme = (theme == "default")
-    project = get_object_or_404(Project, slug=project_slug)
-    version = get_object_or_404(Version.objects.public(request.user, project=project, only_active=False), slug=version_slug)
     main_project = project.main_language_project or project
 
     if page_slug and page_slug != "index":
@@ -40,22 +108,6 @@ def footer_html(request):
     else:
         path = ""
 
-    host = request.get_host()
-    if settings.PRODUCTION_DOMAIN in host and request.user.is_authenticated():
-        show_bookmarks = True
-        try:
-            bookmark = Bookmark.objects.get(
-                user=request.user,
-                project=project,
-                version=version,
-                page=page_slug,
-            )
-        except (Bookmark.DoesNotExist, Bookmark.MultipleObjectsReturned, Exception):
-            bookmark = None
-    else:
-        show_bookmarks = False
-        bookmark = None
-
     if version.type == 'tag' and version.project.has_pdf(version.slug):
         print_url = 'https://keminglabs.com/print-the-docs/quote?project={project}&version={version}'.format(
             project=project.slug,
@@ -65,10 +117,6 @@ def footer_html(request):
         print_url = None
 
     show_promo = True
-    # User is a gold user, no promos for them!
-    if request.user.is_authenticated():
-        if request.user.gold.count() or request.user.goldonce.count():
-            show_promo = False
     # Explicit promo disabling
     if project.slug in getattr(settings, 'DISABLE_PROMO_PROJECTS', []):
         show_promo = False
@@ -77,8 +125,6 @@ def footer_html(request):
         show_promo = False
 
     context = Context({
-        'show_bookmarks': show_bookmarks,
-        'bookmark': bookmark,
         'project': project,
         'path': path,
         'downloads': version.get_downloads(pretty=True),
@@ -97,11 +143,10 @@ def footer_html(request):
         'bitbucket_url': version.get_bitbucket_url(docroot, page_slug, source_suffix),
     })
 
-    context.update(csrf(request))
     html = template_loader.get_template('restapi/footer.html').render(context)
-    return Response({
+    return {
         'html': html,
         'version_active': version.active,
         'version_supported': version.supported,
         'promo': show_promo,
-    })
+    }
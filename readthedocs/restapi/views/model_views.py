@@ -1,5 +1,6 @@
 import logging
 
+from django.db import transaction
 from django.shortcuts import get_object_or_404
 from docutils.utils.math.math2html import Link
 from rest_framework import decorators, permissions, viewsets, status
@@ -9,6 +10,7 @@ from rest_framework.response import Response
 
 from builds.filters import VersionFilter
 from builds.models import Build, Version
+from core.resolver import invalidate_availability, invalidate_project
 from core.utils import trigger_build
 from oauth import utils as oauth_utils
 from builds.constants import STABLE
@@ -48,6 +50,9 @@ class ProjectViewSet(viewsets.ModelViewSet):
         # project.versions.exclude(verbose_name__in=version_strings).update(active=False)
         project.versions.filter(
             verbose_name__in=version_strings).update(active=True)
+        # The update doesn't go through Version.save
+        invalidate_project(project.slug)
+        invalidate_availability(project)
         return Response({
             'flat': version_strings,
         })
@@ -83,26 +88,36 @@ class ProjectViewSet(viewsets.ModelViewSet):
         """
         Sync the version data in the repo (on the build server) with what we have in the database.
 
-        Returns the identifiers for the versions that have been deleted.
+        Returns the identifiers for the versions that have been deleted, and
+        the time taken by each part of the sync in ``stats``.
         """
         project = get_object_or_404(
             Project.objects.api(self.request.user), pk=kwargs['pk'])
+        stats = {}
         try:
             # Update All Versions
             data = request.DATA
             added_versions = set()
-            if 'tags' in data:
-                ret_set = api_utils.sync_versions(
-                    project=project, versions=data['tags'], type='tag')
-                added_versions.update(ret_set)
-            if 'branches' in data:
-                ret_set = api_utils.sync_versions(
-                    project=project, versions=data['branches'], type='branch')
-                added_versions.update(ret_set)
-            deleted_versions = api_utils.delete_versions(project, data)
+            with transaction.atomic():
+                if 'tags' in data:
+                    ret_set = api_utils.sync_versions(
+                        project=project, versions=data['tags'], type='tag',
+                        stats=stats)
+                    added_versions.update(ret_set)
+                if 'branches' in data:
+                    ret_set = api_utils.sync_versions(
+                        project=project, versions=data['branches'],
+                        type='branch', stats=stats)
+                    added_versions.update(ret_set)
+                deleted_versions = api_utils.delete_versions(
+                    project, data, stats=stats)
         except Exception, e:
             log.exception("Sync Versions Error: %s" % e.message)
             return Response({'error': e.message}, status=status.HTTP_400_BAD_REQUEST)
+        # Once committed, so other processes can't cache the old versions again
+        if api_utils.versions_changed(stats):
+            invalidate_project(project.slug)
+            invalidate_availability(project)
 
         try:
             # Update Stable Version
@@ -140,6 +155,7 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return Response({
             'added_versions': added_versions,
             'deleted_versions': deleted_versions,
+            'stats': stats,
         })
 
 
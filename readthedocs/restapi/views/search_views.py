@@ -23,13 +23,9 @@ def quick_search(request):
     project_slug = request.GET.get('project', None)
     version_slug = request.GET.get('version', LATEST)
     query = request.GET.get('q', None)
-    redis_data = djangome.r.keys('redirects:v4:en:%s:%s:*%s*' % (version_slug, project_slug, query))
     ret_dict = {}
-    for data in redis_data:
-        if 'http://' in data or 'https://' in data:
-            key = data.split(':')[5]
-            value = ':'.join(data.split(':')[6:])
-            ret_dict[key] = value
+    if query:
+        ret_dict = djangome.search_terms('en', project_slug, version_slug, query)
     return Response({"results": ret_dict})
 
 
@@ -2,6 +2,11 @@ from django.test import TestCase
 import json
 import base64
 
+from mock import patch, MagicMock
+
+from core.management.commands import index_redirect_terms
+from djangome import views as djangome
+
 
 super_auth = base64.b64encode('super:test')
 eric_auth = base64.b64encode('eric:test')
@@ -123,3 +128,61 @@ class APITests(TestCase):
         self.assertEqual(resp.status_code, 200)
         obj = json.loads(resp.content)
         self.assertEqual(obj['is_highest'], True)
+
+
+class APIQuickSearchTests(TestCase):
+
+    def test_quick_search_uses_index(self):
+        redis_conn = MagicMock()
+        redis_conn.hgetall.return_value = {
+            'Model': 'http://django.readthedocs.org/en/latest/models.html',
+            'Field': 'http://django.readthedocs.org/en/latest/fields.html',
+        }
+        with patch.object(djangome, 'r', redis_conn):
+            resp = self.client.get('/api/v2/quick_search/', {
+                'project': 'django', 'version': 'latest', 'q': 'model',
+            })
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)['results'], {
+            'Model': 'http://django.readthedocs.org/en/latest/models.html',
+        })
+        redis_conn.hgetall.assert_called_once_with(
+            'redirects:v4:terms:en:latest:django')
+        self.assertFalse(redis_conn.keys.called)
+
+    def test_anchor_prefix_search(self):
+        redis_conn = MagicMock()
+        redis_conn.execute_command.return_value = ['virtualenv', 'virtualenv:create']
+        redis_conn.pipeline.return_value.execute.return_value = [
+            set(['http://pip.readthedocs.org/en/latest/#virtualenv']),
+            set(['http://virtualenv.readthedocs.org/en/latest/#virtualenv:create']),
+        ]
+        with patch.object(djangome, 'r', redis_conn):
+            resp = self.client.get('/api/v1/file/anchor/',
+                                   {'q': 'virtualenv', 'format': 'json'})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(json.loads(resp.content)['objects'], [
+            'http://pip.readthedocs.org/en/latest/#virtualenv',
+            'http://virtualenv.readthedocs.org/en/latest/#virtualenv:create',
+        ])
+        # Terms starting with the query
+        redis_conn.execute_command.assert_called_once_with(
+            'ZRANGEBYLEX', 'redirects:v4:anchor_terms', '[virtualenv',
+            '[virtualenv\xff', 'LIMIT', 0, djangome.ANCHOR_SEARCH_TERMS)
+        self.assertFalse(redis_conn.keys.called)
+
+    def test_index_terms_with_colons(self):
+        url = 'http://pip.readthedocs.org/en/latest/#std:option'
+        keys = {
+            'redirects:v4:en:latest:pip:std:option': 'set',
+            'redirects:v4:en:latest:pip:std:option:' + url: 'string',
+            'redirects:v4:terms:en:latest:pip': 'hash',
+            'redirects:v4:anchors:std:option': 'set',
+        }
+        redis_conn = MagicMock()
+        redis_conn.scan_iter.return_value = keys.keys()
+        redis_conn.type.side_effect = keys.get
+        with patch.object(djangome, 'r', redis_conn), \
+                patch.object(djangome, 'index_term') as index_term:
+            index_redirect_terms.Command().handle()
+        index_term.assert_called_once_with('en', 'pip', 'latest', 'std:option')
@@ -1,11 +1,15 @@
-from os.path import exists
+from os import environ
+from os.path import abspath, exists, join
 
+from django.conf import settings
 from django.contrib.auth.models import User
+from mock import patch
 
+from projects.exceptions import ProjectImportError
 from projects.models import Project
 from rtd_tests.base import RTDTestCase
 
-from rtd_tests.utils import make_test_git, make_test_hg
+from rtd_tests.utils import check_output, make_test_git, make_test_hg
 
 
 class TestGitBackend(RTDTestCase):
@@ -14,6 +18,8 @@ class TestGitBackend(RTDTestCase):
     def setUp(self):
         git_repo = make_test_git()
         super(TestGitBackend, self).setUp()
+        # Git commands run in the checkout, with its path in GIT_DIR
+        self.build_dir = settings.DOCROOT = abspath(self.build_dir)
         self.eric = User.objects.get(username='eric')
         self.project = Project.objects.create(
             name="Test Project",
@@ -51,6 +57,86 @@ class TestGitBackend(RTDTestCase):
         repo.checkout()
         self.assertTrue(exists(repo.working_dir))
 
+    def test_git_metadata_single_call(self):
+        repo = self.project.vcs_repo()
+        repo.checkout()
+        self.assertIs(repo, self.project.vcs_repo())
+        with patch.object(repo, 'run', wraps=repo.run) as run:
+            self.assertEqual(len(repo.commit), 40)
+            self.assertEqual([b.verbose_name for b in repo.branches], ['master'])
+            self.assertEqual(repo.tags, [])
+            self.assertTrue(repo.ref_exists('remotes/origin/master'))
+            self.assertFalse(repo.ref_exists('origin/ster'))
+        run.assert_called_once_with('git', 'show-ref', '--head')
+
+    def test_parse_git_refs(self):
+        data = """\
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 HEAD
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 refs/heads/master
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 refs/remotes/origin/HEAD
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 refs/remotes/origin/master
+            bd533a768ff661991a689d3758fcfe72f455435d refs/remotes/origin/release/2.0
+            c0288a17899b2c6818f74e3a90b77e2a1779f96a refs/tags/2.0.2
+         """
+        repo = self.project.vcs_repo()
+        repo._refs = repo.parse_refs(data)
+        self.assertEqual(repo.commit, '3b32886c8d3cb815df3793b3937b2e91d0fb00f1')
+        self.assertEqual(
+            [(x.identifier, x.verbose_name) for x in repo.branches],
+            [('origin/master', 'master'), ('origin/release/2.0', 'release-2.0')])
+        self.assertEqual(
+            [(x.identifier, x.verbose_name) for x in repo.tags],
+            [('c0288a17899b2c6818f74e3a90b77e2a1779f96a', '2.0.2')])
+
+    def test_git_checkout_from_mirror(self):
+        with patch('vcs_support.backends.git.GIT_MIRROR_CHECKOUTS', True):
+            repo = self.project.vcs_repo()
+            repo.checkout()
+            # Checkouts of other versions reuse the same mirror
+            other = self.project.vcs_repo('other')
+            other.checkout()
+        mirror = self.project.mirror_path
+        self.assertTrue(exists(join(mirror, 'HEAD')))
+        for checkout in (repo, other):
+            self.assertTrue(exists(join(checkout.working_dir, 'README')))
+            alternates = join(checkout.working_dir, '.git', 'objects', 'info',
+                              'alternates')
+            self.assertTrue(exists(alternates))
+            self.assertEqual(repo.commit, checkout.commit)
+            code, out, err = checkout.run('git', 'config', 'remote.origin.url')
+            self.assertEqual(out.strip(), mirror)
+
+    def test_git_mirror_setup_failure(self):
+        repo = self.project.vcs_repo()
+        run_mirror = repo.run_mirror
+
+        def fail_remote(*args):
+            if args[0] == 'remote':
+                return 1, '', 'failed'
+            return run_mirror(*args)
+
+        with patch('vcs_support.backends.git.GIT_MIRROR_CHECKOUTS', True):
+            with patch.object(repo, 'run_mirror', fail_remote):
+                self.assertRaises(ProjectImportError, repo.checkout)
+        # The partial mirror and the lock are removed
+        self.assertFalse(exists(self.project.mirror_path))
+        self.assertFalse(exists(self.project.mirror_path + '.lock'))
+
+    def test_git_shallow_checkout(self):
+        env = dict(environ, GIT_DIR=join(self.project.repo, '.git'))
+        first = check_output(['git', 'rev-parse', 'HEAD'], env=env).strip()
+        check_output(['git', '-c', 'user.name=Test', '-c', 'user.email=t@t.t',
+                      'commit', '--allow-empty', '-m', 'second'], env=env)
+        repo = self.project.vcs_repo()
+        repo.repo_url = 'file://%s' % self.project.repo
+        with patch('vcs_support.backends.git.GIT_CLONE_DEPTH', 1):
+            repo.checkout()
+            self.assertTrue(repo.is_shallow())
+            # An older commit makes the checkout fetch the whole history
+            repo.checkout(first)
+        self.assertFalse(repo.is_shallow())
+        self.assertEqual(repo.commit, first)
+
     def test_parse_git_tags(self):
         data = """\
             3b32886c8d3cb815df3793b3937b2e91d0fb00f1 refs/tags/2.0.0
@@ -0,0 +1,140 @@
+import json
+import time
+
+from django.test import TestCase
+from mock import patch, MagicMock
+import redis
+from slumber.exceptions import HttpClientError
+
+from builds import scheduler
+from builds.models import Build
+from projects import tasks
+from projects.models import Project
+
+# The task, setUp replaces it with a mock
+update_docs = tasks.update_docs
+
+
+class FakePipeline(object):
+
+    """Runs the pipeline commands of the scheduler on a dict of hashes."""
+
+    def __init__(self, data):
+        self.data = data
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def watch(self, key):
+        pass
+
+    def multi(self):
+        pass
+
+    def reset(self):
+        pass
+
+    def execute(self):
+        pass
+
+    def hget(self, key, field):
+        return self.data.get(key, {}).get(field)
+
+    def hmget(self, key, *fields):
+        return [self.hget(key, field) for field in fields]
+
+    def hset(self, key, field, value):
+        self.data.setdefault(key, {})[field] = str(value)
+
+    def hdel(self, key, field):
+        self.data.get(key, {}).pop(field, None)
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+class TestBuildQueue(TestCase):
+
+    def setUp(self):
+        self.pip = Project.objects.create(name='Pip', slug='pip')
+        self.version = self.pip.versions.get(slug='latest')
+        self.key = scheduler.BUILD_QUEUE_KEY % self.version.pk
+        self.data = {}
+        self.redis = MagicMock()
+        self.redis.pipeline.side_effect = lambda: FakePipeline(self.data)
+        self.update_docs = MagicMock()
+        patches = [
+            patch.object(scheduler, 'redis_client', lambda: self.redis),
+            patch('projects.tasks.update_docs', self.update_docs),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def started(self):
+        return [call[1] for call in self.update_docs.delay.call_args_list]
+
+    def test_triggers_coalesced(self):
+        first = scheduler.schedule_build(self.pip, self.version)
+        second = scheduler.schedule_build(self.pip, self.version)
+        third = scheduler.schedule_build(self.pip, self.version, force=True)
+        self.assertEqual(third, second)
+        self.assertEqual(Build.objects.filter(version=self.version).count(), 2)
+        self.assertEqual([kwargs['build_pk'] for kwargs in self.started()],
+                         [first.pk])
+        self.assertTrue(self.started()[0]['queued'])
+        pending = json.loads(self.data[self.key]['pending'])
+        self.assertEqual(pending['build_pk'], second.pk)
+        self.assertTrue(pending['force'])
+
+        scheduler.release_build(self.version.pk, first.pk)
+        self.assertEqual([kwargs['build_pk'] for kwargs in self.started()],
+                         [first.pk, second.pk])
+        self.assertEqual(self.data[self.key]['running'], str(second.pk))
+        self.assertNotIn('pending', self.data[self.key])
+        scheduler.release_build(self.version.pk, second.pk)
+        self.assertNotIn(self.key, self.data)
+        self.assertEqual(len(self.started()), 2)
+
+    def test_killed_build(self):
+        first = scheduler.schedule_build(self.pip, self.version)
+        second = scheduler.schedule_build(self.pip, self.version)
+        # The build server running the first build was killed
+        self.data[self.key]['started'] = str(
+            time.time() - scheduler.BUILD_QUEUE_TIMEOUT - 1)
+        third = scheduler.schedule_build(self.pip, self.version, force=True)
+        self.assertEqual(third, second)
+        self.assertEqual([kwargs['build_pk'] for kwargs in self.started()],
+                         [first.pk, second.pk])
+        self.assertTrue(self.started()[1]['force'])
+        self.assertEqual(self.data[self.key]['running'], str(second.pk))
+        self.assertNotIn('pending', self.data[self.key])
+
+        # Triggers while the second build runs are queued again
+        fourth = scheduler.schedule_build(self.pip, self.version)
+        self.assertNotEqual(fourth, second)
+        self.assertEqual(len(self.started()), 2)
+        # The killed build finishing late doesn't release the second one
+        scheduler.release_build(self.version.pk, first.pk)
+        self.assertEqual(len(self.started()), 2)
+        scheduler.release_build(self.version.pk, second.pk)
+        self.assertEqual(self.started()[2]['build_pk'], fourth.pk)
+
+    def test_failed_build_released(self):
+        api = MagicMock()
+        api.project.return_value.get.side_effect = HttpClientError
+        with patch.object(tasks, 'release_build') as release_build:
+            update_docs(self.pip.pk, version_pk=self.version.pk,
+                        record=False, api=api, queued=True)
+        release_build.assert_called_once_with(self.version.pk, None)
+
+    def test_redis_unavailable(self):
+        self.redis.pipeline.side_effect = redis.ConnectionError
+        build = scheduler.schedule_build(self.pip, self.version)
+        scheduler.schedule_build(self.pip, self.version)
+        self.assertEqual(len(self.started()), 2)
+        self.assertEqual(self.started()[0]['build_pk'], build.pk)
+        self.assertNotIn('queued', self.started()[0])
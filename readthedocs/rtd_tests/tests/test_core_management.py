@@ -1,9 +1,10 @@
 from StringIO import StringIO
 
+from django.core.management.base import CommandError
 from django.test import TestCase
-from mock import patch
+from mock import Mock, call, patch
 
-from core.management.commands import run_docker
+from core.management.commands import reindex_elasticsearch, run_docker
 from projects.models import Project
 from builds.models import Version
 
@@ -66,3 +67,63 @@ class TestRunDocker(TestCase):
                      '[-1, "", "ValueError: No JSON object could be decoded"]}'
                      '\n')
                 )
+
+
+class TestReindexElasticsearch(TestCase):
+
+    def setUp(self):
+        self.version = Mock()
+        self.other_version = Mock()
+        self.es = Mock()
+        self.es.indices.exists.return_value = True
+        self.es.indices.exists_alias.return_value = True
+        es_patch = patch('search.indexes.Elasticsearch', return_value=self.es)
+        es_patch.start()
+        self.addCleanup(es_patch.stop)
+
+    def _reindex(self, indexed, count):
+        with patch.object(reindex_elasticsearch, 'index_version',
+                          return_value=(self.version, indexed)) as index_version, \
+                patch.object(reindex_elasticsearch.PageIndex, 'count',
+                             return_value=count), \
+                patch.object(reindex_elasticsearch.Index, 'update_aliases') as update_aliases, \
+                patch.object(reindex_elasticsearch, 'delete_search_manifest') as delete_manifest, \
+                patch.object(reindex_elasticsearch, 'Version') as version_model:
+            version_model.objects.select_related.return_value = [
+                self.version, self.other_version]
+            self.delete_manifest = delete_manifest
+            reindex_elasticsearch.Command().shadow_reindex([self.version])
+        index_version.assert_called_once_with(
+            self.version, index=self.es.indices.create.call_args[1]['index'])
+        return update_aliases
+
+    def test_swap_alias_when_counts_match(self):
+        update_aliases = self._reindex(indexed=10, count=10)
+        new_index = self.es.indices.create.call_args[1]['index']
+        self.assertTrue(new_index.startswith('readthedocs-'))
+        update_aliases.assert_called_once_with(new_index, delete=True)
+        # Builds during the reindex, and versions that weren't reindexed, only
+        # updated the old index
+        self.assertEqual(self.delete_manifest.call_args_list,
+                         [call(self.version), call(self.other_version)])
+
+    def test_keep_alias_when_counts_differ(self):
+        with self.assertRaises(CommandError):
+            self._reindex(indexed=10, count=8)
+        self.assertFalse(self.delete_manifest.called)
+        self.es.indices.delete.assert_called_once_with(
+            index=self.es.indices.create.call_args[1]['index'])
+
+    def test_reindex_all_public_versions(self):
+        with patch.object(reindex_elasticsearch.Command, 'shadow_reindex') as shadow_reindex, \
+                patch.object(reindex_elasticsearch, 'Version') as version_model:
+            reindex_elasticsearch.Command().handle(project='', jobs=1, keep_old=False)
+        shadow_reindex.assert_called_once_with(
+            version_model.objects.public.return_value, jobs=1, delete=True)
+        version_model.objects.public.assert_called_once_with()
+
+    def test_refuse_to_swap_an_index(self):
+        self.es.indices.exists_alias.return_value = False
+        with self.assertRaises(CommandError):
+            reindex_elasticsearch.Command().shadow_reindex([self.version])
+        self.assertFalse(self.es.indices.create.called)
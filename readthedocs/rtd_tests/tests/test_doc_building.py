@@ -1,13 +1,20 @@
+import hashlib
 import os.path
 import shutil
+import socket
 import uuid
 import re
 
+from django.conf import settings
 from django.test import TestCase
+from django.test.utils import override_settings
 from django.contrib.auth.models import User
+from mock import patch, MagicMock
 
 from projects.models import Project
+from projects.utils import BuildLog
 from builds.models import Version
+from projects import tasks
 from doc_builder.environments import (DockerEnvironment, DockerBuildCommand,
                                       BuildCommand)
 from rtd_tests.utils import make_test_git
@@ -36,6 +43,213 @@ class TestBuilding(RTDTestCase):
         super(TestBuilding, self).tearDown()
 
 
+class TestSetupEnvironment(RTDTestCase):
+    fixtures = ['eric.json', 'test_data.json']
+
+    def setUp(self):
+        super(TestSetupEnvironment, self).setUp()
+        # Installing changes the working directory
+        self.build_dir = settings.DOCROOT = os.path.abspath(self.build_dir)
+        self.project = Project.objects.get(slug='pip')
+        self.project.documentation_type = 'sphinx'
+        self.project.save()
+        self.version = self.project.versions.get(slug='0.8')
+        checkout_path = self.project.checkout_path(self.version.slug)
+        os.makedirs(checkout_path)
+        self.requirements = os.path.join(checkout_path, 'requirements.txt')
+        with open(self.requirements, 'w') as f:
+            f.write('six\n')
+        os.makedirs(self.project.venv_path(self.version.slug))
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        super(TestSetupEnvironment, self).tearDown()
+
+    def setup_environment(self):
+        with override_settings(WHEEL_CACHE_PATH=os.path.join(self.build_dir, 'wheels')):
+            with patch('projects.tasks.run', return_value=(0, '', '')) as run:
+                results = tasks.setup_environment(self.version)
+        return results, [call[0][0] for call in run.call_args_list]
+
+    def test_environment_is_reused(self):
+        results, commands = self.setup_environment()
+        self.assertIn('doc_builder', results)
+        self.assertTrue(any(' wheel ' in command for command in commands))
+        self.assertTrue(any('install --exists-action=w' in command for command in commands))
+
+        results, commands = self.setup_environment()
+        self.assertNotIn('doc_builder', results)
+        self.assertEqual(commands, [])
+
+        # Changed requirements need a new environment
+        with open(self.requirements, 'w') as f:
+            f.write('six==1.9.0\n')
+        results, commands = self.setup_environment()
+        self.assertIn('doc_builder', results)
+
+
+class TestBuildFingerprint(RTDTestCase):
+    fixtures = ['eric.json', 'test_data.json']
+
+    def setUp(self):
+        super(TestBuildFingerprint, self).setUp()
+        self.project = Project.objects.get(slug='pip')
+        self.project.documentation_type = 'mkdocs'
+        self.version = self.project.versions.get(slug='0.8')
+        self.version.project = self.project
+        checkout_path = self.project.checkout_path(self.version.slug)
+        os.makedirs(checkout_path)
+        with open(os.path.join(checkout_path, 'mkdocs.yml'), 'w') as f:
+            f.write('site_name: Pip\n')
+        os.makedirs(self.project.artifact_path(version='0.8', type='mkdocs'))
+
+    def write_fingerprints(self, fingerprint, **results):
+        results.setdefault('html', (0, '', ''))
+        tasks.write_artifact_fingerprints(self.version, fingerprint, results)
+
+    def test_fingerprint(self):
+        fingerprint = tasks.build_fingerprint(self.version, 'abc123')
+        self.assertEqual(fingerprint, tasks.build_fingerprint(self.version, 'abc123'))
+        self.assertNotEqual(fingerprint, tasks.build_fingerprint(self.version, 'def456'))
+        self.assertNotEqual(fingerprint, tasks.build_fingerprint(self.version, 'abc123', search=False))
+        self.assertEqual(tasks.build_fingerprint(self.version, None), None)
+
+        with open(os.path.join(self.project.checkout_path('0.8'), 'mkdocs.yml'), 'w') as f:
+            f.write('site_name: Other\n')
+        self.assertNotEqual(fingerprint, tasks.build_fingerprint(self.version, 'abc123'))
+
+    def test_reuse_build(self):
+        fingerprint = tasks.build_fingerprint(self.version, 'abc123')
+        os.makedirs(self.project.artifact_path(version='0.8', type='mkdocs_json'))
+        self.write_fingerprints(fingerprint, search=(1, '', 'failed'))
+        results = tasks.reuse_build(self.version, fingerprint)
+        self.assertEqual(results['html'][0], 0)
+        # Search output is left from an older build
+        self.assertNotIn('search', results)
+
+    def test_no_reuse(self):
+        fingerprint = tasks.build_fingerprint(self.version, 'abc123')
+        self.assertEqual(tasks.reuse_build(self.version, fingerprint), None)
+        self.write_fingerprints('other')
+        self.assertEqual(tasks.reuse_build(self.version, fingerprint), None)
+        # A build that started with the same fingerprint changed the output
+        self.write_fingerprints(fingerprint)
+        tasks.clear_artifact_fingerprints(self.version)
+        self.assertEqual(tasks.reuse_build(self.version, fingerprint), None)
+        self.write_fingerprints(fingerprint)
+        shutil.rmtree(self.project.artifact_path(version='0.8', type='mkdocs'))
+        self.assertEqual(tasks.reuse_build(self.version, fingerprint), None)
+
+
+class TestRunBuilders(TestCase):
+    fixtures = ['eric.json', 'test_data.json']
+
+    def setUp(self):
+        self.version = Project.objects.get(slug='pip').versions.get(slug='0.8')
+
+    def fake_builder(self, builder_type):
+        def build():
+            return int(builder_type == 'sphinx_epub'), builder_type, ''
+        builder = MagicMock(spec=['build', 'move', 'start_from', 'clean_doctrees'])
+        builder.build.side_effect = build
+        self.builders[builder_type] = builder
+        return lambda version: builder
+
+    @override_settings(BUILD_CPU_BUDGET=2)
+    def test_run_builders(self):
+        self.builders = {}
+        with patch('projects.tasks.get_builder_class', self.fake_builder):
+            results = tasks.run_builders(self.version, [
+                ('search', 'sphinx_search', False),
+                ('pdf', 'sphinx_pdf', True),
+                ('epub', 'sphinx_epub', False),
+            ], doctrees='/tmp/doctrees')
+        self.assertEqual(results['search'], (0, 'sphinx_search', ''))
+        self.assertEqual(results['epub'], (1, 'sphinx_epub', ''))
+        for builder in self.builders.values():
+            builder.start_from.assert_called_with('/tmp/doctrees')
+            builder.clean_doctrees.assert_called_with()
+        self.assertTrue(self.builders['sphinx_search'].move.called)
+        self.assertTrue(self.builders['sphinx_pdf'].move.called)
+        self.assertFalse(self.builders['sphinx_epub'].move.called)
+
+    def test_builder_error(self):
+        def broken_builder(builder_type):
+            raise ValueError(builder_type)
+        with patch('projects.tasks.get_builder_class', broken_builder):
+            results = tasks.run_builders(self.version, [('search', 'sphinx_search', False)])
+        self.assertEqual(results, {})
+
+
+class TestDoctreeCache(RTDTestCase):
+    fixtures = ['eric.json', 'test_data.json']
+
+    def setUp(self):
+        super(TestDoctreeCache, self).setUp()
+        self.build_dir = settings.DOCROOT = os.path.abspath(self.build_dir)
+        self.project = Project.objects.get(slug='pip')
+        self.version = self.project.versions.get(slug='0.8')
+        self.version.project = self.project
+        docs_dir = os.path.join(self.project.checkout_path('0.8'), 'docs')
+        os.makedirs(docs_dir)
+        self.conf_file = os.path.join(docs_dir, 'conf.py')
+        with open(self.conf_file, 'w') as f:
+            f.write('project = "pip"\n')
+
+    def builder(self):
+        from doc_builder.backends.sphinx import HtmlBuilder
+        builder = HtmlBuilder(self.version)
+        builder.prepare_doctrees()
+        return builder
+
+    def test_doctrees_are_kept(self):
+        builder = self.builder()
+        self.assertEqual(builder.doctrees, self.project.doctree_path('0.8'))
+        pickle = os.path.join(builder.doctrees, 'environment.pickle')
+        open(pickle, 'w').close()
+        self.builder()
+        self.assertTrue(os.path.exists(pickle))
+
+        # Forced builds and conf.py changes start from scratch
+        builder = self.builder()
+        builder.force()
+        builder.prepare_doctrees()
+        self.assertFalse(os.path.exists(pickle))
+
+        open(pickle, 'w').close()
+        with open(self.conf_file, 'a') as f:
+            f.write('extensions = []\n')
+        self.builder()
+        self.assertFalse(os.path.exists(pickle))
+
+    def test_only_forced_builds_start_over(self):
+        builder = self.builder()
+        pickle = os.path.join(builder.doctrees, 'environment.pickle')
+        open(pickle, 'w').close()
+        with patch('doc_builder.backends.sphinx.run') as run:
+            with patch.object(builder, 'clean'):
+                builder.build()
+                self.assertNotIn(' -E ', run.call_args[0][0])
+                self.assertTrue(os.path.exists(pickle))
+
+                builder.force()
+                builder.build()
+                self.assertIn(' -E ', run.call_args[0][0])
+                self.assertFalse(os.path.exists(pickle))
+
+    def test_build_docs_forces_only_when_asked(self):
+        builder = MagicMock()
+        builder.build.return_value = (1, '', '')
+        with patch('projects.tasks.get_builder_class', lambda t: lambda v: builder):
+            tasks.build_docs(self.version, force=False, search=False,
+                             localmedia=False)
+            self.assertFalse(builder.force.called)
+            tasks.build_docs(self.version, force=True, search=False,
+                             localmedia=False)
+            self.assertTrue(builder.force.called)
+
+
 class TestDockerEnvironment(TestCase):
     '''Test docker build environment'''
 
@@ -109,6 +323,136 @@ class TestBuildCommand(TestCase):
         self.assertEqual(cmd.error, "FOOBAR")
 
 
+class TestRecordBuild(TestCase):
+
+    def setUp(self):
+        self.api = MagicMock()
+        self.api.build.return_value.get.return_value = {
+            'id': 1, 'state': 'triggered', 'setup': '', 'resource_uri': 'x',
+        }
+        with patch.object(tasks, 'api', self.api):
+            self.build = tasks.create_build(1)
+
+    def sent(self):
+        return [call[0][0] for call in
+                self.api.build.return_value.patch.call_args_list]
+
+    def test_only_changes_are_sent(self):
+        results = {'checkout': (0, 'cloned', '')}
+        tasks.record_build(api=self.api, record=True, build=self.build,
+                           results=results, state='cloning')
+        tasks.record_build(api=self.api, record=True, build=self.build,
+                           results=results, state='cloning')
+        results['html'] = (0, 'built', '')
+        tasks.record_build(api=self.api, record=True, build=self.build,
+                           results=results, state='finished')
+        first, second = self.sent()
+        self.assertEqual(first['state'], 'cloning')
+        self.assertIn('cloned', first['setup'])
+        self.assertNotIn('id', first)
+        self.assertNotIn(tasks.RECORDED_KEY, first)
+        self.assertEqual(first['builder'], socket.gethostname())
+        self.assertEqual(
+            sorted(second.keys()), ['error', 'output', 'state', 'success'])
+        self.assertIn('built', second['output'])
+
+
+class TestOutputCapture(RTDTestCase):
+
+    def test_output_limit(self):
+        cmd = BuildCommand(
+            '/bin/bash -c "seq 1 10000; echo -n FOOBAR 1>&2"',
+            output_limit=100)
+        with cmd:
+            cmd.run()
+        self.assertRegexpMatches(cmd.output, r'^\[\d+ bytes of output truncated\]\n')
+        self.assertTrue(cmd.output.endswith('\n9999\n10000\n'))
+        self.assertEqual(len(cmd.output.split('\n', 1)[1]), 100)
+        self.assertEqual(cmd.error, 'FOOBAR')
+
+    def test_run_output_limit(self):
+        with patch('projects.utils.BUILD_OUTPUT_LIMIT', 100):
+            truncated = tasks.run('seq 1 10000')[1]
+            # Callers that parse the output get all of it
+            full = tasks.run('seq 1 10000', limit=None)[1]
+        self.assertRegexpMatches(truncated, r'^\[\d+ bytes of output truncated\]\n')
+        self.assertEqual(full.split(), [str(i) for i in range(1, 10001)])
+
+    def test_build_log(self):
+        log_dir = os.path.join(self.build_dir, 'logs', 'latest')
+        paths = [os.path.join(log_dir, '%s.log' % build) for build in (1, 2, 3)]
+        tasks.open_build_log(paths[0])
+        try:
+            # A concurrent build doesn't touch the log of the first one
+            second = BuildLog(paths[1])
+            tasks.run('echo first')
+            second.close()
+        finally:
+            tasks.close_build_log()
+        with open(paths[0]) as log_file:
+            self.assertEqual(log_file.read(), '$ echo first\nfirst\n')
+        os.utime(paths[0], (0, 0))
+        # Output isn't logged once the build log is closed
+        tasks.run('echo third')
+        with open(paths[0]) as log_file:
+            self.assertNotIn('third', log_file.read())
+        # Only the most recent logs are kept
+        BuildLog(paths[2], backups=1).close()
+        self.assertFalse(os.path.exists(paths[0]))
+        self.assertTrue(os.path.exists(paths[1]))
+
+
+class TestFileify(RTDTestCase):
+
+    def setUp(self):
+        super(TestFileify, self).setUp()
+        self.project = Project.objects.create(name='Pip', slug='pip')
+        self.version = self.project.versions.get(slug='latest')
+
+    def write(self, path, contents='<html></html>'):
+        filename = os.path.join(self.build_dir, path)
+        if not os.path.exists(os.path.dirname(filename)):
+            os.makedirs(os.path.dirname(filename))
+        with open(filename, 'w') as f:
+            f.write(contents)
+        return filename
+
+    def synced(self):
+        return sorted(self.version.imported_files.values_list(
+            'path', 'name', 'commit'))
+
+    def test_sync(self):
+        files = {
+            'index.html': self.write('index.html'),
+            'api/utils.html': self.write('api/utils.html'),
+        }
+        stats = tasks.sync_imported_files(self.version, 'abc', files)
+        self.assertEqual(stats, {'created': 2, 'updated': 0, 'deleted': 0})
+        index_pk = self.version.imported_files.get(path='index.html').pk
+
+        del files['api/utils.html']
+        files['new.html'] = self.write('new.html')
+        stats = tasks.sync_imported_files(self.version, 'def', files)
+        self.assertEqual(stats, {'created': 1, 'updated': 1, 'deleted': 1})
+        self.assertEqual(self.synced(), [('index.html', 'index.html', 'def'),
+                                         ('new.html', 'new.html', 'def')])
+        # Existing files are updated in place
+        self.assertEqual(
+            self.version.imported_files.get(path='index.html').pk, index_pk)
+
+        stats = tasks.sync_imported_files(self.version, 'def', files)
+        self.assertEqual(stats, {'created': 0, 'updated': 0, 'deleted': 0})
+
+    def test_sync_md5(self):
+        files = {'index.html': self.write('index.html', 'old')}
+        tasks.sync_imported_files(self.version, 'abc', files, md5=True)
+        self.write('index.html', 'new')
+        stats = tasks.sync_imported_files(self.version, 'abc', files, md5=True)
+        self.assertEqual(stats, {'created': 1, 'updated': 0, 'deleted': 1})
+        imported = self.version.imported_files.get()
+        self.assertEqual(imported.md5, hashlib.md5('new').hexdigest())
+
+
 class TestDockerBuildCommand(TestCase):
     '''Test docker build commands'''
 
@@ -0,0 +1,62 @@
+import os
+import shutil
+import tempfile
+
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from projects import tasks
+from projects.models import Project
+from projects.utils import (build_downloads_manifest, get_downloads_manifest,
+                            save_downloads_manifest)
+
+
+class TestDownloadsManifest(TestCase):
+    fixtures = ["eric", "test_data"]
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.settings = override_settings(
+            MEDIA_ROOT=os.path.join(self.root, 'media'),
+            DOCROOT=os.path.join(self.root, 'docs'),
+            DEFAULT_PRIVACY_LEVEL='public',
+        )
+        self.settings.enable()
+        self.pip = Project.objects.get(slug='pip')
+        pdf_path = self.pip.get_production_media_path(type='pdf', version_slug='0.8')
+        os.makedirs(os.path.dirname(pdf_path))
+        with open(pdf_path, 'w') as f:
+            f.write('pdf')
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.root)
+
+    def test_build_manifest(self):
+        manifest = build_downloads_manifest(self.pip, '0.8')
+        self.assertEqual(manifest.keys(), ['pdf'])
+        self.assertEqual(manifest['pdf']['size'], 3)
+        self.assertEqual(manifest['pdf']['md5'], '437175ba4191210ee004e1d937494d09')
+        self.assertNotIn('md5', build_downloads_manifest(self.pip, '0.8', checksum=False)['pdf'])
+
+    def test_saved_manifest_is_used(self):
+        save_downloads_manifest(self.pip, '0.8', {'epub': {'size': 1, 'modified': 0}})
+        self.assertEqual(get_downloads_manifest(self.pip, '0.8').keys(), ['epub'])
+        self.assertTrue(self.pip.has_epub('0.8'))
+        self.assertFalse(self.pip.has_pdf('0.8'))
+
+    def test_missing_manifest_is_probed(self):
+        self.assertTrue(self.pip.has_pdf('0.8'))
+        self.assertFalse(self.pip.has_htmlzip('0.8'))
+        version = self.pip.versions.get(slug='0.8')
+        self.assertEqual(version.get_downloads(pretty=True).keys(), ['PDF'])
+
+    def test_cleared_artifacts_not_listed(self):
+        save_downloads_manifest(self.pip, '0.8', build_downloads_manifest(self.pip, '0.8'))
+        version = self.pip.versions.get(slug='0.8')
+        with patch.object(tasks, 'invalidate_downloads_manifest') as invalidate:
+            tasks.clear_artifacts(version.pk)
+        invalidate.assert_called_once_with(version.project, '0.8')
+        self.assertFalse(os.path.exists(self.pip.downloads_manifest_path('0.8')))
+        self.assertEqual(get_downloads_manifest(self.pip, '0.8'), {})
@@ -1,7 +1,11 @@
 import json
 
+from django.core.cache import cache
 from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
 
+from core import resolver
 from projects.models import Project
 
 
@@ -12,6 +16,7 @@ class Testmaker(TestCase):
         self.client.login(username='eric', password='test')
         self.pip = Project.objects.get(slug='pip')
         self.latest = self.pip.versions.create_latest()
+        resolver.local_cache.clear()
 
     def test_footer(self):
         r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
@@ -28,3 +33,28 @@ class Testmaker(TestCase):
         self.assertEqual(resp['version_active'], False)
         self.assertEqual(r.status_code, 200)
 
+    @override_settings(PRODUCTION_DOMAIN='testserver')
+    def test_footer_bookmarks(self):
+        r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
+        self.assertIn('bookmark-icon', json.loads(r.content)['html'])
+        self.client.logout()
+        r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
+        self.assertNotIn('bookmark-icon', json.loads(r.content)['html'])
+
+    def test_footer_is_cached(self):
+        cached = {}
+        with patch.object(cache, 'get', lambda key: cached.get(key)), \
+                patch.object(cache, 'set', lambda key, value, timeout: cached.update({key: value})), \
+                patch.object(cache, 'delete', lambda key: cached.pop(key, None)):
+            self.client.logout()
+            r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
+            self.assertEqual(r.status_code, 200)
+            with self.assertNumQueries(0):
+                r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
+            self.assertEqual(json.loads(r.content)['version_active'], True)
+
+            # Saving the version changes the cache key of the footer
+            self.latest.active = False
+            self.latest.save()
+            r = self.client.get('/api/v2/footer_html/?project=pip&version=latest&page=index', {})
+            self.assertEqual(json.loads(r.content)['version_active'], False)
@@ -3,16 +3,23 @@ from django.core.cache import cache
 from django.utils import unittest
 from django.test.client import RequestFactory
 from django.test.utils import override_settings
+from mock import patch, call, ANY, MagicMock
 
+from core import cnames
 from core.middleware import SubdomainMiddleware
 
 
+class NoCname(Exception):
+    pass
+
+
 class MiddlewareTests(unittest.TestCase):
 
     def setUp(self):
         self.factory = RequestFactory()
         self.middleware = SubdomainMiddleware()
         self.url = '/'
+        cnames.local_cache.clear()
 
     def test_failey_cname(self):
         request = self.factory.get(self.url, HTTP_HOST='my.host.com')
@@ -28,8 +35,8 @@ class MiddlewareTests(unittest.TestCase):
         self.assertEqual(request.subdomain, True)
         self.assertEqual(request.slug, 'pip')
 
+    @patch.object(cache, 'get', lambda x: 'my_slug')
     def test_proper_cname(self):
-        cache.get = lambda x: 'my_slug'
         request = self.factory.get(self.url, HTTP_HOST='my.valid.homename')
         self.middleware.process_request(request)
         self.assertEqual(request.urlconf, 'core.subdomain_urls')
@@ -49,3 +56,80 @@ class MiddlewareTests(unittest.TestCase):
         request = self.factory.get(self.url, HTTP_HOST='doesnt.really.matter')
         ret_val = self.middleware.process_request(request)
         self.assertEqual(ret_val, None)
+
+
+@patch.object(cnames, 'CNAME_REFRESH_INTERVAL', 0)
+class CnameTests(unittest.TestCase):
+
+    def setUp(self):
+        cnames.local_cache.clear()
+        self.redis = MagicMock()
+        patcher = patch.object(cnames, 'redis_client', lambda: self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_cname_cached(self):
+        with patch.object(cnames, 'cname_to_slug', return_value='pip') as query:
+            self.assertEqual(cnames.get_cname_slug('docs.pip.org'), 'pip')
+            self.assertEqual(cnames.get_cname_slug('DOCS.pip.org'), 'pip')
+        self.assertEqual(query.call_count, 1)
+        self.redis.sadd.assert_called_once_with('rtd_slug:v1:pip', 'docs.pip.org')
+
+    def test_missing_cname_cached(self):
+        with patch.object(cnames, 'NO_CNAME_ERRORS', (NoCname,)):
+            with patch.object(cnames, 'cname_to_slug',
+                              side_effect=NoCname) as query:
+                self.assertEqual(cnames.get_cname_slug('bad.host.com'), None)
+                self.assertEqual(cnames.get_cname_slug('bad.host.com'), None)
+        self.assertEqual(query.call_count, 1)
+        self.assertFalse(self.redis.sadd.called)
+
+    def test_failed_lookup_not_cached(self):
+        with patch.object(cnames, 'cname_to_slug', side_effect=Exception) as query:
+            self.assertEqual(cnames.get_cname_slug('slow.host.com'), None)
+            self.assertEqual(cnames.get_cname_slug('slow.host.com'), None)
+        self.assertEqual(query.call_count, 2)
+
+    def test_missing_slug_is_not_a_slug(self):
+        with patch.object(cnames, 'cname_to_slug', return_value='missing'):
+            self.assertEqual(cnames.get_cname_slug('docs.missing.org'), 'missing')
+
+    def test_refresh_moves_host(self):
+        self.redis.scan_iter.return_value = ['rtd_slug:v1:pip']
+        self.redis.smembers.return_value = ['docs.pip.org', 'gone.pip.org']
+        slugs = {'docs.pip.org': 'pypa'}
+        with patch.object(cnames, 'cname_to_slug', slugs.get):
+            self.assertEqual(cnames.refresh_cnames(), 1)
+        self.assertEqual(self.redis.srem.call_args_list, [
+            call('rtd_slug:v1:pip', 'docs.pip.org'),
+            call('rtd_slug:v1:pip', 'gone.pip.org'),
+        ])
+        self.redis.sadd.assert_called_once_with('rtd_slug:v1:pypa', 'docs.pip.org')
+
+    def test_refresh_drops_missing_host(self):
+        self.redis.scan_iter.return_value = ['rtd_slug:v1:pip']
+        self.redis.smembers.return_value = ['gone.pip.org']
+        with patch.object(cnames, 'NO_CNAME_ERRORS', (NoCname,)), \
+                patch.object(cnames, 'cname_to_slug', side_effect=NoCname), \
+                patch.object(cnames, 'cache') as shared_cache:
+            self.assertEqual(cnames.refresh_cnames(), 0)
+        self.assertFalse(shared_cache.set.called)
+        self.redis.srem.assert_called_once_with('rtd_slug:v1:pip', 'gone.pip.org')
+
+    def test_refresh_keeps_failed_host(self):
+        self.redis.scan_iter.return_value = ['rtd_slug:v1:pip']
+        self.redis.smembers.return_value = ['slow.pip.org']
+        with patch.object(cnames, 'cname_to_slug', side_effect=Exception), \
+                patch.object(cnames, 'cache') as shared_cache:
+            self.assertEqual(cnames.refresh_cnames(), 0)
+        self.assertFalse(shared_cache.set.called)
+        self.assertFalse(self.redis.srem.called)
+
+    def test_refresh_locked(self):
+        self.redis.execute_command.return_value = None
+        with patch.object(cnames, 'refresh_cnames') as refresh:
+            cnames._refresh()
+        self.assertFalse(refresh.called)
+        self.redis.execute_command.assert_called_once_with(
+            'SET', 'rtd_cname_refresh:v1', ANY, 'NX', 'EX',
+            cnames.CNAME_REFRESH_INTERVAL)
@@ -2,6 +2,10 @@ from django.test import TestCase
 import json
 import logging
 
+from mock import patch, MagicMock
+import redis
+
+from builds import scheduler
 from projects.models import Project
 from projects import tasks
 
@@ -123,3 +127,30 @@ class PostCommitTest(TestCase):
         r = self.client.post('/build/%s' % rtd.pk, {'version_slug': 'master'})
         self.assertEqual(r.status_code, 302)
         self.assertEqual(r._headers['location'][1], 'http://testserver/builds/read-the-docs/')
+
+    def triggered_builds(self, url, data):
+        update_docs = MagicMock()
+        with patch.object(tasks, 'update_docs', update_docs), \
+                patch.object(scheduler, '_schedule',
+                             side_effect=redis.ConnectionError):
+            self.client.post(url, data)
+        return [call[1] for call in update_docs.delay.call_args_list]
+
+    def test_webhook_builds_not_forced(self):
+        rtd = Project.objects.get(slug='read-the-docs')
+        self.payload['ref'] = 'refs/heads/master'
+        for url, data in (('/github/', {'payload': json.dumps(self.payload)}),
+                          ('/build/%s' % rtd.pk, {'version_slug': 'latest'}),
+                          ('/build/%s' % rtd.pk, {})):
+            builds = self.triggered_builds(url, data)
+            self.assertTrue(builds, url)
+            # Unchanged commits reuse the output of the last build
+            self.assertEqual([kwargs['force'] for kwargs in builds],
+                             [False] * len(builds))
+
+    def test_user_rebuild_forced(self):
+        rtd = Project.objects.get(slug='read-the-docs')
+        builds = self.triggered_builds('/build/%s' % rtd.pk,
+                                       {'version_slug': 'latest', 'force': 'true'})
+        self.assertEqual(len(builds), 1)
+        self.assertTrue(builds[0]['force'])
@@ -3,7 +3,9 @@ from django.test.utils import override_settings
 
 from builds.constants import LATEST
 from projects.models import Project
+from core import resolver
 from redirects.models import Redirect
+from redirects.utils import RedirectMatcher
 
 import logging
 
@@ -195,6 +197,7 @@ class RedirectAppTests(TestCase):
              'documentation_type': 'sphinx'})
         self.pip = Project.objects.get(slug='pip')
         self.pip.versions.create_latest()
+        resolver.local_cache.clear()
 
     @override_settings(USE_SUBDOMAIN=True)
     def test_redirect_root(self):
@@ -231,3 +234,65 @@ class RedirectAppTests(TestCase):
         self.assertEqual(r.status_code, 302)
         self.assertEqual(
             r['Location'], 'http://pip.readthedocs.org/en/latest/faq/')
+
+    @override_settings(USE_SUBDOMAIN=True)
+    def test_redirect_exact_rest(self):
+        Redirect.objects.create(
+            project=self.pip, redirect_type='exact',
+            from_url='/old/$rest', to_url='/en/latest/')
+        r = self.client.get('/old/api/index.html', HTTP_HOST='pip.readthedocs.org')
+        self.assertEqual(r.status_code, 302)
+        self.assertEqual(
+            r['Location'], 'http://pip.readthedocs.org/en/latest/api/index.html')
+
+    @override_settings(USE_SUBDOMAIN=True)
+    def test_redirect_deleted(self):
+        redirect = Redirect.objects.create(
+            project=self.pip, redirect_type='prefix', from_url='/woot/')
+        r = self.client.get('/woot/faq.html', HTTP_HOST='pip.readthedocs.org')
+        self.assertEqual(r.status_code, 302)
+        redirect.delete()
+        r = self.client.get('/woot/faq.html', HTTP_HOST='pip.readthedocs.org')
+        self.assertEqual(r.status_code, 404)
+
+
+class RedirectMatcherTests(TestCase):
+
+    def test_exact_match(self):
+        matcher = RedirectMatcher([
+            ('page', '/install.html', '/tutorial/install.html'),
+            ('exact', '/faq.html', 'http://example.com/faq.html'),
+        ])
+        self.assertEqual(matcher.match('/install.html'),
+                         ('page', '/install.html', '/tutorial/install.html'))
+        self.assertEqual(matcher.match('/faq.html'),
+                         ('exact', '/faq.html', 'http://example.com/faq.html'))
+        self.assertEqual(matcher.match('/install.htm'), None)
+        self.assertEqual(matcher.match('/'), None)
+
+    def test_prefix_match(self):
+        matcher = RedirectMatcher([
+            ('prefix', '/woot/', ''),
+            ('exact', '/en/0.8/$rest', '/en/latest/'),
+        ])
+        self.assertEqual(matcher.match('/woot/faq.html'),
+                         ('prefix', '/woot/', ''))
+        self.assertEqual(matcher.match('/en/0.8/api/'),
+                         ('rest', '/en/0.8/', '/en/latest/'))
+        self.assertEqual(matcher.match('/woo'), None)
+        self.assertEqual(matcher.match('/en/0.9/api/'), None)
+
+    def test_first_redirect_wins(self):
+        matcher = RedirectMatcher([
+            ('prefix', '/en/', ''),
+            ('prefix', '/en/latest/', ''),
+            ('sphinx_html', '', ''),
+        ])
+        self.assertEqual(matcher.match('/en/latest/faq/'), ('prefix', '/en/', ''))
+        matcher = RedirectMatcher([
+            ('sphinx_html', '', ''),
+            ('page', '/en/latest/faq/', '/faq.html'),
+            ('prefix', '/en/', ''),
+        ])
+        self.assertEqual(matcher.match('/en/latest/faq/'), ('sphinx_html', '', ''))
+        self.assertEqual(matcher.match('/en/latest/faq.html'), ('prefix', '/en/', ''))
@@ -0,0 +1,100 @@
+from django.contrib.auth.models import AnonymousUser
+from django.test import TestCase
+
+from builds.models import Version
+from core import resolver
+from core.views import get_suggestion
+from projects.models import Project
+
+
+class TestResolver(TestCase):
+    fixtures = ["eric", "test_data"]
+
+    def setUp(self):
+        resolver.local_cache.clear()
+        self.pip = Project.objects.get(slug='pip')
+
+    def test_project_data_is_cached(self):
+        data = resolver.get_project_data('pip')
+        self.assertEqual(data['language'], self.pip.language)
+        self.assertIn('0.8', data['versions'])
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.get_project_data('pip'), data)
+
+    def test_missing_project(self):
+        self.assertEqual(resolver.get_project_data('no-such-project'), None)
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.get_project_data('no-such-project'), None)
+
+    def test_save_invalidates(self):
+        self.assertFalse(resolver.get_project_data('pip')['single_version'])
+        self.pip.single_version = True
+        self.pip.save()
+        self.assertTrue(resolver.get_project_data('pip')['single_version'])
+
+        version = self.pip.versions.get(slug='0.8')
+        version.privacy_level = 'private'
+        version.save()
+        self.assertFalse(resolver.is_public(resolver.get_project_data('pip'), '0.8'))
+
+    def test_delete_invalidates(self):
+        self.assertIn('0.8', resolver.get_project_data('pip')['versions'])
+        self.pip.versions.get(slug='0.8').delete()
+        self.assertNotIn('0.8', resolver.get_project_data('pip')['versions'])
+
+        self.pip.delete()
+        self.assertEqual(resolver.get_project_data('pip'), None)
+
+    def test_deleted_translation_invalidates(self):
+        Project.objects.create(name='PIP-ES', slug='pip-es', language='es',
+                               main_language_project=self.pip)
+        resolver.get_project_data('pip-es')
+        self.pip.delete()
+        self.assertEqual(resolver.get_project_data('pip-es'), None)
+
+    def test_is_public(self):
+        data = resolver.get_project_data('pip')
+        self.assertTrue(resolver.is_public(data, '0.8'))
+        self.assertFalse(resolver.is_public(data, 'no-such-version'))
+        self.assertFalse(resolver.is_public(None, '0.8'))
+
+    def test_availability(self):
+        matrix = resolver.get_availability('pip')
+        self.assertEqual(matrix['project']['slug'], 'pip')
+        self.assertEqual(matrix['translations'], [])
+        self.assertEqual(sorted(matrix['project']['public_versions']),
+                         ['0.8', '0.8.1'])
+
+        # Saving a translation drops the matrix of its main project
+        Project.objects.create(name='PIP-ES', slug='pip-es', language='es',
+                               main_language_project=self.pip)
+        matrix = resolver.get_availability('pip')
+        self.assertEqual([t['slug'] for t in matrix['translations']], ['pip-es'])
+
+        resolver.update_availability(Project.objects.get(slug='pip-es'))
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.get_availability('pip'), matrix)
+
+    def test_suggestion_from_availability(self):
+        get_suggestion('pip', 'en', 'no-such-version', 'index', AnonymousUser())
+        with self.assertNumQueries(0):
+            suggestion = get_suggestion('pip', 'en', 'no-such-version',
+                                        'index', AnonymousUser())
+        self.assertEqual(suggestion['type'], 'list')
+        self.assertEqual(sorted(item['version_slug'] for item in suggestion['list']),
+                         ['0.8', '0.8.1'])
+
+    def test_local_cache_lru(self):
+        cache = resolver.LocalCache(size=2, timeout=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('c'), 3)
+
+    def test_local_cache_expiry(self):
+        cache = resolver.LocalCache(size=2, timeout=-1)
+        cache.set('a', 1)
+        self.assertEqual(cache.get('a'), None)
@@ -0,0 +1,89 @@
+from django.test import TestCase
+from elasticsearch import exceptions
+from elasticsearch.serializer import JSONSerializer
+from mock import Mock, patch
+
+from restapi.utils import index_search_request
+from search.indexes import PageIndex
+
+
+class TestStreamingBulkIndex(TestCase):
+
+    def setUp(self):
+        self.index = PageIndex()
+        self.index.es = Mock()
+        self.index.es.transport.serializer = JSONSerializer()
+        self.index.es.bulk.return_value = {'took': 1, 'errors': False, 'items': []}
+
+    def pages(self, count):
+        for num in range(count):
+            yield {'id': str(num), 'project': 'pip', 'content': 'x' * 100}
+
+    def test_chunk_by_count(self):
+        stats = list(self.index.streaming_bulk_index(self.pages(5), chunk_size=2))
+        self.assertEqual([chunk['docs'] for chunk in stats], [2, 2, 1])
+        self.assertEqual(self.index.es.bulk.call_count, 3)
+        body = self.index.es.bulk.call_args[1]['body']
+        self.assertEqual(len(body.splitlines()), 2)
+
+    def test_chunk_by_bytes(self):
+        doc_bytes = list(self.index.streaming_bulk_index(self.pages(1)))[0]['bytes']
+        max_bytes = doc_bytes * 2 + 10
+        stats = list(self.index.streaming_bulk_index(self.pages(4), max_chunk_bytes=max_bytes))
+        self.assertEqual([chunk['docs'] for chunk in stats], [2, 2])
+        for chunk in stats:
+            self.assertTrue(chunk['bytes'] <= max_bytes)
+
+    @patch('search.indexes.time.sleep')
+    def test_retry_chunk(self, sleep):
+        self.index.es.bulk.side_effect = [
+            exceptions.TransportError(503, 'unavailable'),
+            {'took': 1, 'errors': False, 'items': []},
+        ]
+        stats = list(self.index.streaming_bulk_index(self.pages(1), retry_delay=1))
+        self.assertEqual(stats[0]['retries'], 1)
+        sleep.assert_called_once_with(1)
+
+    def test_no_retry_on_bad_request(self):
+        self.index.es.bulk.side_effect = exceptions.TransportError(400, 'bad')
+        with self.assertRaises(exceptions.TransportError):
+            list(self.index.streaming_bulk_index(self.pages(1)))
+
+    def test_document_errors(self):
+        self.index.es.bulk.return_value = {
+            'took': 1, 'errors': True,
+            'items': [{'index': {'status': 201}},
+                      {'index': {'status': 400, 'error': 'MapperParsingException'}}],
+        }
+        stats = list(self.index.streaming_bulk_index(self.pages(2)))
+        self.assertEqual(stats[0]['errors'], 1)
+
+
+class TestIndexSearchRequest(TestCase):
+
+    def setUp(self):
+        self.version = Mock(slug='latest')
+        self.version.project.slug = 'pip'
+        self.version.project.users.all.return_value = []
+
+    @patch('restapi.utils.ProjectIndex')
+    @patch('restapi.utils.SectionIndex')
+    @patch('restapi.utils.PageIndex')
+    def test_sections_are_batched_with_their_page_parent(self, page_index, section_index, project_index):
+        page_index.return_value.streaming_bulk_index.side_effect = lambda docs, **kwargs: list(docs) and []
+        pages = [
+            {'path': path, 'title': path, 'headers': [], 'content': '',
+             'sections': [{'id': 'one', 'title': 'One', 'content': ''},
+                          {'id': 'two', 'title': 'Two', 'content': ''}]}
+            for path in ['index', 'api']
+        ]
+        index_search_request(self.version, pages, commit='abc', project_scale=0,
+                             page_scale=0, section=True, delete=False)
+
+        section_bulk = section_index.return_value.bulk_index
+        self.assertEqual(section_bulk.call_count, 1)
+        sections = section_bulk.call_args[0][0]
+        self.assertEqual(len(sections), 4)
+        self.assertEqual(section_bulk.call_args[1]['routing'], 'pip')
+        parents = dict((section['path'], section['_parent']) for section in sections)
+        self.assertNotEqual(parents['index'], parents['api'])
@@ -1,8 +1,14 @@
+import json
 import os
+import shutil
+import tempfile
 
 from django.test import TestCase
+from django.test.utils import override_settings
+from mock import Mock
 
-from search.parse_json import process_file
+from search.parse_json import process_file, process_all_json_files
+from search.utils import process_changed_json_files
 
 base_dir = os.path.dirname(os.path.dirname(__file__))
 
@@ -19,3 +25,70 @@ class TestHacks(TestCase):
         # Only capture h2's after the first section
         for obj in data['sections'][1:]:
             self.assertEqual(obj['content'][:5], '\n<h2>')
+
+
+class TestChangedJsonFiles(TestCase):
+
+    def setUp(self):
+        self.json_dir = tempfile.mkdtemp()
+        shutil.copy(os.path.join(base_dir, 'files/api.fjson'),
+                    os.path.join(self.json_dir, 'api.fjson'))
+        self.version = Mock()
+        self.version.project.documentation_type = 'sphinx'
+        self.version.project.full_json_path.return_value = self.json_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.json_dir)
+
+    def test_unchanged_pages_are_skipped(self):
+        page_list, manifest, removed = process_changed_json_files(self.version, {})
+        self.assertEqual([page['path'] for page in page_list], ['api'])
+        self.assertEqual(manifest['api.fjson']['path'], 'api')
+        self.assertEqual(removed, [])
+
+        page_list, new_manifest, removed = process_changed_json_files(self.version, manifest)
+        self.assertEqual(page_list, [])
+        self.assertEqual(new_manifest, manifest)
+        self.assertEqual(removed, [])
+
+    def test_changed_and_removed_pages(self):
+        page_list, manifest, removed = process_changed_json_files(self.version, {})
+        manifest['old.fjson'] = {'digest': 'abc', 'path': 'old'}
+
+        filename = os.path.join(self.json_dir, 'api.fjson')
+        with open(filename) as f:
+            data = json.load(f)
+        data['title'] = 'Changed'
+        with open(filename, 'w') as f:
+            json.dump(data, f)
+
+        page_list, new_manifest, removed = process_changed_json_files(self.version, manifest)
+        self.assertEqual([page['title'] for page in page_list], ['Changed'])
+        self.assertNotEqual(new_manifest['api.fjson']['digest'], manifest['api.fjson']['digest'])
+        self.assertEqual(removed, ['old'])
+
+
+class TestParsingPool(TestCase):
+
+    def setUp(self):
+        self.json_dir = tempfile.mkdtemp()
+        for name in ['api', 'other', 'genindex']:
+            shutil.copy(os.path.join(base_dir, 'files/api.fjson'),
+                        os.path.join(self.json_dir, '%s.fjson' % name))
+        self.version = Mock()
+        self.version.project.full_json_path.return_value = self.json_dir
+
+    def tearDown(self):
+        shutil.rmtree(self.json_dir)
+
+    @override_settings(SEARCH_PARSE_WORKERS=1)
+    def test_serial_parsing(self):
+        pages = list(process_all_json_files(self.version))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[0]['path'], 'api')
+
+    @override_settings(SEARCH_PARSE_WORKERS=2)
+    def test_pool_parsing(self):
+        pages = list(process_all_json_files(self.version))
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[0]['sections'][1]['id'], 'a-basic-api-client-using-slumber')
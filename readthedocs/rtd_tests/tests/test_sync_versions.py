@@ -1,10 +1,13 @@
 import json
 
 from django.test import TestCase
+from guardian.shortcuts import get_objects_for_user
+from mock import patch
 
 from builds.models import Version
 from builds.constants import STABLE
 from projects.models import Project
+from restapi.views import model_views
 
 
 class TestSyncVersions(TestCase):
@@ -266,3 +269,75 @@ class TestSyncVersions(TestCase):
         )
         version_9 = Version.objects.get(slug='0.9')
         self.assertTrue(version_9.active is False)
+
+    def test_many_versions(self):
+        tags = [{'identifier': 'tag-%s' % i, 'verbose_name': '1.%s' % i}
+                for i in range(1200)]
+        tags.append({'identifier': 'origin/master', 'verbose_name': 'master'})
+        r = self.client.post(
+            '/api/v2/project/%s/sync_versions/' % self.pip.pk,
+            data=json.dumps({'tags': tags}),
+            content_type='application/json',
+        )
+        json_data = json.loads(r.content)
+        self.assertEqual(len(json_data['added_versions']), 1200)
+        self.assertEqual(json_data['deleted_versions'], ['to_delete'])
+        stats = json_data['stats']
+        self.assertEqual(stats['tag']['added'], 1200)
+        self.assertEqual(stats['tag']['retyped'], 1)
+        self.assertEqual(stats['deleted']['deleted'], 1)
+        self.assertEqual(Version.objects.get(slug='master').type, 'tag')
+
+        # Owners can view the versions created in bulk
+        eric = self.pip.users.get(username='eric')
+        version = Version.objects.get(project=self.pip, slug='1.1199')
+        self.assertIn(version, get_objects_for_user(eric, 'builds.view_version'))
+
+        # Only the moved tag is updated
+        tags[0]['identifier'] = 'moved'
+        r = self.client.post(
+            '/api/v2/project/%s/sync_versions/' % self.pip.pk,
+            data=json.dumps({'tags': tags}),
+            content_type='application/json',
+        )
+        stats = json.loads(r.content)['stats']
+        self.assertEqual(stats['tag'], dict(stats['tag'], added=0, updated=1,
+                                            retyped=0))
+        self.assertEqual(
+            Version.objects.get(project=self.pip, slug='1.0').identifier,
+            'moved')
+
+    def test_invalidated_after_commit(self):
+        events = []
+
+        class RecordedTransaction(object):
+            def atomic(self):
+                return self
+
+            def __enter__(self):
+                events.append('begin')
+
+            def __exit__(self, *args):
+                events.append('commit')
+
+        version_post_data = {'branches': [
+            {'identifier': 'origin/master', 'verbose_name': 'master'},
+            {'identifier': 'to_delete', 'verbose_name': 'to_delete'},
+        ]}
+        with patch.object(model_views, 'transaction', RecordedTransaction()), \
+                patch.object(model_views, 'invalidate_project',
+                             lambda slug: events.append('invalidate')):
+            self.client.post(
+                '/api/v2/project/%s/sync_versions/' % self.pip.pk,
+                data=json.dumps(version_post_data),
+                content_type='application/json',
+            )
+            self.assertEqual(events, ['begin', 'commit', 'invalidate'])
+            # Nothing changed
+            del events[:]
+            self.client.post(
+                '/api/v2/project/%s/sync_versions/' % self.pip.pk,
+                data=json.dumps(version_post_data),
+                content_type='application/json',
+            )
+            self.assertEqual(events, ['begin', 'commit'])
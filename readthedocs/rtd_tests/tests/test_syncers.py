@@ -0,0 +1,52 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+from mock import patch
+
+from core.utils import run_on_app_servers
+from privacy.backends.syncers import RemoteSyncer, sync_batch
+
+
+@override_settings(MULTIPLE_APP_SERVERS=['web1', 'web2'], SYNC_USER='docs')
+class TestSyncBatch(TestCase):
+
+    def test_commands_run_without_batch(self):
+        with patch('os.system', return_value=0) as system:
+            self.assertEqual(run_on_app_servers('mkdir -p /a'), 0)
+        commands = sorted(call[0][0] for call in system.call_args_list)
+        self.assertEqual(len(commands), 2)
+        self.assertTrue(commands[0].startswith('ssh '))
+        self.assertTrue(commands[0].endswith("docs@web1 'mkdir -p /a'"))
+        self.assertTrue(commands[1].endswith("docs@web2 'mkdir -p /a'"))
+
+    def test_batch_runs_once_per_server(self):
+        def system(command):
+            return 256 if 'web2' in command and 'rsync' in command else 0
+
+        with patch('os.system', side_effect=system) as mock_system:
+            with sync_batch() as batch:
+                RemoteSyncer.copy('/build/html', '/www/html')
+                run_on_app_servers('mkdir -p /a')
+                run_on_app_servers('ln -nsf /b /a/b')
+                self.assertFalse(mock_system.called)
+        self.assertEqual(batch.status, {'web1': 0, 'web2': 256})
+
+        commands = [call[0][0] for call in mock_system.call_args_list]
+        # One rsync and one ssh call with both commands per server
+        self.assertEqual(len(commands), 4)
+        for server in ('web1', 'web2'):
+            rsync, = [command for command in commands
+                      if command.startswith('rsync') and server in command]
+            self.assertIn("--rsync-path='mkdir -p /www/html && rsync'", rsync)
+            self.assertIn('/build/html/ docs@%s:/www/html' % server, rsync)
+            ssh, = [command for command in commands
+                    if command.startswith('ssh') and server in command]
+            self.assertIn('mkdir -p /a; } || status=$?;', ssh)
+            self.assertIn('ln -nsf /b /a/b; } || status=$?;', ssh)
+
+    def test_batch_not_run_on_error(self):
+        with patch('os.system', return_value=0) as system:
+            with self.assertRaises(ValueError):
+                with sync_batch():
+                    run_on_app_servers('mkdir -p /a')
+                    raise ValueError()
+        self.assertFalse(system.called)
@@ -0,0 +1,52 @@
+from django.test import TestCase
+
+from builds.models import Version
+from projects.models import Project
+from projects.templatetags.projects_tags import make_version
+from projects.utils import highest_version, version_sort_key
+
+
+class TestVersionSortKey(TestCase):
+
+    slugs = [
+        'latest', 'stable', 'master', 'feature-x', '0.1', '0.2', '0.10',
+        '1.0', '1.0.1', '1.0a1', '1.0b2', '1.0rc1', '1.0.post1', '1.0.dev3',
+        '2.0.0', '10.0', 'v3.1', '0.9.9.9', '1.0a1.dev2',
+    ]
+
+    def test_sorts_like_make_version(self):
+        versions = [Version(slug=slug) for slug in self.slugs]
+        expected = [version.slug for version in
+                    sorted(versions, key=make_version, reverse=True)]
+        by_key = [version.slug for version in
+                  sorted(versions, key=lambda v: version_sort_key(v.slug),
+                         reverse=True)]
+        self.assertEqual(by_key[:2], ['latest', 'stable'])
+        # Branches tie with each other, everything else is ordered the same
+        branches = set(['master', 'feature-x'])
+        self.assertEqual([slug for slug in by_key if slug not in branches],
+                         [slug for slug in expected if slug not in branches])
+
+    def test_key_marks_versions(self):
+        self.assertTrue(version_sort_key('1.0').endswith('1'))
+        self.assertTrue(version_sort_key('master').endswith('0'))
+        self.assertTrue(version_sort_key('latest').endswith('0'))
+
+
+class TestVersionOrdering(TestCase):
+
+    def setUp(self):
+        self.pip = Project.objects.create(name='Pip', slug='pip')
+        for slug in ['0.9', '0.10', 'master', '1.0rc1', '0.10.1']:
+            Version.objects.create(project=self.pip, identifier=slug,
+                                   verbose_name=slug, slug=slug, active=True)
+
+    def test_ordered_active_versions(self):
+        self.assertEqual(
+            [version.slug for version in self.pip.ordered_active_versions()],
+            ['latest', 'master', '1.0rc1', '0.10.1', '0.10', '0.9'])
+
+    def test_highest_version(self):
+        highest = highest_version(self.pip.versions.filter(active=True))
+        self.assertEqual(highest[0].slug, '1.0rc1')
+        self.assertEqual(str(highest[1]), '1.0rc1')
@@ -15,12 +15,24 @@ TODO: Handle page removal case in Page.
 
 """
 import datetime
+import logging
+import time
 
 from elasticsearch import Elasticsearch, exceptions
-from elasticsearch.helpers import bulk_index
 
 from django.conf import settings
 
+log = logging.getLogger(__name__)
+
+# Limits of a single bulk request, whichever is reached first.
+BULK_CHUNK_SIZE = 500
+BULK_CHUNK_BYTES = 5 * 1024 * 1024
+
+# Bulk requests failing with these statuses are retried with a backoff.
+BULK_RETRY_STATUSES = (429, 502, 503, 504)
+BULK_MAX_RETRIES = 3
+BULK_RETRY_DELAY = 2
+
 
 class Index(object):
     """
@@ -92,7 +104,7 @@ class Index(object):
         return '{0}-{1}'.format(
             self._index, datetime.datetime.now().strftime('%Y%m%d%H%M%S'))
 
-    def create_index(self, index=None):
+    def create_index(self, index=None, settings_override=None):
         """
         Creates index.
 
@@ -101,16 +113,23 @@ class Index(object):
         """
         index = index or self._index
         body = {
-            'settings': self.get_settings(),
+            'settings': self.get_settings(settings_override),
         }
         self.es.indices.create(index=index, body=body)
 
+    def count(self, index=None):
+        """
+        Returns the number of documents of this type in the index.
+        """
+        index = index or self._index
+        return self.es.count(index=index, doc_type=self._type)['count']
+
     def put_mapping(self, index=None):
         index = index or self._index
         self.es.indices.put_mapping(self._type, self.get_mapping(), index)
 
-    def bulk_index(self, data, index=None, chunk_size=500, parent=None,
-                   routing=None):
+    def bulk_index(self, data, index=None, chunk_size=BULK_CHUNK_SIZE,
+                   parent=None, routing=None):
         """
         Given a list of documents, uses Elasticsearch bulk indexing.
 
@@ -119,25 +138,100 @@ class Index(object):
         `chunk_size` defaults to the elasticsearch lib's default. Override per
         your document size as needed.
 
+        Returns the list of per-chunk stats of `streaming_bulk_index`.
+
+        """
+        return list(self.streaming_bulk_index(
+            data, index=index, chunk_size=chunk_size, parent=parent,
+            routing=routing))
+
+    def streaming_bulk_index(self, data, index=None,
+                             chunk_size=BULK_CHUNK_SIZE,
+                             max_chunk_bytes=BULK_CHUNK_BYTES,
+                             parent=None, routing=None,
+                             max_retries=BULK_MAX_RETRIES,
+                             retry_delay=BULK_RETRY_DELAY):
+        """
+        Bulk index the documents of the iterable `data` as it is consumed.
+
+        Documents are serialized one at a time and sent in chunks of at most
+        `chunk_size` documents or `max_chunk_bytes` bytes, so only one chunk
+        is held in memory. Chunks failing with a connection error or a
+        temporary status are retried up to `max_retries` times, waiting
+        `retry_delay` seconds, doubled on every attempt.
+
+        Yields a dict of stats for each chunk sent: the number of `docs`,
+        `bytes`, failed documents in `errors`, `retries` and the time ES
+        `took` in milliseconds.
+
+        A `_parent` key in a document overrides `parent` for that document.
+
         """
         index = index or self._index
-        docs = []
+        serializer = self.es.transport.serializer
+        lines = []
+        chunk_bytes = 0
         for d in data:
             source = self.extract_document(d)
-            doc = {
+            action = {
                 '_index': index,
                 '_type': self._type,
                 '_id': source['id'],
-                '_source': source,
             }
-            if parent:
-                doc['_parent'] = parent
+            doc_parent = d.get('_parent', parent)
+            if doc_parent:
+                action['_parent'] = doc_parent
             if routing:
-                doc['_routing'] = routing
-            docs.append(doc)
-
-        # TODO: This doesn't work with the new ES setup.
-        bulk_index(self.es, docs, chunk_size=chunk_size)
+                action['_routing'] = routing
+            doc_lines = [serializer.dumps({'index': action}),
+                         serializer.dumps(source)]
+            doc_bytes = sum(len(line) + 1 for line in doc_lines)
+            if lines and (len(lines) / 2 >= chunk_size or
+                          chunk_bytes + doc_bytes > max_chunk_bytes):
+                yield self._send_bulk_chunk(lines, chunk_bytes, max_retries,
+                                            retry_delay)
+                lines = []
+                chunk_bytes = 0
+            lines.extend(doc_lines)
+            chunk_bytes += doc_bytes
+        if lines:
+            yield self._send_bulk_chunk(lines, chunk_bytes, max_retries,
+                                        retry_delay)
+
+    def _send_bulk_chunk(self, lines, chunk_bytes, max_retries, retry_delay):
+        body = '\n'.join(lines) + '\n'
+        retries = 0
+        while True:
+            try:
+                resp = self.es.bulk(body=body)
+                break
+            except exceptions.TransportError as e:
+                retryable = (isinstance(e, exceptions.ConnectionError) or
+                             e.status_code in BULK_RETRY_STATUSES)
+                if not retryable or retries >= max_retries:
+                    raise
+                delay = retry_delay * 2 ** retries
+                retries += 1
+                log.warning('Bulk request to %s failed, retry %s in %ss: %s',
+                            self._type, retries, delay, e)
+                time.sleep(delay)
+
+        errors = []
+        if resp.get('errors'):
+            for item in resp['items']:
+                result = item.values()[0]
+                if result.get('status', 500) >= 300:
+                    errors.append(result)
+        if errors:
+            log.error('Unable to index %s %s documents, first error: %s',
+                      len(errors), self._type, errors[0].get('error'))
+        return {
+            'docs': len(lines) / 2,
+            'bytes': chunk_bytes,
+            'errors': len(errors),
+            'retries': retries,
+            'took': resp.get('took'),
+        }
 
     def index_document(self, data, index=None, parent=None, routing=None):
         doc = self.extract_document(data)
@@ -3,47 +3,110 @@
 import codecs
 import fnmatch
 import json
+import multiprocessing
 import os
 
+from django.conf import settings
 from pyquery import PyQuery
 
 import logging
 log = logging.getLogger(__name__)
 
+# Number of files sent to a parsing worker at a time
+PARSE_CHUNK_SIZE = 10
 
-def process_all_json_files(version, build_dir=True):
+
+def find_all_json_files(full_path):
     """
-    Return a list of pages to index
+    Return the list of ``.fjson`` files under ``full_path`` to index
     """
-    if build_dir:
-        full_path = version.project.full_json_path(version.slug)
-    else:
-        full_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
     html_files = []
     for root, dirs, files in os.walk(full_path):
         for filename in fnmatch.filter(files, '*.fjson'):
             if filename in ['search.fjson', 'genindex.fjson', 'py-modindex.fjson']:
                 continue
             html_files.append(os.path.join(root, filename))
-    page_list = []
-    for filename in html_files:
+    return html_files
+
+
+def process_all_json_files(version, build_dir=True):
+    """
+    Yield the pages to index
+    """
+    if build_dir:
+        full_path = version.project.full_json_path(version.slug)
+    else:
+        full_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
+    html_files = find_all_json_files(full_path)
+    for result in map_files(process_file, [(filename,) for filename in html_files]):
+        if result:
+            yield result
+
+
+def map_files(func, args_list):
+    """
+    Yield ``func(*args)`` for each of ``args_list``, in order.
+
+    The calls are fanned out to a pool of ``SEARCH_PARSE_WORKERS`` processes.
+    With a single worker, or when a pool can't be started, they run serially.
+    ``func`` must be a module level function so it can be sent to the pool.
+    Calls that raise are logged and yield ``None``.
+    """
+    workers = getattr(settings, 'SEARCH_PARSE_WORKERS', 1)
+    tasks = [(func, args) for args in args_list]
+    pool = None
+    if workers > 1 and len(tasks) > 1:
         try:
-            result = process_file(filename)
-            if result:
-                page_list.append(result)
-        except:
-            pass
-    return page_list
+            pool = multiprocessing.Pool(processes=workers)
+        except (AssertionError, OSError):
+            # Daemonic processes, like some celery workers, can't have children
+            log.warning('(Search Index) Unable to start parsing pool, parsing serially',
+                        exc_info=True)
+    if pool is None:
+        for task in tasks:
+            yield _apply(task)
+        return
+    try:
+        for result in pool.imap(_apply, tasks, chunksize=PARSE_CHUNK_SIZE):
+            yield result
+    finally:
+        pool.terminate()
+        pool.join()
 
 
-def process_file(filename):
+def _apply(task):
+    func, args = task
+    try:
+        return func(*args)
+    except Exception:
+        log.error('(Search Index) Unable to process: %s' % (args,), exc_info=True)
+        return None
+
+
+def load_file(filename):
+    """
+    Return the decoded JSON data of ``filename``, or ``None`` if unreadable
+    """
     try:
         with codecs.open(filename, encoding='utf-8', mode='r') as f:
             file_contents = f.read()
     except IOError as e:
         log.info('Unable to index file: %s, error :%s' % (filename, e))
-        return
-    data = json.loads(file_contents)
+        return None
+    return json.loads(file_contents)
+
+
+def process_file(filename):
+    data = load_file(filename)
+    if data is None:
+        return None
+    return process_data(data, filename)
+
+
+def process_data(data, filename):
+    """
+    Return the page to index from the decoded JSON ``data`` of ``filename``
+    """
     headers = []
     sections = []
     content = ''
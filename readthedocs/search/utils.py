@@ -4,38 +4,181 @@ import os
 import fnmatch
 import re
 import codecs
+import hashlib
 import logging
 import json
 
 from pyquery import PyQuery
 
+from search import parse_json
+
 log = logging.getLogger(__name__)
 
+# The JSON keys that make up the indexed content of a page. Only changes to
+# these cause a page to be reindexed.
+SPHINX_DIGEST_KEYS = ('current_page_name', 'title', 'toc', 'body')
+MKDOCS_DIGEST_KEYS = ('url', 'content')
+
+
+def find_mkdocs_json_files(full_path):
+    html_files = []
+    for root, dirs, files in os.walk(full_path):
+        for filename in fnmatch.filter(files, '*.json'):
+            html_files.append(os.path.join(root, filename))
+    return html_files
+
 
 def process_mkdocs_json(version, build_dir=True):
+    """
+    Yield the pages to index
+    """
     if build_dir:
         full_path = version.project.full_json_path(version.slug)
     else:
         full_path = version.project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
 
-    html_files = []
-    for root, dirs, files in os.walk(full_path):
-        for filename in fnmatch.filter(files, '*.json'):
-            html_files.append(os.path.join(root, filename))
+    html_files = find_mkdocs_json_files(full_path)
+    for page in parse_json.map_files(process_mkdocs_file, [(filename,) for filename in html_files]):
+        if page:
+            yield page
+
+
+def process_mkdocs_file(filename):
+    data = parse_json.load_file(filename)
+    if data is None:
+        return None
+    return process_mkdocs_data(data, filename)
+
+
+def process_mkdocs_data(data, filename):
+    """
+    Return the page to index from the decoded JSON ``data`` of ``filename``
+    """
+    relative_path = parse_path(data['url'])
+    html = parse_content(documentation_type='mkdocs', content=data['content'])
+    if not html:
+        log.info('(Search Index) Unable to index file: %s, empty file' % (filename))
+    headers = parse_headers(documentation_type='mkdocs', content=data['content'])
+    if not headers:
+        log.error('Unable to index file headers for: %s' % filename)
+    sections = parse_sections(documentation_type='mkdocs', content=data['content'])
+    if not sections:
+        log.error('Unable to index file sections for: %s' % filename)
+    try:
+        title = sections[0]['title']
+    except IndexError:
+        title = relative_path
+    return {'content': html, 'path': relative_path, 'title': title, 'headers': headers, 'sections': sections}
+
+
+def process_changed_file(filename, documentation_type, old_digest=None):
+    """
+    Return the digest of ``filename`` and its page, if it has changed.
+
+    The page is ``None`` when the digest matches ``old_digest``. Returns
+    ``None`` when the file can't be read.
+    """
+    data = parse_json.load_file(filename)
+    if data is None:
+        return None
+    if 'sphinx' in documentation_type:
+        digest = page_digest(data, SPHINX_DIGEST_KEYS)
+        if digest == old_digest:
+            return digest, None
+        return digest, parse_json.process_data(data, filename)
+    digest = page_digest(data, MKDOCS_DIGEST_KEYS)
+    if digest == old_digest:
+        return digest, None
+    return digest, process_mkdocs_data(data, filename)
+
+
+def page_digest(data, keys):
+    """
+    Return a digest of the indexed content of the page JSON ``data``.
+    """
+    content = json.dumps([data.get(key) for key in keys], sort_keys=True)
+    return hashlib.md5(content).hexdigest()
+
+
+def load_search_manifest(version):
+    """
+    Return the search manifest of the last indexed build of ``version``.
+
+    The manifest maps each JSON file, relative to the JSON output directory,
+    to the ``digest`` of its content and the ``path`` it was indexed under.
+    An empty dict is returned when the version was never indexed.
+    """
+    manifest_path = version.project.search_manifest_path(version.slug)
+    try:
+        with open(manifest_path, 'r') as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def save_search_manifest(version, manifest):
+    manifest_path = version.project.search_manifest_path(version.slug)
+    manifest_dir = os.path.dirname(manifest_path)
+    if not os.path.exists(manifest_dir):
+        os.makedirs(manifest_dir)
+    with open(manifest_path, 'w') as f:
+        json.dump(manifest, f)
+
+
+def delete_search_manifest(version):
+    """
+    Forget what was indexed for ``version``, so its next build indexes all
+    of its pages again.
+    """
+    manifest_path = version.project.search_manifest_path(version.slug)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+
+def process_changed_json_files(version, manifest, build_dir=True):
+    """
+    Return the pages of ``version`` that changed since ``manifest``.
+
+    Only files whose digest differs from the one in ``manifest`` are parsed.
+    Returns a tuple of the list of changed pages, the updated manifest, and
+    the paths of the pages that no longer exist.
+    """
+    project = version.project
+    if build_dir:
+        full_path = project.full_json_path(version.slug)
+    else:
+        full_path = project.get_production_media_path(type='json', version_slug=version.slug, include_file=False)
+
+    if 'sphinx' in project.documentation_type:
+        html_files = parse_json.find_all_json_files(full_path)
+    elif 'mkdocs' in project.documentation_type:
+        html_files = find_mkdocs_json_files(full_path)
+    else:
+        return [], {}, []
+
+    relative_filenames = [os.path.relpath(filename, full_path) for filename in html_files]
+    args_list = [
+        (filename, project.documentation_type, manifest.get(relative_filename, {}).get('digest'))
+        for filename, relative_filename in zip(html_files, relative_filenames)
+    ]
+    results = parse_json.map_files(process_changed_file, args_list)
+
     page_list = []
-    for filename in html_files:
-        relative_path = parse_path_from_file(documentation_type='mkdocs', file_path=filename)
-        html = parse_content_from_file(documentation_type='mkdocs', file_path=filename)
-        headers = parse_headers_from_file(documentation_type='mkdocs', file_path=filename)
-        sections = parse_sections_from_file(documentation_type='mkdocs', file_path=filename)
-        try:
-            title = sections[0]['title']
-        except IndexError:
-            title = relative_path
-        page_list.append(
-            {'content': html, 'path': relative_path, 'title': title, 'headers': headers, 'sections': sections}
-        )
-    return page_list
+    new_manifest = {}
+    for relative_filename, result in zip(relative_filenames, results):
+        old_entry = manifest.get(relative_filename)
+        digest, page = result or (None, None)
+        if page:
+            page_list.append(page)
+            new_manifest[relative_filename] = {'digest': digest, 'path': page['path']}
+        elif old_entry:
+            # Either unchanged or failed to parse. On failure the stale digest
+            # makes us retry the file next time.
+            new_manifest[relative_filename] = old_entry
+
+    current_paths = set(entry['path'] for entry in new_manifest.values())
+    removed_paths = sorted(set(entry['path'] for entry in manifest.values()) - current_paths)
+    return page_list, new_manifest, removed_paths
 
 
 def recurse_while_none(element):
@@ -54,8 +197,10 @@ def parse_path_from_file(documentation_type, file_path):
         return ''
 
     page_json = json.loads(content)
-    path = page_json['url']
+    return parse_path(page_json['url'])
+
 
+def parse_path(path):
     # The URLs here should be of the form "path/index". So we need to
     # convert:
     #   "path/" => "path/index"
@@ -2,14 +2,26 @@ import re
 import logging
 import csv
 import os
+import shutil
 from StringIO import StringIO
 
+from django.conf import settings
+
 from projects.exceptions import ProjectImportError
 from vcs_support.backends.github import GithubContributionBackend
 from vcs_support.base import BaseVCS, VCSVersion
+from vcs_support.utils import PathLock
 
 log = logging.getLogger(__name__)
 
+# Clone the checkout of each version from a bare mirror of the repository
+# kept per project, sharing its objects, instead of from the remote.
+GIT_MIRROR_CHECKOUTS = getattr(settings, 'GIT_MIRROR_CHECKOUTS', False)
+# History depth of checkouts cloned from the remote, ``None`` for full clones.
+GIT_CLONE_DEPTH = getattr(settings, 'GIT_CLONE_DEPTH', None)
+# How long a build waits for another build to update the mirror
+GIT_MIRROR_LOCK_SECONDS = getattr(settings, 'GIT_MIRROR_LOCK_SECONDS', 10 * 60)
+
 
 class Backend(BaseVCS):
     supports_tags = True
@@ -22,6 +34,8 @@ class Backend(BaseVCS):
         super(Backend, self).__init__(*args, **kwargs)
         self.token = kwargs.get('token', None)
         self.repo_url = self._get_clone_url()
+        self.mirror_path = kwargs.get('mirror_path', None)
+        self._refs = None
 
     def _get_clone_url(self):
         if '://' in self.repo_url:
@@ -36,6 +50,26 @@ class Backend(BaseVCS):
                 #clone_url = 'git://%s' % (hacked_url)
         return self.repo_url
 
+    @property
+    def use_mirror(self):
+        return bool(GIT_MIRROR_CHECKOUTS and self.mirror_path)
+
+    @property
+    def depth(self):
+        # Shallow clones only make sense when fetching from the remote
+        if self.use_mirror:
+            return None
+        return GIT_CLONE_DEPTH
+
+    @property
+    def origin_url(self):
+        """
+        The remote of the checkout: the project mirror or the repository.
+        """
+        if self.use_mirror:
+            return os.path.abspath(self.mirror_path)
+        return self.repo_url
+
     def set_remote_url(self, url):
         return self.run('git', 'remote', 'set-url', 'origin', url)
 
@@ -48,7 +82,11 @@ class Backend(BaseVCS):
         return code == 0
 
     def fetch(self):
-        code, out, err = self.run('git', 'fetch', '--tags', '--prune')
+        args = ['git', 'fetch', '--tags', '--prune']
+        if self.depth:
+            args.append('--depth=%s' % self.depth)
+        code, out, err = self.run(*args)
+        self._refs = None
         if code != 0:
             raise ProjectImportError(
                 "Failed to get code from '%s' (git fetch): %s\n\nStderr:\n\n%s\n\n" % (
@@ -62,27 +100,109 @@ class Backend(BaseVCS):
 
         code, out, err = self.run('git', 'checkout',
                                   '--force', '--quiet', revision)
+        self._refs = None
         if code != 0:
             log.warning("Failed to checkout revision '%s': %s" % (
                 revision, code))
         return [code, out, err]
 
     def clone(self):
-        code, out, err = self.run('git', 'clone', '--recursive', '--quiet',
-                                  self.repo_url, '.')
+        args = ['git', 'clone', '--recursive', '--quiet']
+        if self.use_mirror:
+            # Borrow the objects of the mirror rather than copying them
+            args.append('--shared')
+        elif self.depth:
+            args.extend(['--depth=%s' % self.depth, '--no-single-branch'])
+        code, out, err = self.run(*(args + [self.origin_url, '.']))
+        self._refs = None
         if code != 0:
             raise ProjectImportError(
                 "Failed to get code from '%s' (git clone): %s" % (
                     self.repo_url, code)
             )
 
+    def run_mirror(self, *args):
+        return self.run('git', '--git-dir=%s' % os.path.abspath(self.mirror_path),
+                        *args)
+
+    def update_mirror(self):
+        """
+        Create or update the bare mirror of the repository.
+
+        The mirror fetches all the refs of the remote as they are, so the
+        branches of the checkouts cloned from it are those of the remote. Its
+        objects are never pruned, as the checkouts borrow them.
+        """
+        if not os.path.exists(os.path.dirname(self.mirror_path)):
+            os.makedirs(os.path.dirname(self.mirror_path))
+        # The mirror is shared by all the versions of the project
+        with PathLock(self.mirror_path + '.lock', self.name,
+                      timeout=GIT_MIRROR_LOCK_SECONDS, polling_interval=1):
+            if not os.path.exists(os.path.join(self.mirror_path, 'config')):
+                try:
+                    self.run_mirror_step('init', '--bare', '--quiet')
+                    self.run_mirror_step('config', 'gc.pruneExpire', 'never')
+                    self.run_mirror_step('remote', 'add', '--mirror=fetch',
+                                         'origin', self.repo_url)
+                except ProjectImportError:
+                    # Start over next time rather than from a partial mirror
+                    shutil.rmtree(self.mirror_path, ignore_errors=True)
+                    raise
+            else:
+                self.run_mirror_step('remote', 'set-url', 'origin',
+                                     self.repo_url)
+            self.run_mirror_step('fetch', '--tags', '--prune', 'origin')
+
+    def run_mirror_step(self, *args):
+        code, out, err = self.run_mirror(*args)
+        if code != 0:
+            raise ProjectImportError(
+                "Failed to get code from '%s' (git %s): %s\n\nStderr:\n\n%s\n\n" % (
+                    self.repo_url, args[0], code, err)
+            )
+        return code, out, err
+
+    def is_shallow(self):
+        return os.path.exists(os.path.join(self.working_dir, '.git', 'shallow'))
+
+    @property
+    def refs(self):
+        """
+        A list of ``(commit hash, ref name)`` of HEAD and all the refs.
+
+        They are listed by a single ``git show-ref --head``, memoized until
+        the checkout is fetched or changed.
+        """
+        if self._refs is None:
+            retcode, stdout, err = self.run('git', 'show-ref', '--head')
+            # error (or no refs found)
+            if retcode != 0:
+                return []
+            self._refs = self.parse_refs(stdout)
+        return self._refs
+
+    def parse_refs(self, data):
+        """
+        Parses output of show-ref --head, eg:
+
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 HEAD
+            3b32886c8d3cb815df3793b3937b2e91d0fb00f1 refs/remotes/origin/master
+            bd533a768ff661991a689d3758fcfe72f455435d refs/tags/2.0.1
+
+        Into a list of ``(commit hash, ref name)`` tuples.
+        """
+        refs = []
+        for line in data.splitlines():
+            row = line.split()
+            if len(row) == 2:
+                refs.append(tuple(row))
+        return refs
+
     @property
     def tags(self):
-        retcode, stdout, err = self.run('git', 'show-ref', '--tags')
-        # error (or no tags found)
-        if retcode != 0:
-            return []
-        return self.parse_tags(stdout)
+        tags = [(commit_hash, name) for commit_hash, name in self.refs
+                if name.startswith('refs/tags/')]
+        return self.parse_tags('\n'.join('%s %s' % tag for tag in tags))
 
     def parse_tags(self, data):
         """
@@ -113,11 +233,10 @@ class Backend(BaseVCS):
     @property
     def branches(self):
         # Only show remote branches
-        retcode, stdout, err = self.run('git', 'branch', '-r')
-        # error (or no tags found)
-        if retcode != 0:
-            return []
-        return self.parse_branches(stdout)
+        prefix = 'refs/remotes/'
+        branches = [name[len(prefix):] for commit_hash, name in self.refs
+                    if name.startswith(prefix)]
+        return self.parse_branches('\n'.join(branches))
 
     def parse_branches(self, data):
         """
@@ -150,15 +269,20 @@ class Backend(BaseVCS):
 
     @property
     def commit(self):
-        retcode, stdout, err = self.run('git', 'rev-parse', 'HEAD')
-        return stdout.strip()
+        for commit_hash, name in self.refs:
+            if name == 'HEAD':
+                return commit_hash
+        return ''
 
     def checkout(self, identifier=None):
         self.check_working_dir()
 
+        if self.use_mirror:
+            self.update_mirror()
+
         # Clone or update repository
         if self.repo_exists():
-            self.set_remote_url(self.repo_url)
+            self.set_remote_url(self.origin_url)
             self.fetch()
         else:
             self.make_clean_working_dir()
@@ -172,6 +296,11 @@ class Backend(BaseVCS):
 
         #Checkout the correct identifier for this branch.
         code, out, err = self.checkout_revision(identifier)
+        if code != 0 and self.is_shallow():
+            # Tags and commits can be older than the shallow history
+            self.run('git', 'fetch', '--unshallow', '--tags')
+            self._refs = None
+            code, out, err = self.checkout_revision(identifier)
         if code != 0:
             return code, out, err
 
@@ -197,8 +326,9 @@ class Backend(BaseVCS):
         return ref
 
     def ref_exists(self, ref):
-        code, out, err = self.run('git', 'show-ref', ref)
-        return code == 0
+        # Matches like ``git show-ref <ref>``, on whole trailing components
+        return any(name == ref or name.endswith('/' + ref)
+                   for commit_hash, name in self.refs)
 
     @property
     def env(self):
@@ -0,0 +1,6 @@
+from django.utils.module_loading import import_by_path
+from django.conf import settings
+
+# Locks
+RepoLock = import_by_path(getattr(settings, 'REPO_LOCK', 'vcs_support.utils.Lock'))
+RepoNonBlockingLock = import_by_path(getattr(settings, 'REPO_NONBLOCKING_LOCK', 'vcs_support.utils.NonBlockingLock'))
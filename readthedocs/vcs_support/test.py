@@ -1,5 +1,6 @@
 import os
 import shutil
+import time
 import unittest
 
 import mock
@@ -40,7 +41,7 @@ class TestNonBlockingLock(unittest.TestCase):
         with utils.NonBlockingLock(project=self.project_mock,
                                    version=self.version_mock) as f_lock:
             lock_path = f_lock.fpath
-        self.assertTrueok_(lock_path is not None and not os.path.exists(lock_path))
+        self.assertTrue(lock_path is not None and not os.path.exists(lock_path))
 
     def test_nonreentrant(self):
         with utils.NonBlockingLock(project=self.project_mock,
@@ -65,3 +66,108 @@ class TestNonBlockingLock(unittest.TestCase):
                 raise AssertionError('Should have thrown LockTimeout')
 
 
+
+    def test_lost_lock(self):
+        with utils.NonBlockingLock(project=self.project_mock,
+                                   version=self.version_mock) as f_lock:
+            f_lock.check()
+            with utils.NonBlockingLock(project=self.project_mock,
+                                       version=self.version_mock, max_lock_age=0):
+                self.assertRaises(utils.LockTimeout, f_lock.check)
+
+    def test_heartbeat(self):
+        # Held locks stay fresh however long the build takes
+        with utils.NonBlockingLock(project=self.project_mock,
+                                   version=self.version_mock,
+                                   max_lock_age=0.6) as f_lock:
+            time.sleep(1)
+            self.assertRaises(utils.LockTimeout, utils.NonBlockingLock(
+                project=self.project_mock, version=self.version_mock,
+                max_lock_age=0.6).__enter__)
+            f_lock.check()
+        self.assertFalse(os.path.exists(f_lock.fpath))
+
+    def test_lost_lock_not_released(self):
+        with utils.NonBlockingLock(project=self.project_mock,
+                                   version=self.version_mock) as f_lock:
+            new_lock = utils.NonBlockingLock(project=self.project_mock,
+                                             version=self.version_mock,
+                                             max_lock_age=0)
+            new_lock.__enter__()
+        # The old holder leaves the lock of the new one in place
+        self.assertTrue(os.path.exists(f_lock.fpath))
+        new_lock.check()
+        new_lock.__exit__(None, None, None)
+        self.assertFalse(os.path.exists(f_lock.fpath))
+
+
+class FakeRedisLocks(object):
+    """Runs the lock scripts on a dict."""
+
+    def __init__(self):
+        self.data = {}
+
+    def run(self, script, keys, args):
+        value = self.data.get(keys[0])
+        if script == utils.ACQUIRE_SCRIPT:
+            if value is not None:
+                return 0
+            token = self.data.get(keys[1], 0) + 1
+            self.data[keys[1]] = token
+            self.data[keys[0]] = str(token)
+            return token
+        if value != str(args[0]):
+            return 0
+        if script == utils.RELEASE_SCRIPT:
+            del self.data[keys[0]]
+        return 1
+
+    def get(self, key):
+        return self.data.get(key)
+
+
+class TestRedisLock(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = FakeRedisLocks()
+        patches = [
+            mock.patch.object(utils.RedisLock, '_run',
+                              lambda lock, *args: self.redis.run(*args)),
+            mock.patch.object(utils.RedisLock, '_client',
+                              lambda lock: self.redis),
+        ]
+        for patcher in patches:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.project_mock = mock.Mock()
+        self.project_mock.slug = 'test-project-slug'
+        self.version_mock = mock.Mock()
+        self.version_mock.slug = 'test-version-slug'
+
+    def test_nonreentrant(self):
+        with utils.RedisNonBlockingLock(project=self.project_mock,
+                                        version=self.version_mock) as lock:
+            lock.check()
+            with self.assertRaises(utils.LockTimeout):
+                with utils.RedisNonBlockingLock(project=self.project_mock,
+                                                version=self.version_mock,
+                                                max_lock_age=0):
+                    pass
+        self.assertEqual(self.redis.data.keys(), [lock.key + ':token'])
+
+    def test_fencing_token(self):
+        with utils.RedisLock(self.project_mock, self.version_mock) as first:
+            pass
+        with utils.RedisLock(self.project_mock, self.version_mock) as second:
+            self.assertTrue(second.token > first.token)
+            # The lock expired and another build server took it
+            self.redis.data[second.key] = str(second.token + 1)
+            self.assertRaises(utils.LockTimeout, second.check)
+        # Releasing a lost lock leaves the new holder's lock alone
+        self.assertEqual(self.redis.data[second.key], str(second.token + 1))
+
+    def test_timeout(self):
+        self.redis.data['repo_lock:v1:test-project-slug:test-version-slug'] = '1'
+        lock = utils.RedisLock(self.project_mock, self.version_mock,
+                               timeout=0.05, polling_interval=0.01)
+        self.assertRaises(utils.LockTimeout, lock.__enter__)
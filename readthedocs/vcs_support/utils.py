@@ -1,15 +1,106 @@
 import logging
 import os
+import threading
 import time
-import stat
+import uuid
+
+from django.conf import settings
+import redis
 
 log = logging.getLogger(__name__)
 
+REPO_LOCK_TTL = getattr(settings, 'REPO_LOCK_TTL', 60)
+
+# Takes the lock if it's free, with the next fencing token of the lock
+ACQUIRE_SCRIPT = """
+if redis.call('exists', KEYS[1]) == 1 then
+    return 0
+end
+local token = redis.call('incr', KEYS[2])
+redis.call('set', KEYS[1], token)
+redis.call('pexpire', KEYS[1], ARGV[1])
+return token
+"""
+RENEW_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('pexpire', KEYS[1], ARGV[2])
+end
+return 0
+"""
+RELEASE_SCRIPT = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
 class LockTimeout(Exception):
     pass
 
 
-class Lock(object):
+class FileLock(object):
+    """
+    Base of the file based locks
+
+    The lock file holds a token of the holder, ``check`` raises
+    ``LockTimeout`` once another holder took over the lock. Like the renewal
+    of a ``RedisLock``, a heartbeat thread touches the lock file while it's
+    held, so the age of the file only grows once the holder is gone.
+    """
+
+    token = None
+    _stopped = None
+
+    def _write_token(self):
+        self.token = uuid.uuid4().hex
+        with open(self.fpath, 'w') as lock_file:
+            lock_file.write(self.token)
+
+    def _read_token(self):
+        try:
+            with open(self.fpath) as lock_file:
+                return lock_file.read()
+        except IOError:
+            return None
+
+    def _start_heartbeat(self, max_age):
+        if not max_age:
+            return
+        self._stopped = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     args=(max_age / 3.0,),
+                                     name='lock-%s' % self.name)
+        heartbeat.daemon = True
+        heartbeat.start()
+
+    def _heartbeat(self, interval):
+        while not self._stopped.wait(interval):
+            if self._read_token() != self.token:
+                log.error("Lock (%s): Lock lost" % self.name)
+                return
+            try:
+                os.utime(self.fpath, None)
+            except OSError:
+                log.warning("Lock (%s): Failed to renew" % self.name,
+                            exc_info=True)
+
+    def _release(self):
+        if self._stopped is not None:
+            self._stopped.set()
+        # The lock may have been taken over by another holder, leave it
+        if self.token is None or self._read_token() != self.token:
+            log.warning("Lock (%s): Lost before release" % self.name)
+            return
+        log.info("Lock (%s): Releasing" % self.name)
+        os.remove(self.fpath)
+
+    def check(self):
+        if self.token is None or self._read_token() != self.token:
+            raise LockTimeout("Lock (%s): Lock lost" % self.name)
+
+
+class Lock(FileLock):
     """
     A simple file based lock with timeout
 
@@ -28,7 +119,7 @@ class Lock(object):
     def __enter__(self):
         start = time.time()
         while os.path.exists(self.fpath):
-            lock_age = time.time() - os.stat(self.fpath)[stat.ST_MTIME]
+            lock_age = time.time() - os.path.getmtime(self.fpath)
             if lock_age > self.timeout:
                 log.info("Lock (%s): Force unlock, old lockfile" %
                          self.name)
@@ -44,19 +135,32 @@ class Lock(object):
                 break
             log.info(("%s still locked after %.2f seconds; retry for %.2f"
                       " seconds") % (self.name, timesince, self.timeout))
-        open(self.fpath, 'w').close()
+        self._write_token()
+        self._start_heartbeat(self.timeout)
         log.info("Lock (%s): Lock aquired" % self.name)
+        return self
 
     def __exit__(self, exc, value, tb):
         try:
-            log.info("Lock (%s): Releasing" % self.name)
-            os.remove(self.fpath)
+            self._release()
         except:
             log.error("Lock (%s): Failed to release, ignoring..." % self.name,
                       exc_info=True)
 
 
-class NonBlockingLock(object):
+class PathLock(Lock):
+    """
+    A ``Lock`` on the file ``path``, for resources that aren't per version
+    """
+
+    def __init__(self, path, name, timeout=5, polling_interval=0.1):
+        self.name = name
+        self.fpath = path
+        self.timeout = timeout
+        self.polling_interval = polling_interval
+
+
+class NonBlockingLock(FileLock):
     """
     Instead of waiting for a lock, depending on the lock file age, either
     acquire it immediately or throw LockTimeout
@@ -75,7 +179,7 @@ class NonBlockingLock(object):
     def __enter__(self):
         path_exists = os.path.exists(self.fpath)
         if path_exists and self.max_lock_age is not None:
-            lock_age = time.time() - os.stat(self.fpath)[stat.ST_MTIME]
+            lock_age = time.time() - os.path.getmtime(self.fpath)
             if lock_age > self.max_lock_age:
                 log.info("Lock (%s): Force unlock, old lockfile" %
                          self.name)
@@ -84,14 +188,112 @@ class NonBlockingLock(object):
                 raise LockTimeout("Lock (%s): Lock still active" % self.name)
         elif path_exists:
             raise LockTimeout("Lock (%s): Lock still active" % self.name)
-        open(self.fpath, 'w').close()
+        self._write_token()
+        self._start_heartbeat(self.max_lock_age)
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         try:
-            log.info("Lock (%s): Releasing" % self.name)
-            os.remove(self.fpath)
+            self._release()
         except (IOError, OSError):
             log.error("Lock (%s): Failed to release, ignoring..." % self.name,
                       exc_info=True)
 
+
+class RedisLock(object):
+    """
+    A lock in Redis, shared by all build servers
+
+    The lock expires ``ttl`` seconds after it was last renewed. A heartbeat
+    thread renews it while it's held, so long builds keep it, and the lock of
+    a build server that died is released. Each time the lock is acquired it
+    gets a higher fencing ``token``, ``check`` raises ``LockTimeout`` once
+    the lock was lost.
+
+    On entering the context, it will try to aquire the lock until
+    ``timeout`` passes, then raise ``LockTimeout``.
+    """
+
+    def __init__(self, project, version, timeout=5, polling_interval=0.1,
+                 ttl=None):
+        self.name = project.slug
+        self.key = 'repo_lock:v1:%s:%s' % (project.slug, version.slug)
+        self.timeout = timeout
+        self.polling_interval = polling_interval
+        self.ttl = ttl or REPO_LOCK_TTL
+        self.token = None
+        self._stopped = threading.Event()
+
+    def __enter__(self):
+        start = time.time()
+        while not self.acquire():
+            if time.time() - start > self.timeout:
+                raise LockTimeout("Lock (%s): Lock still active" % self.name)
+            log.info("Lock (%s): Locked, waiting.." % self.name)
+            time.sleep(self.polling_interval)
+        return self
+
+    def __exit__(self, exc, value, tb):
+        self._stopped.set()
+        try:
+            log.info("Lock (%s): Releasing" % self.name)
+            self._run(RELEASE_SCRIPT, [self.key], [self.token])
+        except redis.RedisError:
+            log.error("Lock (%s): Failed to release, ignoring..." % self.name,
+                      exc_info=True)
+
+    def acquire(self):
+        token = self._run(ACQUIRE_SCRIPT, [self.key, self.key + ':token'],
+                          [int(self.ttl * 1000)])
+        if not token:
+            return False
+        self.token = token
+        log.info("Lock (%s): Lock aquired, token %s" % (self.name, token))
+        heartbeat = threading.Thread(target=self._heartbeat,
+                                     name='lock-%s' % self.name)
+        heartbeat.daemon = True
+        heartbeat.start()
+        return True
+
+    def check(self):
+        if self.token is None or self._client().get(self.key) != str(self.token):
+            raise LockTimeout("Lock (%s): Lock lost" % self.name)
+
+    def _heartbeat(self):
+        while not self._stopped.wait(self.ttl / 3.0):
+            try:
+                renewed = self._run(RENEW_SCRIPT, [self.key],
+                                    [self.token, int(self.ttl * 1000)])
+            except redis.RedisError:
+                log.warning("Lock (%s): Failed to renew" % self.name,
+                            exc_info=True)
+                continue
+            if not renewed:
+                log.error("Lock (%s): Lock lost" % self.name)
+                return
+
+    def _run(self, script, keys, args):
+        return self._client().register_script(script)(keys=keys, args=args)
+
+    def _client(self):
+        # Avoid circular import
+        from core.utils import redis_client
+        return redis_client()
+
+
+class RedisNonBlockingLock(RedisLock):
+    """
+    A ``RedisLock`` that throws ``LockTimeout`` instead of waiting
+
+    Locks that weren't renewed expire on their own, so ``max_lock_age`` is
+    only accepted for compatibility with ``NonBlockingLock``.
+    """
+
+    def __init__(self, project, version, max_lock_age=None, ttl=None):
+        super(RedisNonBlockingLock, self).__init__(project, version, timeout=0,
+                                                   ttl=ttl)
+
+    def __enter__(self):
+        if not self.acquire():
+            raise LockTimeout("Lock (%s): Lock still active" % self.name)
+        return self